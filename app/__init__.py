@@ -3,7 +3,10 @@ Flask application factory
 """
 from flask import Flask
 from app.config import config
-from app.extensions import db
+from app.extensions import db, cache
+from app.db_routing import node_router
+from app.metrics import metrics
+from app.tracing import tracer
 
 
 def create_app(config_name='development'):
@@ -13,8 +16,12 @@ def create_app(config_name='development'):
     # Load configuration
     app.config.from_object(config[config_name])
 
-    # Initialize extensions
+    # Initialize extensions (node routing sets the engine options db.init_app uses)
+    node_router.init_app(app)
     db.init_app(app)
+    cache.init_app(app)
+    metrics.init_app(app)
+    tracer.init_app(app)
 
     # Register blueprints
     from app.routes.main import main_bp
@@ -23,6 +30,7 @@ def create_app(config_name='development'):
     from app.routes.shows import shows_bp
     from app.routes.bookings import bookings_bp
     from app.routes.customers import customers_bp
+    from app.routes.admin import admin_bp
 
     app.register_blueprint(main_bp)
     app.register_blueprint(events_bp, url_prefix='/events')
@@ -30,5 +38,10 @@ def create_app(config_name='development'):
     app.register_blueprint(shows_bp, url_prefix='/shows')
     app.register_blueprint(bookings_bp, url_prefix='/bookings')
     app.register_blueprint(customers_bp, url_prefix='/customers')
+    app.register_blueprint(admin_bp)
+
+    # Start background workers
+    from app.services.lock_sweeper import lock_sweeper
+    lock_sweeper.init_app(app)
 
     return app
@@ -0,0 +1,292 @@
+"""
+Read-through cache for slow-changing catalog data (facets, featured lists)
+
+Backends:
+  memory - per-process TTL/LRU (default)
+  redis  - shared by all processes, needs the redis package and CACHE_REDIS_URL
+
+Other backends (e.g. a local stand-in for redis in development) can be added
+with Cache.register_backend(name, factory).
+
+Only one caller recomputes an expired key: the others wait on a per-key lock
+and read the value it stored.
+
+Invalidation is repeated CACHE_SETTLE_SECONDS later, so a value recomputed
+from a follower read that predates the change does not linger. The delayed
+repeats are queued for a single scheduler thread.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+import heapq
+import itertools
+import pickle
+import threading
+import time
+
+
+_MISSING = object()
+
+
+class MemoryBackend:
+    """Per-process TTL/LRU backend"""
+
+    # Entries are private to this process, so in-process locks can guard read-modify-write
+    shared = False
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._key_locks = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return _MISSING
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @contextmanager
+    def lock(self, key, timeout):
+        """Hold the recompute lock for a key; yields whether it was acquired"""
+        with self._lock:
+            key_lock, waiters = self._key_locks.get(key, (threading.Lock(), 0))
+            self._key_locks[key] = (key_lock, waiters + 1)
+
+        acquired = key_lock.acquire(timeout=timeout)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                key_lock.release()
+            with self._lock:
+                key_lock, waiters = self._key_locks[key]
+                if waiters == 1:
+                    del self._key_locks[key]
+                else:
+                    self._key_locks[key] = (key_lock, waiters - 1)
+
+
+class RedisBackend:
+    """Shared backend on redis; values are pickled"""
+
+    shared = True
+
+    def __init__(self, client, namespace='cinesync:'):
+        self.client = client
+        self.namespace = namespace
+
+    @classmethod
+    def from_url(cls, url, namespace='cinesync:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_BACKEND 'redis' requires the redis package")
+        return cls(redis.Redis.from_url(url), namespace)
+
+    def get(self, key):
+        data = self.client.get(self.namespace + key)
+        if data is None:
+            return _MISSING
+        return pickle.loads(data)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.namespace + key, pickle.dumps(value), px=int(ttl * 1000))
+
+    def delete_prefix(self, prefix):
+        keys = list(self.client.scan_iter(match=self.namespace + prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def clear(self):
+        self.delete_prefix('')
+
+    @contextmanager
+    def lock(self, key, timeout):
+        """Cross-process recompute lock (SET NX with expiry)"""
+        redis_lock = self.client.lock(
+            self.namespace + 'lock:' + key, timeout=timeout, blocking_timeout=timeout
+        )
+        acquired = redis_lock.acquire()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                try:
+                    redis_lock.release()
+                except Exception:
+                    # Lock expired while recomputing; another caller may own it now
+                    pass
+
+
+class DelayedInvalidations:
+    """
+    One daemon thread running delayed prefix invalidations in due order
+
+    Scheduling a prefix that is already queued only moves it later, so a
+    burst of invalidations of the same prefix costs one delayed delete.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._queue = []
+        self._due = {}
+        self._order = itertools.count()
+        self._thread = None
+
+    def schedule(self, delay, delete_prefix, prefix):
+        due = time.monotonic() + delay
+        with self._condition:
+            key = (delete_prefix, prefix)
+            self._due[key] = due
+            heapq.heappush(self._queue, (due, next(self._order), key))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='cache-invalidations', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue or self._queue[0][0] > time.monotonic():
+                    self._condition.wait(self._queue[0][0] - time.monotonic() if self._queue else None)
+                due, _, key = heapq.heappop(self._queue)
+                if self._due.get(key) != due:
+                    # Rescheduled for later; that entry runs instead
+                    continue
+                del self._due[key]
+                delete_prefix, prefix = key
+
+            try:
+                delete_prefix(prefix)
+            except Exception:
+                # The entry still expires with its TTL
+                pass
+
+
+class CacheStats:
+    """Hit/miss counters per key namespace (the part of the key before ':')"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def incr(self, key, field):
+        namespace = key.split(':', 1)[0]
+        with self._lock:
+            counts = self._counts.setdefault(namespace, {'hits': 0, 'misses': 0, 'loads': 0})
+            counts[field] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {namespace: dict(counts) for namespace, counts in self._counts.items()}
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+class Cache:
+    """
+    Read-through cache extension
+
+    Usage:
+        cache.get_or_set('events:types', load_event_types)
+        cache.invalidate('events:')
+    """
+
+    _backend_factories = {
+        'memory': lambda app: MemoryBackend(app.config.get('CACHE_MAX_ENTRIES', 1024)),
+        'redis': lambda app: RedisBackend.from_url(app.config['CACHE_REDIS_URL']),
+    }
+
+    def __init__(self, app=None):
+        self.backend = MemoryBackend()
+        self.default_ttl = 300
+        self.lock_timeout = 5.0
+        self.enabled = True
+        self.settle_seconds = 0
+        self.stats = CacheStats()
+        self._delayed = DelayedInvalidations()
+        if app is not None:
+            self.init_app(app)
+
+    @classmethod
+    def register_backend(cls, name, factory):
+        """Register a backend factory: factory(app) -> backend"""
+        cls._backend_factories[name] = factory
+
+    @property
+    def shared(self):
+        """Whether other processes see this cache's entries (unknown backends count as shared)"""
+        return getattr(self.backend, 'shared', True)
+
+    def init_app(self, app):
+        name = app.config.get('CACHE_BACKEND', 'memory')
+        if name not in self._backend_factories:
+            raise ValueError(f"Unknown CACHE_BACKEND {name!r}")
+
+        self.backend = self._backend_factories[name](app)
+        self.default_ttl = app.config.get('CACHE_DEFAULT_TTL', 300)
+        self.lock_timeout = app.config.get('CACHE_LOCK_TIMEOUT', 5.0)
+        self.enabled = app.config.get('CACHE_ENABLED', True)
+        self.settle_seconds = app.config.get('CACHE_SETTLE_SECONDS', 0)
+        app.extensions['cache'] = self
+
+    def get_or_set(self, key, loader, ttl=None):
+        """Get a cached value, calling loader() to compute and store it on a miss"""
+        if not self.enabled:
+            return loader()
+
+        value = self.backend.get(key)
+        if value is not _MISSING:
+            self.stats.incr(key, 'hits')
+            return value
+
+        self.stats.incr(key, 'misses')
+
+        with self.backend.lock(key, self.lock_timeout) as acquired:
+            if acquired:
+                # Another caller may have stored the value while we waited
+                value = self.backend.get(key)
+                if value is not _MISSING:
+                    return value
+
+            # Not acquired means the lock holder is too slow; compute anyway
+            value = loader()
+            self.stats.incr(key, 'loads')
+            self.backend.set(key, value, ttl or self.default_ttl)
+            return value
+
+    def invalidate(self, prefix):
+        """Drop every key starting with prefix, now and again after settle_seconds"""
+        self.backend.delete_prefix(prefix)
+
+        if self.settle_seconds:
+            self._delayed.schedule(self.settle_seconds, self.backend.delete_prefix, prefix)
+
+    def clear(self):
+        self.backend.clear()
@@ -2,6 +2,7 @@
 Application configuration
 """
 import os
+import tempfile
 from datetime import timedelta
 
 
@@ -16,6 +17,159 @@ class Config:
     SESSION_COOKIE_SAMESITE = 'Lax'
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
 
+    # Connection pools (one per node): bounds and timeouts in seconds, so a dead node fails fast
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 5))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))
+    DB_POOL_RECYCLE = 1800
+    DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', 3))
+
+    # Cluster nodes as whitespace-separated 'url|locality' entries, e.g.
+    # 'cockroachdb://n1:26257/cinesync|region=us-east1,zone=us-east1-b'; empty uses DATABASE_URL only.
+    # Transactions go to the healthy nodes sharing the most locality tiers with DATABASE_LOCALITY.
+    DATABASE_NODES = os.environ.get('DATABASE_NODES', '')
+    DATABASE_LOCALITY = os.environ.get('DATABASE_LOCALITY', '')
+    DB_HEALTH_CHECK_SECONDS = float(os.environ.get('DB_HEALTH_CHECK_SECONDS', 5))
+
+    # Booking engine: 'set_based' (single conditional UPDATE) or 'row_locking' (SELECT FOR UPDATE)
+    BOOKING_ENGINE_MODE = os.environ.get('BOOKING_ENGINE_MODE') or 'set_based'
+
+    # Per-show single-writer booking queues: each hot show's worker books up to
+    # BOOKING_BATCH_SIZE queued requests per transaction; at most BOOKING_MAX_WORKERS
+    # shows get a worker, bookings for the rest run in the request thread
+    BOOKING_DISPATCHER_ENABLED = os.environ.get('BOOKING_DISPATCHER_ENABLED', 'true').lower() == 'true'
+    BOOKING_BATCH_SIZE = int(os.environ.get('BOOKING_BATCH_SIZE', 16))
+    BOOKING_QUEUE_MAX_DEPTH = int(os.environ.get('BOOKING_QUEUE_MAX_DEPTH', 500))
+    BOOKING_QUEUE_WAIT_SECONDS = float(os.environ.get('BOOKING_QUEUE_WAIT_SECONDS', 10))
+    BOOKING_WORKER_IDLE_SECONDS = 30
+    BOOKING_MAX_WORKERS = int(os.environ.get('BOOKING_MAX_WORKERS', 32))
+
+    # Admission control for hot shows: per-show token bucket (admissions/second) in front of the
+    # booking flow, a bounded FIFO waiting room, and AIMD rate tuning on booking commit latency and retry ratio
+    ADMISSION_CONTROL_ENABLED = os.environ.get('ADMISSION_CONTROL_ENABLED', 'true').lower() == 'true'
+    ADMISSION_RATE = float(os.environ.get('ADMISSION_RATE', 20))
+    ADMISSION_BURST = int(os.environ.get('ADMISSION_BURST', 40))
+    ADMISSION_MIN_RATE = 1.0
+    ADMISSION_MAX_RATE = float(os.environ.get('ADMISSION_MAX_RATE', 200))
+    ADMISSION_INCREASE_STEP = 2.0
+    ADMISSION_DECREASE_FACTOR = 0.7
+    ADMISSION_ADJUST_SECONDS = 5
+    ADMISSION_TARGET_LATENCY_SECONDS = float(os.environ.get('ADMISSION_TARGET_LATENCY_SECONDS', 0.5))
+    ADMISSION_MAX_RETRY_RATIO = 0.2
+    ADMISSION_WAITING_ROOM_SIZE = int(os.environ.get('ADMISSION_WAITING_ROOM_SIZE', 2000))
+    ADMISSION_POLL_SECONDS = 5
+    ADMISSION_TICKET_IDLE_SECONDS = 30
+    ADMISSION_PASS_SECONDS = 900
+    ADMISSION_STATE_IDLE_SECONDS = 600
+
+    # How long seats stay held between /bookings/confirm and /bookings/create
+    SEAT_HOLD_TTL_SECONDS = int(os.environ.get('SEAT_HOLD_TTL_SECONDS', 600))
+
+    # Catalog routes read from the nearest replica (AS OF SYSTEM TIME); staleness like '10s',
+    # empty for follower_read_timestamp()
+    FOLLOWER_READS_ENABLED = os.environ.get('FOLLOWER_READS_ENABLED', 'true').lower() == 'true'
+    FOLLOWER_READ_STALENESS = os.environ.get('FOLLOWER_READ_STALENESS', '')
+
+    # Transaction retries for CockroachDB serialization failures (SQLSTATE 40001)
+    TXN_MAX_RETRIES = int(os.environ.get('TXN_MAX_RETRIES', 5))
+    TXN_RETRY_BUDGET_SECONDS = float(os.environ.get('TXN_RETRY_BUDGET_SECONDS', 2.0))
+    TXN_RETRY_BACKOFF_BASE = 0.02
+    TXN_RETRY_BACKOFF_MAX = 0.5
+
+    # Shared-memory seat state bitmaps (one mmap file per show, shared by all workers on a host)
+    SEAT_STATE_DIR = os.environ.get('SEAT_STATE_DIR') or os.path.join(tempfile.gettempdir(), 'cinesync-seat-state')
+    SEAT_STATE_VERIFY_SECONDS = float(os.environ.get('SEAT_STATE_VERIFY_SECONDS', 5.0))
+
+    # Live seat maps (Server-Sent Events): per-show event history for resuming clients and stream limits.
+    # A stream holds a request thread for up to SEAT_STREAM_MAX_SECONDS, so on sync workers keep the
+    # per-process client cap well below the process's threads (raise it only on gevent/async workers);
+    # pages refused a stream poll /seats/state every SEAT_STATE_POLL_SECONDS instead
+    SEAT_EVENTS_BUFFER_SIZE = 1024
+    SEAT_STREAM_MAX_CLIENTS = int(os.environ.get('SEAT_STREAM_MAX_CLIENTS', 4))
+    SEAT_STATE_POLL_SECONDS = 5
+    SEAT_STREAM_MAX_SECONDS = 300
+    SEAT_STREAM_POLL_SECONDS = 2
+    SEAT_STREAM_KEEPALIVE_SECONDS = 15
+
+    # Number of auditorium seat layouts kept in the per-process layout cache
+    LAYOUT_CACHE_SIZE = 512
+
+    # Age after which a cached layout is reloaded, so seat changes made by other processes show up
+    LAYOUT_CACHE_TTL_SECONDS = float(os.environ.get('LAYOUT_CACHE_TTL_SECONDS', 300))
+
+    # Bulk schedule imports: shows per INSERT ... SELECT statement and parallel chunks
+    SCHEDULE_IMPORT_CHUNK_SHOWS = int(os.environ.get('SCHEDULE_IMPORT_CHUNK_SHOWS', 25))
+    SCHEDULE_IMPORT_WORKERS = int(os.environ.get('SCHEDULE_IMPORT_WORKERS', 4))
+
+    # Generated IDs: 0 keeps them strictly time-ordered, N > 0 spreads inserts over N key ranges
+    ID_SHARDS = int(os.environ.get('ID_SHARDS', 0))
+
+    # Sweeper releasing expired seat holds in bounded UPDATE ... LIMIT batches; it runs in
+    # sweep_locks.py, and LOCK_SWEEPER_ENABLED also starts it inside the app process
+    LOCK_SWEEPER_ENABLED = os.environ.get('LOCK_SWEEPER_ENABLED', 'false').lower() == 'true'
+    LOCK_SWEEP_INTERVAL_SECONDS = float(os.environ.get('LOCK_SWEEP_INTERVAL_SECONDS', 30))
+    LOCK_SWEEP_BATCH_SIZE = int(os.environ.get('LOCK_SWEEP_BATCH_SIZE', 500))
+    LOCK_SWEEP_MAX_BATCHES = int(os.environ.get('LOCK_SWEEP_MAX_BATCHES', 100))
+
+    # Keyset pagination: page size per route endpoint, DEFAULT_PAGE_SIZE for the rest
+    DEFAULT_PAGE_SIZE = 24
+    PAGE_SIZES = {
+        'events.list_events': 24,
+        'theaters.list_theaters': 30,
+        'theaters.theater_detail': 50,
+        'shows.select_show': 50,
+        'customers.profile': 20,
+    }
+
+    # Read-through cache for catalog facets and featured lists: 'memory' (per process) or 'redis' (shared)
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND') or 'memory'
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL') or 'redis://localhost:6379/0'
+    CACHE_DEFAULT_TTL = int(os.environ.get('CACHE_DEFAULT_TTL', 300))
+    CACHE_MAX_ENTRIES = 1024
+    # Repeat invalidations after this delay, covering follower-read staleness
+    CACHE_SETTLE_SECONDS = float(os.environ.get('CACHE_SETTLE_SECONDS', 10))
+
+    # Background rebuild interval of the in-memory search index (picks up changes made by other processes)
+    SEARCH_INDEX_REBUILD_SECONDS = int(os.environ.get('SEARCH_INDEX_REBUILD_SECONDS', 300))
+
+    # Geo grid index over theater coordinates: cell size and full rebuild interval
+    GEO_CELL_DEGREES = 0.25
+    GEO_INDEX_REBUILD_SECONDS = int(os.environ.get('GEO_INDEX_REBUILD_SECONDS', 600))
+
+    # Radius offered by the showtimes page's "nearby theaters" filter
+    SHOWTIMES_NEARBY_KM = float(os.environ.get('SHOWTIMES_NEARBY_KM', 25))
+
+    # Per-event show calendars (date -> show count, min price), cached and updated as shows change
+    CALENDAR_MAX_DAYS = 90
+    CALENDAR_TTL_SECONDS = int(os.environ.get('CALENDAR_TTL_SECONDS', 3600))
+
+    # Request/SQL metrics at /metrics (Prometheus); a request running one statement this many
+    # times is counted (and logged) as an N+1 query pattern
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_N_PLUS_ONE_THRESHOLD = int(os.environ.get('METRICS_N_PLUS_ONE_THRESHOLD', 5))
+
+    # Bearer token protecting the admin endpoints (/metrics, /admin/contention); without it only
+    # loopback clients get in, and ADMIN_ENDPOINTS_OPEN disables the check altogether
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+    ADMIN_ENDPOINTS_OPEN = os.environ.get('ADMIN_ENDPOINTS_OPEN', 'false').lower() == 'true'
+
+    # Request tracing (view -> service -> SQL spans) for a sample of requests, exported as
+    # OTLP/JSON to a file (one trace per line) or to an OTLP/HTTP collector
+    TRACING_ENABLED = os.environ.get('TRACING_ENABLED', 'false').lower() == 'true'
+    TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 0.05))
+    TRACE_EXPORTER = os.environ.get('TRACE_EXPORTER', 'file')
+    TRACE_FILE = os.environ.get('TRACE_FILE') or os.path.join(tempfile.gettempdir(), 'cinesync-traces.jsonl')
+    TRACE_OTLP_ENDPOINT = os.environ.get('TRACE_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+    TRACE_SERVICE_NAME = 'cinesync'
+
+    # Booking contention telemetry at /admin/contention: shows kept in memory (the one with the
+    # least recent contention is evicted), the half-life of that recency score, shows and blocks
+    # reported, and seats per block (by seat map ordinal)
+    CONTENTION_MAX_SHOWS = int(os.environ.get('CONTENTION_MAX_SHOWS', 256))
+    CONTENTION_HALF_LIFE_SECONDS = float(os.environ.get('CONTENTION_HALF_LIFE_SECONDS', 3600))
+    CONTENTION_TOP_K = int(os.environ.get('CONTENTION_TOP_K', 10))
+    CONTENTION_BLOCK_SIZE = int(os.environ.get('CONTENTION_BLOCK_SIZE', 16))
+
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -0,0 +1,336 @@
+"""
+Database routing - locality-aware connection routing over CockroachDB nodes
+
+DATABASE_NODES lists the cluster's gateway nodes with their locality tags
+and DATABASE_LOCALITY is this process's own locality. Every node gets its
+own bounded connection pool. A session pins the nearest healthy node when
+its transaction begins and releases it when the transaction ends, so once a
+node is marked down the next transaction goes elsewhere; run_in_transaction()
+and run_on_connection() retry a transaction whose connection dropped, which
+moves it to another node.
+
+A background thread probes each node with a short connect timeout. Nodes
+that fail the probe or drop a connection are marked down and their pools
+disposed until a probe succeeds again.
+
+Without DATABASE_NODES everything runs on SQLALCHEMY_DATABASE_URI as before,
+with the same pool bounds and timeouts.
+"""
+from app.tracing import tracer
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool, QueuePool
+import random
+import threading
+import time
+
+
+class PoolWaitStats:
+    """Thread-safe pool checkout counters: checkouts, wait time and timeouts"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def record(self, seconds, timed_out=False):
+        with self._lock:
+            self._checkouts += 1
+            self._wait_total += seconds
+            self._wait_max = max(self._wait_max, seconds)
+            if timed_out:
+                self._timeouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checkouts': self._checkouts,
+                'wait_seconds_total': self._wait_total,
+                'wait_seconds_max': self._wait_max,
+                'timeouts': self._timeouts
+            }
+
+    def reset(self):
+        with self._lock:
+            self._checkouts = 0
+            self._wait_total = 0.0
+            self._wait_max = 0.0
+            self._timeouts = 0
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits for a connection"""
+
+    def __init__(self, *args, wait_stats=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = wait_stats or PoolWaitStats()
+
+    def recreate(self):
+        # engine.dispose() swaps in a recreated pool; keep counting into the same stats
+        pool = super().recreate()
+        pool.wait_stats = self.wait_stats
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        with tracer.span('db.pool.checkout'):
+            try:
+                connection = super()._do_get()
+            except PoolTimeoutError:
+                self.wait_stats.record(time.perf_counter() - started, timed_out=True)
+                raise
+        self.wait_stats.record(time.perf_counter() - started)
+        return connection
+
+
+def engine_options(config, url):
+    """Engine options bounding the pool and every wait on a connection"""
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': config.get('DB_POOL_SIZE', 10),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 5),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 5),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': True
+    }
+    if make_url(url).get_backend_name() != 'sqlite':
+        options['connect_args'] = {'connect_timeout': config.get('DB_CONNECT_TIMEOUT', 3)}
+    return options
+
+
+def parse_locality(locality):
+    """Split 'region=us-east1,zone=us-east1-b' into [('region', 'us-east1'), ('zone', 'us-east1-b')]"""
+    tiers = []
+    for tier in (locality or '').split(','):
+        if not tier.strip():
+            continue
+        key, sep, value = tier.partition('=')
+        if not sep:
+            raise ValueError(f"Invalid locality tier {tier!r}")
+        tiers.append((key.strip(), value.strip()))
+    return tiers
+
+
+def parse_nodes(spec):
+    """
+    Parse DATABASE_NODES into [(url, locality)]
+
+    Entries are separated by whitespace; each is a URL optionally followed by
+    '|' and its locality, e.g. 'cockroachdb://n1:26257/cinesync|region=us-east1,zone=us-east1-b'
+    """
+    nodes = []
+    for entry in (spec or '').split():
+        url, _, locality = entry.partition('|')
+        parse_locality(locality)
+        nodes.append((url, locality))
+    return nodes
+
+
+def locality_score(tiers, local_tiers):
+    """Number of leading locality tiers shared with this process; higher is closer"""
+    score = 0
+    for tier, local_tier in zip(tiers, local_tiers):
+        if tier != local_tier:
+            break
+        score += 1
+    return score
+
+
+def is_disconnect_error(exc):
+    """Check whether a database error means the connection (or its node) went away"""
+    return bool(getattr(exc, 'connection_invalidated', False))
+
+
+class Node:
+    """One cluster node: its pooled engine, a pool-less probe engine and health state"""
+
+    def __init__(self, url, locality, engine, probe_engine):
+        self.url = url
+        self.locality = locality
+        self.tiers = parse_locality(locality)
+        self.engine = engine
+        self.probe_engine = probe_engine
+        self.healthy = True
+        self.down_since = None
+
+    @property
+    def name(self):
+        return make_url(self.url).render_as_string(hide_password=True)
+
+    def probe(self):
+        """Whether the node accepts a connection and answers SELECT 1"""
+        try:
+            with self.probe_engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+            return True
+        except SQLAlchemyError:
+            return False
+
+
+class NodeRouter:
+    """Picks the nearest healthy node for each transaction and health-checks the nodes"""
+
+    def __init__(self):
+        self.nodes = []
+        self.local_tiers = []
+        self._thread = None
+        self._stop = threading.Event()
+        self._logger = None
+
+    def init_app(self, app):
+        """
+        Configure the default engine's pool options and the cluster nodes
+
+        Must run before db.init_app(app), which builds the default engine.
+        """
+        config = app.config
+        nodes = parse_nodes(config.get('DATABASE_NODES'))
+        if nodes and not config.get('SQLALCHEMY_DATABASE_URI'):
+            config['SQLALCHEMY_DATABASE_URI'] = nodes[0][0]
+
+        url = config.get('SQLALCHEMY_DATABASE_URI')
+        if url:
+            options = engine_options(config, url)
+            options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+            config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+        self._logger = app.logger
+        self.local_tiers = parse_locality(config.get('DATABASE_LOCALITY'))
+        self.nodes = [self._create_node(config, *node) for node in nodes]
+
+        if self.nodes and self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, args=(config.get('DB_HEALTH_CHECK_SECONDS', 5),),
+                name='db-health-check', daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def choose(self):
+        """
+        Get the node for a new transaction
+
+        The healthy nodes sharing the most locality tiers with this process
+        win; among those, the one with the fewest checked-out connections.
+        With every node down, the nearest node is tried anyway and fails
+        within DB_CONNECT_TIMEOUT.
+        """
+        candidates = [node for node in self.nodes if node.healthy] or self.nodes
+        best = max(locality_score(node.tiers, self.local_tiers) for node in candidates)
+        nearest = [node for node in candidates if locality_score(node.tiers, self.local_tiers) == best]
+
+        least_busy = min(node.engine.pool.checkedout() for node in nearest)
+        return random.choice([node for node in nearest if node.engine.pool.checkedout() == least_busy])
+
+    def engine(self):
+        """Engine for a connection outside the ORM session (needs an app context)"""
+        if not self.nodes:
+            return current_app.extensions['sqlalchemy'].engine
+        return self.choose().engine
+
+    def mark_down(self, node, reason):
+        if node.healthy:
+            node.healthy = False
+            node.down_since = time.monotonic()
+            self._log('warning', f"Database node {node.name} marked down: {reason}")
+
+    def mark_up(self, node):
+        if not node.healthy:
+            node.healthy = True
+            node.down_since = None
+            self._log('info', f"Database node {node.name} is back up")
+
+    def check(self):
+        """Probe every node once, evicting the pooled connections of nodes that are down"""
+        for node in self.nodes:
+            if node.probe():
+                self.mark_up(node)
+            else:
+                self.mark_down(node, 'health check failed')
+                node.engine.dispose()
+
+    def stats(self):
+        """Per-node health and pool checkout stats (needs an app context without DATABASE_NODES)"""
+        if self.nodes:
+            entries = [(node.name, node.locality, node.healthy, node.engine) for node in self.nodes]
+        else:
+            engine = current_app.extensions['sqlalchemy'].engine
+            entries = [(make_url(engine.url).render_as_string(hide_password=True), '', True, engine)]
+
+        report = []
+        for name, locality, healthy, engine in entries:
+            pool = engine.pool
+            entry = {
+                'node': name,
+                'locality': locality,
+                'healthy': healthy,
+                'checked_out': pool.checkedout() if isinstance(pool, QueuePool) else 0
+            }
+            wait_stats = getattr(pool, 'wait_stats', None)
+            if wait_stats is not None:
+                entry.update(wait_stats.snapshot())
+            report.append(entry)
+        return report
+
+    def _create_node(self, config, url, locality):
+        options = engine_options(config, url)
+        engine = create_engine(url, echo=config.get('SQLALCHEMY_ECHO', False), **options)
+
+        # Probes open a fresh connection each time, so an exhausted pool cannot fail them
+        probe_engine = create_engine(url, poolclass=NullPool, connect_args=options.get('connect_args', {}))
+        node = Node(url, locality, engine, probe_engine)
+
+        @event.listens_for(engine, 'handle_error')
+        def _mark_node_down(context):
+            if getattr(context, 'is_pre_ping', False):
+                # The pool reconnects after a failed ping; a dead node fails that reconnect
+                return
+            if context.is_disconnect or context.connection is None:
+                self.mark_down(node, context.original_exception)
+
+        return node
+
+    def _run(self, interval):
+        while True:
+            try:
+                self.check()
+            except Exception:
+                self._log('exception', 'Database health check failed')
+            if self._stop.wait(interval):
+                return
+
+    def _log(self, level, message):
+        if self._logger is not None:
+            getattr(self._logger, level)(message)
+
+
+node_router = NodeRouter()
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that runs each transaction on the node picked by node_router"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or not node_router.nodes:
+            return engine
+        if engine is not self._db.engines.get(None):
+            # Models with their own bind key keep their engine
+            return engine
+
+        node = self.info.get('db_node')
+        if node is None:
+            node = node_router.choose()
+            self.info['db_node'] = node
+        return node.engine
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _release_node(session, transaction):
+    """Let the session's next transaction pick a node again"""
+    if transaction.parent is None:
+        session.info.pop('db_node', None)
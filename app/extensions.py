@@ -1,6 +1,91 @@
 """
 Flask extensions
 """
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, text
+from app.cache import Cache
+from app.db_routing import RoutingSession
+import functools
+import re
 
-db = SQLAlchemy()
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+cache = Cache()
+
+
+# Exact staleness like '10s' or '500ms'; empty means follower_read_timestamp()
+STALENESS_PATTERN = re.compile(r'^\d+(\.\d+)?(ms|s|m)$')
+
+
+def follower_read(view):
+    """
+    Route decorator: run the view's queries as CockroachDB follower reads
+
+    Each transaction the view's session begins reads AS OF SYSTEM TIME
+    follower_read_timestamp() (or FOLLOWER_READ_STALENESS ago), so the
+    nearest replica can serve it instead of the leaseholder. The data may
+    be a few seconds stale and the transactions are read-only, so only use
+    it on catalog pages; booking and seat-state paths must not be decorated.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        session = db.session()
+        session.info['follower_read'] = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            session.info.pop('follower_read', None)
+            # End the historical transaction so later work in this request reads current data
+            session.close()
+    return wrapper
+
+
+def follower_read_clause():
+    """AS OF SYSTEM TIME expression for the configured staleness"""
+    staleness = current_app.config.get('FOLLOWER_READ_STALENESS') or ''
+    if not staleness:
+        return 'follower_read_timestamp()'
+    if not STALENESS_PATTERN.match(staleness):
+        raise ValueError(f"Invalid FOLLOWER_READ_STALENESS {staleness!r}")
+    return f"'-{staleness}'"
+
+
+def after_commit(session, callback, *args):
+    """
+    Run callback(*args) once the session's transaction commits
+
+    Use it from mapper events instead of acting at flush time: a rolled back
+    transaction drops its callbacks, and a callback registered several times
+    with the same arguments runs once.
+    """
+    callbacks = session.info.setdefault('after_commit', [])
+    if (callback, args) not in callbacks:
+        callbacks.append((callback, args))
+
+
+@event.listens_for(db.session, 'after_commit')
+def _run_after_commit(session):
+    for callback, args in session.info.pop('after_commit', None) or ():
+        try:
+            callback(*args)
+        except Exception:
+            current_app.logger.exception("After-commit callback %s failed", callback.__qualname__)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_after_commit(session):
+    session.info.pop('after_commit', None)
+
+
+@event.listens_for(db.session, 'after_begin')
+def _begin_follower_read(session, transaction, connection):
+    """Turn a follower-read session's new transaction into a historical read"""
+    if not session.info.get('follower_read'):
+        return
+    if not current_app.config.get('FOLLOWER_READS_ENABLED', True):
+        return
+    if connection.dialect.name != 'cockroachdb':
+        return
+
+    connection.execute(text(f'SET TRANSACTION AS OF SYSTEM TIME {follower_read_clause()}'))
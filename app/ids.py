@@ -0,0 +1,143 @@
+"""
+ID generation - compact, time-ordered, collision-resistant IDs
+
+IDs look like BKG-01JA3K5Z8W9QX4M2N7R6T0V5CD: a prefix followed by a ULID-style
+body of a 48-bit millisecond timestamp and 80 random bits in Crockford base32,
+so they sort by creation time.
+
+Strictly time-ordered keys send every insert to the same CockroachDB range.
+With ID_SHARDS > 0 the body starts with a shard character instead, spreading
+inserts over that many key ranges while each shard stays time-ordered.
+"""
+from datetime import datetime, timezone
+from flask import current_app, has_app_context
+import os
+import threading
+import time
+
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+_DECODE = {char: value for value, char in enumerate(ALPHABET)}
+
+TIME_CHARS = 10
+RANDOM_CHARS = 16
+RANDOM_BITS = 80
+MAX_SHARDS = len(ALPHABET)
+
+
+class IdGenerator:
+    """
+    Thread-safe ULID-style ID generator
+
+    IDs minted in the same millisecond by one process increment the random
+    part instead of drawing new bits, so they stay strictly ordered.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._last_random = 0
+
+    def _reserve(self, count):
+        """Reserve count consecutive (timestamp, random) values"""
+        with self._lock:
+            now_ms = time.time_ns() // 1_000_000
+            if now_ms > self._last_ms:
+                # Top bit clear leaves room to increment within the millisecond
+                start = int.from_bytes(os.urandom(RANDOM_BITS // 8), 'big') >> 1
+                self._last_ms = now_ms
+            else:
+                start = self._last_random + 1
+                if start + count >= 1 << RANDOM_BITS:
+                    self._last_ms += 1
+                    start = int.from_bytes(os.urandom(RANDOM_BITS // 8), 'big') >> 1
+
+            self._last_random = start + count - 1
+            return self._last_ms, start
+
+    def new_ids(self, prefix, count, shards=0):
+        """Mint count IDs in one call (consecutive in time order)"""
+        if count <= 0:
+            return []
+
+        timestamp_ms, start = self._reserve(count)
+        time_part = _encode(timestamp_ms, TIME_CHARS)
+
+        ids = []
+        for offset in range(count):
+            random_value = start + offset
+            shard = ALPHABET[random_value % shards] if shards else ''
+            ids.append(f"{prefix}-{shard}{time_part}{_encode(random_value, RANDOM_CHARS)}")
+
+        return ids
+
+    def new_id(self, prefix, shards=0):
+        return self.new_ids(prefix, 1, shards)[0]
+
+
+def _encode(value, length):
+    """Encode an integer as fixed-width Crockford base32"""
+    chars = []
+    for _ in range(length):
+        value, remainder = divmod(value, 32)
+        chars.append(ALPHABET[remainder])
+    return ''.join(reversed(chars))
+
+
+def _decode(text):
+    value = 0
+    for char in text:
+        value = value * 32 + _DECODE[char]
+    return value
+
+
+def _configured_shards():
+    if not has_app_context():
+        return 0
+    return min(current_app.config.get('ID_SHARDS', 0), MAX_SHARDS)
+
+
+_generator = IdGenerator()
+
+
+def new_id(prefix):
+    """Generate a new ID, e.g. new_id('BKG')"""
+    return _generator.new_id(prefix, _configured_shards())
+
+
+def new_ids(prefix, count):
+    """Generate count new IDs at once (for bulk operations)"""
+    return _generator.new_ids(prefix, count, _configured_shards())
+
+
+def id_timestamp(id_value):
+    """
+    Get the creation time (UTC) encoded in an ID
+
+    Suffixes after the generated body are ignored, so derived IDs such as
+    show_seats rows ('SS-<body>-<seat number>') give their parent's time.
+
+    Raises:
+        ValueError: If the ID has no generated body after its prefix
+    """
+    parts = id_value.split('-')
+    body = parts[1] if len(parts) > 1 else ''
+    # The body may start with a shard character
+    if len(body) - (TIME_CHARS + RANDOM_CHARS) not in (0, 1) or not set(body) <= _DECODE.keys():
+        raise ValueError(f"Not a generated ID: {id_value}")
+
+    time_part = body[-(TIME_CHARS + RANDOM_CHARS):-RANDOM_CHARS]
+    return datetime.fromtimestamp(_decode(time_part) / 1000, tz=timezone.utc)
+
+
+def id_range(prefix, start, end, shard=None):
+    """
+    Get the (low, high) ID bounds for rows created in [start, end)
+    Use one range per shard when ID_SHARDS > 0
+    """
+    shard_char = '' if shard is None else ALPHABET[shard]
+    low_ms = int(start.timestamp() * 1000)
+    high_ms = int(end.timestamp() * 1000)
+    low = f"{prefix}-{shard_char}{_encode(low_ms, TIME_CHARS)}{'0' * RANDOM_CHARS}"
+    high = f"{prefix}-{shard_char}{_encode(high_ms, TIME_CHARS)}{'0' * RANDOM_CHARS}"
+    return low, high
@@ -0,0 +1,344 @@
+"""
+Request and SQL metrics in Prometheus text format
+
+Flask request hooks time every request; SQLAlchemy engine events count and
+time its queries. Per endpoint this records:
+  - request latency histogram and request count by status
+  - queries per request histogram and total database time
+  - requests that ran one statement METRICS_N_PLUS_ONE_THRESHOLD or more
+    times (N+1 query patterns), logged once per endpoint and statement
+
+Collectors add point-in-time values at scrape time: connection pool
+checkout wait and health per database node, cache hits and misses,
+transaction commits and retries. Recording is a few counter updates per
+query and one locked merge per request, cheap enough to leave on.
+"""
+from app.db_routing import node_router
+from app.services.transaction_runner import stats as transaction_stats
+from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from bisect import bisect_left
+from collections import namedtuple
+from contextvars import ContextVar
+import threading
+import time
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+MetricFamily = namedtuple('MetricFamily', ['name', 'type', 'help', 'samples'])
+
+
+class Histogram:
+    """Prometheus-style histogram with fixed upper bounds"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            yield f'{name}_bucket', dict(labels, le=_format_value(bound)), cumulative
+        yield f'{name}_sum', labels, self.sum
+        yield f'{name}_count', labels, self.count
+
+
+class RequestStats:
+    """SQL activity of the request in progress"""
+
+    __slots__ = ('started', 'queries', 'db_seconds', 'statements', 'status')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements = {}
+        self.status = 500
+
+
+class EndpointMetrics:
+    __slots__ = ('duration', 'queries', 'db_seconds', 'statuses', 'n_plus_one')
+
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.db_seconds = 0.0
+        self.statuses = {}
+        self.n_plus_one = 0
+
+
+_current_request = ContextVar('current_request_stats', default=None)
+
+
+class Metrics:
+    """
+    Metrics extension
+
+    Usage:
+        metrics.init_app(app)
+
+        @metrics.collector
+        def collect():
+            return [MetricFamily('cinesync_things', 'gauge', 'Things', [({}, 3)])]
+    """
+
+    MAX_REPORTED_STATEMENTS = 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._queries = 0
+        self._db_seconds = 0.0
+        self._reported = set()
+        self._collectors = []
+        self._engine_hooks = False
+        self.n_plus_one_threshold = 5
+
+    def init_app(self, app):
+        """Install the request hooks and (once per process) the engine hooks if METRICS_ENABLED"""
+        if not app.config.get('METRICS_ENABLED', True):
+            return
+
+        self.n_plus_one_threshold = app.config.get('METRICS_N_PLUS_ONE_THRESHOLD', 5)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.extensions['metrics'] = self
+
+        if not self._engine_hooks:
+            # Listening on Engine covers the default engine and every node engine
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._engine_hooks = True
+
+    def collector(self, func):
+        """Register a function returning MetricFamily values to add at scrape time"""
+        self._collectors.append(func)
+        return func
+
+    def render(self):
+        """All metrics in Prometheus text exposition format"""
+        with self._lock:
+            families = self._request_families()
+
+        for collect in self._collectors:
+            families.extend(collect())
+
+        lines = []
+        for family in families:
+            lines.append(f'# HELP {family.name} {family.help}')
+            lines.append(f'# TYPE {family.name} {family.type}')
+            for sample in family.samples:
+                # Histograms give (sample name, labels, value), everything else (labels, value)
+                name, labels, value = sample if len(sample) == 3 else (family.name, *sample)
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+            self._queries = 0
+            self._db_seconds = 0.0
+            self._reported = set()
+
+    def _request_families(self):
+        endpoints = sorted(self._endpoints.items())
+
+        def histogram_samples(attribute, name):
+            return [
+                sample
+                for endpoint, stats in endpoints
+                for sample in getattr(stats, attribute).samples(name, {'endpoint': endpoint})
+            ]
+
+        return [
+            MetricFamily(
+                'cinesync_http_requests_total', 'counter', 'Requests by endpoint and status',
+                [
+                    ({'endpoint': endpoint, 'status': str(status)}, count)
+                    for endpoint, stats in endpoints
+                    for status, count in sorted(stats.statuses.items())
+                ]
+            ),
+            MetricFamily(
+                'cinesync_http_request_duration_seconds', 'histogram', 'Request latency by endpoint',
+                histogram_samples('duration', 'cinesync_http_request_duration_seconds')
+            ),
+            MetricFamily(
+                'cinesync_http_request_queries', 'histogram', 'SQL statements per request by endpoint',
+                histogram_samples('queries', 'cinesync_http_request_queries')
+            ),
+            MetricFamily(
+                'cinesync_http_request_db_seconds_total', 'counter', 'Time spent in SQL statements by endpoint',
+                [({'endpoint': endpoint}, stats.db_seconds) for endpoint, stats in endpoints]
+            ),
+            MetricFamily(
+                'cinesync_http_requests_n_plus_one_total', 'counter',
+                'Requests that repeated one SQL statement at least the N+1 threshold times',
+                [({'endpoint': endpoint}, stats.n_plus_one) for endpoint, stats in endpoints]
+            ),
+            MetricFamily(
+                'cinesync_db_queries_total', 'counter', 'SQL statements executed, including background work',
+                [({}, self._queries)]
+            ),
+            MetricFamily(
+                'cinesync_db_query_seconds_total', 'counter', 'Time spent in SQL statements, including background work',
+                [({}, self._db_seconds)]
+            ),
+        ]
+
+    def _before_request(self):
+        _current_request.set(RequestStats())
+
+    def _after_request(self, response):
+        stats = _current_request.get()
+        if stats is not None:
+            stats.status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        stats = _current_request.get()
+        if stats is None:
+            return
+        _current_request.set(None)
+
+        endpoint = request.endpoint or 'unmatched'
+        duration = time.perf_counter() - stats.started
+        repeated = max(stats.statements.items(), key=lambda item: item[1], default=(None, 0))
+        n_plus_one = repeated[1] >= self.n_plus_one_threshold
+
+        with self._lock:
+            metrics = self._endpoints.get(endpoint)
+            if metrics is None:
+                metrics = self._endpoints[endpoint] = EndpointMetrics()
+            metrics.duration.observe(duration)
+            metrics.queries.observe(stats.queries)
+            metrics.db_seconds += stats.db_seconds
+            metrics.statuses[stats.status] = metrics.statuses.get(stats.status, 0) + 1
+
+            report = False
+            if n_plus_one:
+                metrics.n_plus_one += 1
+                key = (endpoint, repeated[0])
+                if key not in self._reported and len(self._reported) < self.MAX_REPORTED_STATEMENTS:
+                    self._reported.add(key)
+                    report = True
+
+        if report:
+            current_app.logger.warning(
+                "Possible N+1 queries in %s: statement ran %d times in one request: %s",
+                endpoint, repeated[1], ' '.join(repeated[0].split())[:300]
+            )
+
+    def _before_cursor_execute(self, connection, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    def _after_cursor_execute(self, connection, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_metrics_started', None)
+        elapsed = time.perf_counter() - started if started is not None else 0.0
+
+        with self._lock:
+            self._queries += 1
+            self._db_seconds += elapsed
+
+        stats = _current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+            stats.statements[statement] = stats.statements.get(statement, 0) + 1
+
+
+metrics = Metrics()
+
+
+@metrics.collector
+def _collect_database_nodes():
+    """Connection pool checkout wait and health per database node"""
+    nodes = node_router.stats()
+    return [
+        MetricFamily(
+            'cinesync_db_node_healthy', 'gauge', 'Whether the database node passes health checks',
+            [({'node': node['node']}, int(node['healthy'])) for node in nodes]
+        ),
+        MetricFamily(
+            'cinesync_db_pool_checked_out', 'gauge', 'Connections checked out of the node pool',
+            [({'node': node['node']}, node['checked_out']) for node in nodes]
+        ),
+        MetricFamily(
+            'cinesync_db_pool_checkouts_total', 'counter', 'Connection pool checkouts',
+            [({'node': node['node']}, node.get('checkouts', 0)) for node in nodes]
+        ),
+        MetricFamily(
+            'cinesync_db_pool_checkout_wait_seconds_total', 'counter', 'Time spent waiting for pooled connections',
+            [({'node': node['node']}, node.get('wait_seconds_total', 0.0)) for node in nodes]
+        ),
+        MetricFamily(
+            'cinesync_db_pool_checkout_wait_seconds_max', 'gauge', 'Longest wait for a pooled connection',
+            [({'node': node['node']}, node.get('wait_seconds_max', 0.0)) for node in nodes]
+        ),
+        MetricFamily(
+            'cinesync_db_pool_timeouts_total', 'counter', 'Checkouts that gave up after DB_POOL_TIMEOUT',
+            [({'node': node['node']}, node.get('timeouts', 0)) for node in nodes]
+        ),
+    ]
+
+
+@metrics.collector
+def _collect_cache():
+    cache = current_app.extensions.get('cache')
+    counts = cache.stats.snapshot() if cache is not None else {}
+    return [
+        MetricFamily(
+            'cinesync_cache_requests_total', 'counter', 'Cache lookups by key namespace and result',
+            [
+                ({'namespace': namespace, 'result': result}, namespace_counts[field])
+                for namespace, namespace_counts in sorted(counts.items())
+                for result, field in (('hit', 'hits'), ('miss', 'misses'))
+            ]
+        ),
+        MetricFamily(
+            'cinesync_cache_loads_total', 'counter', 'Cache values recomputed by key namespace',
+            [({'namespace': namespace}, namespace_counts['loads']) for namespace, namespace_counts in sorted(counts.items())]
+        ),
+    ]
+
+
+@metrics.collector
+def _collect_transactions():
+    return [
+        MetricFamily(
+            'cinesync_transactions_total', 'counter', 'Retried transactions by outcome',
+            [({'outcome': outcome}, count) for outcome, count in transaction_stats.snapshot().items()]
+        ),
+    ]
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{key}="{_escape(str(value))}"' for key, value in labels.items())
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
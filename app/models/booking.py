@@ -13,6 +13,11 @@ class Booking(db.Model):
     total_amount = db.Column(db.Numeric(10, 2), nullable=False)
     booked_at = db.Column(db.DateTime, server_default=db.func.now())
 
+    __table_args__ = (
+        # Booking history pages: a customer's bookings newest first
+        db.Index('ix_bookings_customer_booked_at', customer_id, booked_at.desc(), booking_id.desc()),
+    )
+
     # Relationships
     customer = db.relationship('Customer', back_populates='bookings')
     show = db.relationship('Show', back_populates='bookings')
@@ -8,7 +8,7 @@ class BookingSeat(db.Model):
     __tablename__ = 'booking_seats'
 
     id = db.Column(db.String(50), primary_key=True)
-    booking_id = db.Column(db.String(50), db.ForeignKey('bookings.booking_id'), nullable=False)
+    booking_id = db.Column(db.String(50), db.ForeignKey('bookings.booking_id'), nullable=False, index=True)
     seat_id = db.Column(db.String(50), db.ForeignKey('seats.seat_id'), nullable=False)
 
     # Relationships
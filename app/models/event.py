@@ -16,6 +16,11 @@ class Event(db.Model):
     duration_mins = db.Column(db.Integer)
     rating = db.Column(db.String(10))
 
+    __table_args__ = (
+        # Listing pages: events by name
+        db.Index('ix_events_name', event_name, event_id),
+    )
+
     # Relationships
     shows = db.relationship('Show', back_populates='event', lazy='dynamic')
 
@@ -14,6 +14,12 @@ class Show(db.Model):
     show_datetime = db.Column(db.DateTime, nullable=False)
     price = db.Column(db.Numeric(10, 2), nullable=False)
 
+    __table_args__ = (
+        # Showtime pages: an event's or an auditorium's shows in time order
+        db.Index('ix_shows_event_datetime', event_id, show_datetime, show_id),
+        db.Index('ix_shows_auditorium_datetime', auditorium_id, show_datetime, show_id),
+    )
+
     # Relationships
     event = db.relationship('Event', back_populates='shows')
     auditorium = db.relationship('Auditorium', back_populates='shows')
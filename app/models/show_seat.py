@@ -3,13 +3,18 @@ ShowSeat model - tracks seat availability for each show
 This is crucial for concurrency control in seat booking
 """
 from app.extensions import db
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import Index, UniqueConstraint, text
 
 
 class ShowSeat(db.Model):
     __tablename__ = 'show_seats'
     __table_args__ = (
         UniqueConstraint('show_id', 'seat_id', name='unique_show_seat'),
+        # Held seats (locked, no booking yet) ordered by lock time, for hold expiry
+        Index(
+            'ix_show_seats_held_locked_at', 'locked_at',
+            postgresql_where=text('is_available = false AND booking_id IS NULL')
+        ),
     )
 
     id = db.Column(db.String(50), primary_key=True)
@@ -18,7 +23,7 @@ class ShowSeat(db.Model):
     is_available = db.Column(db.Boolean, default=True, nullable=False)
     booking_id = db.Column(db.String(50), db.ForeignKey('bookings.booking_id'), nullable=True)
     locked_at = db.Column(db.DateTime, nullable=True)
-    locked_by = db.Column(db.String(100), nullable=True)  # Session/transaction ID
+    locked_by = db.Column(db.String(100), nullable=True)  # Session/transaction ID or hold token
     version = db.Column(db.Integer, default=0, nullable=False)  # For optimistic locking
 
     # Relationships
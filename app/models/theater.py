@@ -15,6 +15,12 @@ class Theater(db.Model):
     latitude = db.Column(db.Float)
     longitude = db.Column(db.Float)
 
+    __table_args__ = (
+        # Listing pages: theaters by name, overall and per city
+        db.Index('ix_theaters_name', name, theater_id),
+        db.Index('ix_theaters_city_name', city, name, theater_id),
+    )
+
     # Relationships
     auditoriums = db.relationship('Auditorium', back_populates='theater', lazy='dynamic')
 
@@ -0,0 +1,50 @@
+"""
+Admin routes - operational endpoints (metrics, booking contention)
+"""
+from flask import Blueprint, Response, current_app, jsonify, request
+from app.metrics import metrics
+from app.services.contention_stats import contention_stats
+import hmac
+import ipaddress
+
+admin_bp = Blueprint('admin', __name__)
+
+
+@admin_bp.before_request
+def require_token():
+    """
+    Require 'Authorization: Bearer <ADMIN_TOKEN>'
+    Without ADMIN_TOKEN only loopback clients are let in, unless ADMIN_ENDPOINTS_OPEN is set
+    """
+    config = current_app.config
+    if config.get('ADMIN_ENDPOINTS_OPEN'):
+        return None
+
+    token = config.get('ADMIN_TOKEN')
+    if not token:
+        if _is_loopback(request.remote_addr):
+            return None
+        return "Forbidden: set ADMIN_TOKEN to reach admin endpoints remotely", 403
+
+    supplied = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(supplied, f'Bearer {token}'):
+        return "Unauthorized", 401
+
+
+def _is_loopback(address):
+    try:
+        return ipaddress.ip_address(address or '').is_loopback
+    except ValueError:
+        return False
+
+
+@admin_bp.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@admin_bp.route('/admin/contention')
+def booking_contention():
+    """Most contended shows and seat blocks (?limit=N, default CONTENTION_TOP_K)"""
+    return jsonify(contention_stats.report(request.args.get('limit', type=int)))
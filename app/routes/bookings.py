@@ -1,17 +1,22 @@
 """
 Booking routes - seat selection and booking flow
 """
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash
+from flask import Blueprint, Response, current_app, jsonify, render_template, request, redirect, url_for, session, flash, stream_with_context
 from app.services.show_service import ShowService
 from app.services.event_service import EventService
 from app.services.seat_service import SeatService
 from app.services.booking_service import BookingService
+from app.services.concurrent_booking_service import ConcurrentBookingService
+from app.services.admission_control import admission_required
+from app.services.seat_state_store import seat_state_store
+from app.services.seat_events import seat_events
 from app.extensions import db
 
 bookings_bp = Blueprint('bookings', __name__)
 
 
 @bookings_bp.route('/seats')
+@admission_required
 def select_seats():
     """Seat selection page"""
     show_id = request.args.get('show_id')
@@ -24,22 +29,95 @@ def select_seats():
     if not show:
         return "Show not found", 404
 
+    # Returning to seat selection gives up the seats held for checkout
+    if session.get('seat_hold', {}).get('show_id') == show_id:
+        _release_pending_hold()
+
     event = EventService.get_event_by_id(event_id)
     auditorium = show.auditorium
     theater = auditorium.theater if auditorium else None
 
-    # Get all seats with their booking status
-    seats_with_status = SeatService.get_all_seats_with_status(show_id, show.auditorium_id)
+    # Get the seat grid with booking status; the live stream continues from its version
+    seat_state = seat_state_store.snapshot(show_id)
+    seat_rows = SeatService.get_seat_map(show_id, show.auditorium_id, seat_state)
 
     return render_template('bookings/seats.html',
                           show=show,
                           event=event,
                           auditorium=auditorium,
                           theater=theater,
-                          seats_with_status=seats_with_status)
+                          seat_rows=seat_rows,
+                          seat_version=seat_state.version)
+
+
+@bookings_bp.route('/seats/state')
+def seat_states():
+    """
+    Seat states of a show as JSON, for clients that refresh the seat map
+
+    The ETag is the show's seat layout checksum and change counter, so a
+    matching If-None-Match gets 304 without building the body or querying
+    seats. ?since=<version> returns only the seats changed after version.
+    """
+    show_id = request.args.get('show_id')
+    if not show_id:
+        return jsonify({'error': 'Show ID required'}), 400
+
+    since = request.args.get('since')
+    try:
+        since = int(since) if since else None
+    except ValueError:
+        return jsonify({'error': 'Invalid seat map version'}), 400
+
+    try:
+        seat_state = seat_state_store.snapshot(show_id)
+        layout = seat_state_store.layout(show_id)
+    except ValueError:
+        return jsonify({'error': 'Show not found'}), 404
+
+    etag = f'{layout.checksum:08x}-{seat_state.version}'
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(SeatService.get_seat_states(show_id, seat_state, since))
+
+    response.set_etag(etag)
+    # Always revalidate; the 304 path is cheap
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@bookings_bp.route('/seats/stream')
+def seat_stream():
+    """Live seat map updates for a show (Server-Sent Events)"""
+    show_id = request.args.get('show_id')
+    if not show_id:
+        return "Show ID required", 400
+
+    try:
+        version = int(request.headers.get('Last-Event-ID') or request.args.get('since') or 0)
+    except ValueError:
+        return "Invalid seat map version", 400
+
+    try:
+        seat_state_store.current_version(show_id)
+    except ValueError:
+        return "Show not found", 404
+
+    if not seat_events.subscribe(current_app.config.get('SEAT_STREAM_MAX_CLIENTS', 4)):
+        return "Too many live seat maps open", 503, {'Retry-After': '30'}
+
+    response = Response(
+        stream_with_context(SeatService.seat_event_stream(show_id, version)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    response.call_on_close(seat_events.unsubscribe)
+    return response
 
 
 @bookings_bp.route('/confirm', methods=['POST'])
+@admission_required
 def confirm_booking():
     """Booking confirmation page"""
     show_id = request.form.get('show_id')
@@ -64,6 +142,26 @@ def confirm_booking():
         return redirect(url_for('customers.login'))
 
     show = ShowService.get_show_by_id(show_id, event_id)
+    if not show:
+        return "Show not found", 404
+
+    # Release any previous hold before holding the newly selected seats
+    _release_pending_hold()
+
+    try:
+        hold_token, hold_expires_at = ConcurrentBookingService.place_hold(show_id, seat_ids)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('bookings.select_seats',
+                              show_id=show_id,
+                              event_id=event_id))
+
+    session['seat_hold'] = {
+        'show_id': show_id,
+        'seat_ids': seat_ids,
+        'token': hold_token
+    }
+
     event = EventService.get_event_by_id(event_id)
     seats = SeatService.get_seats_by_ids(seat_ids)
 
@@ -74,10 +172,12 @@ def confirm_booking():
                           show=show,
                           event=event,
                           seats=seats,
-                          total_amount=total_amount)
+                          total_amount=total_amount,
+                          hold_expires_at=hold_expires_at)
 
 
 @bookings_bp.route('/create', methods=['POST'])
+@admission_required
 def create_booking():
     """Create a booking"""
     show_id = request.form.get('show_id')
@@ -89,9 +189,17 @@ def create_booking():
         return redirect(url_for('customers.login'))
 
     customer_id = session['customer_id']
+    hold = session.get('seat_hold')
 
     try:
-        booking = BookingService.create_booking(customer_id, show_id, event_id, seat_ids)
+        if hold and hold['show_id'] == show_id and set(hold['seat_ids']) == set(seat_ids):
+            # Confirm the seats held on the confirmation page
+            booking = ConcurrentBookingService.confirm_hold(
+                customer_id, show_id, seat_ids, hold['token']
+            )
+            session.pop('seat_hold', None)
+        else:
+            booking = BookingService.create_booking(customer_id, show_id, event_id, seat_ids)
         flash('Booking created successfully!', 'success')
         return redirect(url_for('bookings.booking_success', booking_id=booking.booking_id))
 
@@ -109,6 +217,20 @@ def create_booking():
                               event_id=event_id))
 
 
+def _release_pending_hold():
+    """Release the seats held by this browser session, if any"""
+    hold = session.pop('seat_hold', None)
+    if not hold:
+        return
+
+    try:
+        ConcurrentBookingService.release_hold(hold['show_id'], hold['token'])
+    except Exception:
+        # An unreleased hold simply expires
+        db.session.rollback()
+        current_app.logger.exception("Failed to release hold on show %s", hold['show_id'])
+
+
 @bookings_bp.route('/success/<booking_id>')
 def booking_success(booking_id):
     """Booking success page"""
@@ -5,7 +5,8 @@ from flask import Blueprint, render_template, request, redirect, url_for, sessio
 from app.models.customer import Customer
 from app.services.booking_service import BookingService
 from app.extensions import db
-import uuid
+from app.ids import new_id
+from app.services.pagination import page_size
 
 customers_bp = Blueprint('customers', __name__)
 
@@ -55,7 +56,7 @@ def register():
             return redirect(url_for('customers.login'))
 
         # Create new customer
-        customer_id = f"CUST-{uuid.uuid4().hex[:8].upper()}"
+        customer_id = new_id('CUST')
         customer = Customer(
             customer_id=customer_id,
             name=name,
@@ -112,15 +113,14 @@ def profile():
         session.clear()
         return redirect(url_for('customers.login'))
 
-    # Get booking history with details
-    bookings = BookingService.get_customer_bookings(customer_id)
-
-    bookings_with_details = []
-    for booking in bookings:
-        details = BookingService.get_booking_with_show_details(booking.booking_id)
-        if details:
-            bookings_with_details.append(details)
+    # Get one page of booking history with details
+    try:
+        history = BookingService.get_booking_history(customer_id, request.args.get('cursor'), page_size())
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('customers.profile'))
 
     return render_template('customers/profile.html',
                           customer=customer,
-                          bookings=bookings_with_details)
+                          bookings=history['bookings'],
+                          next_cursor=history['next_cursor'])
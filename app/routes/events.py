@@ -4,22 +4,29 @@ Event routes - event/movie listings and details
 from flask import Blueprint, render_template, request
 from app.services.event_service import EventService
 from app.services.show_service import ShowService
-from app.services.theater_service import TheaterService
+from app.extensions import follower_read
+from app.services.pagination import page_size
+from app.services.show_calendar import CALENDAR_WINDOWS
 
 events_bp = Blueprint('events', __name__)
 
 
 @events_bp.route('/')
+@follower_read
 def list_events():
     """List all events with optional filters"""
     event_type = request.args.get('type')
     language = request.args.get('language')
     rating = request.args.get('rating')
+    cursor = request.args.get('cursor')
 
-    if event_type or language or rating:
-        events = EventService.filter_events(event_type, language, rating)
-    else:
-        events = EventService.get_all_events()
+    try:
+        if event_type or language or rating:
+            page = EventService.filter_events(event_type, language, rating, cursor, page_size())
+        else:
+            page = EventService.get_all_events(cursor, page_size())
+    except ValueError as e:
+        return str(e), 400
 
     # Get filter options
     event_types = EventService.get_event_types()
@@ -27,7 +34,8 @@ def list_events():
     ratings = EventService.get_ratings()
 
     return render_template('events/list.html',
-                          events=events,
+                          events=page.items,
+                          next_cursor=page.next_cursor,
                           event_types=event_types,
                           languages=languages,
                           ratings=ratings,
@@ -37,6 +45,7 @@ def list_events():
 
 
 @events_bp.route('/<uuid:event_id>')
+@follower_read
 def event_detail(event_id):
     """Event detail page"""
     event = EventService.get_event_by_id(event_id)
@@ -44,15 +53,19 @@ def event_detail(event_id):
     if not event:
         return "Event not found", 404
 
-    # Get available dates for this event
-    available_dates = ShowService.get_available_dates_for_event(event_id)
+    days = request.args.get('days', 7, type=int)
+    if days not in CALENDAR_WINDOWS:
+        days = 7
 
-    # Get theaters showing this event
-    shows = ShowService.get_shows_for_event(event_id)
-    theater_ids = set(show.auditorium.theater_id for show in shows if show.auditorium)
-    theaters = [TheaterService.get_theater_by_id(tid) for tid in theater_ids]
+    # Dates with shows come from the calendar index
+    calendar = ShowService.get_show_calendar(event_id, days)
+
+    # Theaters showing this event in the same window, in one query
+    theaters = ShowService.get_theaters_for_event(event_id, days_ahead=days)
 
     return render_template('events/detail.html',
                           event=event,
-                          available_dates=available_dates,
+                          calendar=calendar,
+                          calendar_windows=CALENDAR_WINDOWS,
+                          selected_days=days,
                           theaters=theaters)
@@ -1,14 +1,17 @@
 """
 Main routes - homepage and search
 """
-from flask import Blueprint, render_template, request
+from flask import Blueprint, render_template, request, jsonify, url_for
 from app.services.event_service import EventService
 from app.services.theater_service import TheaterService
+from app.services.search_index import search_index
+from app.extensions import follower_read
 
 main_bp = Blueprint('main', __name__)
 
 
 @main_bp.route('/')
+@follower_read
 def index():
     """Homepage"""
     featured_events = EventService.get_featured_events(limit=6)
@@ -22,6 +25,7 @@ def index():
 
 
 @main_bp.route('/search')
+@follower_read
 def search():
     """Search events and theaters"""
     query = request.args.get('q', '').strip()
@@ -36,3 +40,22 @@ def search():
                           query=query,
                           events=events,
                           theaters=theaters)
+
+
+@main_bp.route('/search/suggest')
+@follower_read
+def search_suggest():
+    """Type-ahead suggestions for the search box"""
+    query = request.args.get('q', '').strip()
+
+    suggestions = []
+    for doc in search_index.suggest(query):
+        if doc['kind'] == 'event':
+            url = url_for('events.event_detail', event_id=doc['event_id'])
+            title = doc['event_name']
+        else:
+            url = url_for('theaters.theater_detail', theater_id=doc['theater_id'])
+            title = doc['name']
+        suggestions.append({'kind': doc['kind'], 'title': title, 'url': url})
+
+    return jsonify(suggestions)
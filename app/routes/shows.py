@@ -1,16 +1,20 @@
 """
 Show routes - showtimes and selection
 """
-from flask import Blueprint, render_template, request
+from flask import Blueprint, current_app, render_template, request, session
+from app.models.customer import Customer
 from app.services.show_service import ShowService
 from app.services.event_service import EventService
 from app.services.theater_service import TheaterService
+from app.extensions import follower_read
+from app.services.pagination import page_size
 from datetime import datetime
 
 shows_bp = Blueprint('shows', __name__)
 
 
 @shows_bp.route('/select')
+@follower_read
 def select_show():
     """Show selection page for event and theater"""
     event_id = request.args.get('event_id')
@@ -34,24 +38,36 @@ def select_show():
     else:
         show_date = datetime.now().date()
 
-    # Get shows
-    if theater_id:
-        theater = TheaterService.get_theater_by_id(theater_id)
-        shows_data = ShowService.get_shows_with_details(
+    # near_km limits the showtimes to theaters that close to a customer with a known location
+    customer = Customer.query.get(session['customer_id']) if 'customer_id' in session else None
+    located = customer is not None and customer.latitude is not None and customer.longitude is not None
+    near_km = request.args.get('near_km', type=float) if located else None
+    nearby = None
+    if near_km:
+        nearby = {
+            theater_obj.theater_id: distance
+            for theater_obj, distance in TheaterService.get_nearby_theaters(
+                customer.latitude, customer.longitude, radius_km=near_km
+            )
+        }
+
+    # Get one page of shows
+    theater = TheaterService.get_theater_by_id(theater_id) if theater_id else None
+    try:
+        page = ShowService.get_shows_with_details(
             event_id=event_id,
             theater_id=theater_id,
-            date=show_date
-        )
-    else:
-        theater = None
-        shows_data = ShowService.get_shows_with_details(
-            event_id=event_id,
-            date=show_date
+            date=show_date,
+            cursor=request.args.get('cursor'),
+            limit=page_size(),
+            theater_ids=list(nearby) if nearby is not None else None
         )
+    except ValueError as e:
+        return str(e), 400
 
     # Group shows by theater
     theaters_shows = {}
-    for show, event_obj, theater_obj, auditorium in shows_data:
+    for show, event_obj, theater_obj, auditorium in page.items:
         if theater_obj.theater_id not in theaters_shows:
             theaters_shows[theater_obj.theater_id] = {
                 'theater': theater_obj,
@@ -62,8 +78,32 @@ def select_show():
             'auditorium': auditorium
         })
 
+    # Nearest theaters first for customers with a known location
+    if located:
+        if nearby is not None:
+            # Distances already came from the geo index
+            by_distance = sorted(
+                ((data['theater'], nearby[theater_id]) for theater_id, data in theaters_shows.items()),
+                key=lambda item: item[1]
+            )
+        else:
+            by_distance = TheaterService.sort_by_distance(
+                [data['theater'] for data in theaters_shows.values()],
+                customer.latitude, customer.longitude
+            )
+        sorted_shows = {}
+        for theater_obj, distance in by_distance:
+            data = theaters_shows[theater_obj.theater_id]
+            data['distance_km'] = distance
+            sorted_shows[theater_obj.theater_id] = data
+        theaters_shows = sorted_shows
+
     return render_template('shows/select.html',
                           event=event,
                           theater=theater,
                           show_date=show_date,
-                          theaters_shows=theaters_shows)
+                          theaters_shows=theaters_shows,
+                          located=located,
+                          near_km=near_km,
+                          nearby_km=current_app.config.get('SHOWTIMES_NEARBY_KM', 25),
+                          next_cursor=page.next_cursor)
@@ -4,30 +4,39 @@ Theater routes - theater listings and details
 from flask import Blueprint, render_template, request
 from app.services.theater_service import TheaterService
 from app.services.show_service import ShowService
+from app.extensions import follower_read
+from app.services.pagination import page_size
 from datetime import datetime
 
 theaters_bp = Blueprint('theaters', __name__)
 
 
 @theaters_bp.route('/')
+@follower_read
 def list_theaters():
     """List all theaters"""
     city = request.args.get('city')
+    cursor = request.args.get('cursor')
 
-    if city:
-        theaters = TheaterService.get_theaters_by_city(city)
-    else:
-        theaters = TheaterService.get_all_theaters()
+    try:
+        if city:
+            page = TheaterService.get_theaters_by_city(city, cursor, page_size())
+        else:
+            page = TheaterService.get_all_theaters(cursor, page_size())
+    except ValueError as e:
+        return str(e), 400
 
     cities = TheaterService.get_cities()
 
     return render_template('theaters/list.html',
-                          theaters=theaters,
+                          theaters=page.items,
+                          next_cursor=page.next_cursor,
                           cities=cities,
                           selected_city=city)
 
 
 @theaters_bp.route('/<theater_id>')
+@follower_read
 def theater_detail(theater_id):
     """Theater detail page"""
     theater = TheaterService.get_theater_by_id(theater_id)
@@ -40,10 +49,19 @@ def theater_detail(theater_id):
 
     # Get today's shows
     today = datetime.now().date()
-    shows_data = ShowService.get_shows_with_details(theater_id=theater_id, date=today)
+    try:
+        page = ShowService.get_shows_with_details(
+            theater_id=theater_id,
+            date=today,
+            cursor=request.args.get('cursor'),
+            limit=page_size()
+        )
+    except ValueError as e:
+        return str(e), 400
 
     return render_template('theaters/detail.html',
                           theater=theater,
                           auditoriums=auditoriums,
-                          shows_data=shows_data,
+                          shows_data=page.items,
+                          next_cursor=page.next_cursor,
                           today=today)
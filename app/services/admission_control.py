@@ -0,0 +1,323 @@
+"""
+Admission control - per-show token buckets and FIFO waiting rooms
+
+Entering a show's booking flow (seat selection through booking) needs an
+admission pass. Passes are handed out by the show's token bucket at
+ADMISSION_RATE per second (bursts up to ADMISSION_BURST); everyone else
+gets a numbered ticket in the show's bounded waiting room and a static
+waiting page that polls until the ticket reaches the front. Waiting costs
+no database work.
+
+Only seat selection (GET) queues visitors. A booking step POSTed without a
+valid pass is let through if the bucket has a token and otherwise gets a
+503 with Retry-After, so the browser keeps the submitted form.
+
+Each show's rate follows AIMD: every ADMISSION_ADJUST_SECONDS it is cut by
+ADMISSION_DECREASE_FACTOR when the show's booking commit latency exceeds
+ADMISSION_TARGET_LATENCY_SECONDS or the transaction retry ratio exceeds
+ADMISSION_MAX_RETRY_RATIO, and raised by ADMISSION_INCREASE_STEP while
+people are waiting and the cluster keeps up.
+
+State is per process, so with N workers each show admits up to N times
+the configured rate.
+"""
+from app.services.transaction_runner import commit_timer, stats as transaction_stats
+from flask import current_app, render_template, request, session, url_for
+from collections import OrderedDict, namedtuple
+import functools
+import itertools
+import math
+import threading
+import time
+
+
+Admission = namedtuple('Admission', ['admitted', 'ticket', 'position', 'retry_after'])
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate tokens per second, holding at most burst"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self._refilled_at = time.monotonic()
+
+    def available(self):
+        self._refill()
+        return self.tokens
+
+    def take(self):
+        """Take one token if available"""
+        self._refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+
+class ShowAdmission:
+    """One show's bucket, waiting room (ticket -> last poll time) and latency samples"""
+
+    def __init__(self, rate, burst):
+        self.bucket = TokenBucket(rate, burst)
+        self.waiting = OrderedDict()
+        self.latencies = []
+        self.admitted = 0
+        self.turned_away = 0
+        self.adjusted_at = time.monotonic()
+        self.active_at = time.monotonic()
+
+
+class AdmissionController:
+    """Per-show admission state, created on first request and dropped once idle"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._shows = {}
+        self._tickets = itertools.count(1)
+        self._retry_ratio = 0.0
+        self._transactions = None
+        self._measured_at = None
+
+    def admit(self, show_id, ticket=None):
+        """
+        Admit a visitor to a show's booking flow, or queue them
+
+        Args:
+            show_id: ID of the show
+            ticket: The visitor's waiting room ticket from an earlier call, if any
+
+        Returns:
+            Admission(admitted, ticket, position, retry_after); a refused
+            visitor without a ticket found the waiting room full
+        """
+        config = current_app.config
+        now = time.monotonic()
+
+        with self._lock:
+            state = self._state(show_id, config, now)
+            self._adjust(state, config, now)
+
+            idle_seconds = config.get('ADMISSION_TICKET_IDLE_SECONDS', 30)
+            if ticket in state.waiting:
+                state.waiting[ticket] = now
+                position = self._position(state, ticket, now, idle_seconds)
+                # Everyone ahead of the ticket can be served from the tokens on hand
+                if position <= max(1, int(state.bucket.available())) and state.bucket.take():
+                    del state.waiting[ticket]
+                    state.admitted += 1
+                    return Admission(True, None, 0, 0)
+                return Admission(False, ticket, position, self._retry_after(state, position, config))
+
+            if not state.waiting and state.bucket.take():
+                state.admitted += 1
+                return Admission(True, None, 0, 0)
+
+            if len(state.waiting) >= config.get('ADMISSION_WAITING_ROOM_SIZE', 2000):
+                state.turned_away += 1
+                return Admission(False, None, None, config.get('ADMISSION_POLL_SECONDS', 5))
+
+            ticket = next(self._tickets)
+            state.waiting[ticket] = now
+            position = len(state.waiting)
+            return Admission(False, ticket, position, self._retry_after(state, position, config))
+
+    def admit_now(self, show_id):
+        """Admit a visitor without queueing: True if the show's bucket had a token"""
+        config = current_app.config
+        now = time.monotonic()
+
+        with self._lock:
+            state = self._state(show_id, config, now)
+            self._adjust(state, config, now)
+            if state.bucket.take():
+                state.admitted += 1
+                return True
+            state.turned_away += 1
+            return False
+
+    def retry_after(self, show_id):
+        """Seconds a visitor turned away by admit_now() should wait before retrying"""
+        config = current_app.config
+        with self._lock:
+            state = self._shows.get(show_id)
+            if state is None:
+                return 1
+            return self._retry_after(state, len(state.waiting) + 1, config)
+
+    def record_latency(self, show_id, seconds):
+        """Record how long one booking commit took for the show's rate adjustment"""
+        with self._lock:
+            state = self._shows.get(show_id)
+            if state is not None:
+                state.latencies.append(seconds)
+
+    def stats(self):
+        """Get {show_id: {'rate', 'waiting', 'admitted', 'turned_away'}} for active shows"""
+        with self._lock:
+            return {
+                show_id: {
+                    'rate': state.bucket.rate,
+                    'waiting': len(state.waiting),
+                    'admitted': state.admitted,
+                    'turned_away': state.turned_away
+                }
+                for show_id, state in self._shows.items()
+            }
+
+    def _state(self, show_id, config, now):
+        state = self._shows.get(show_id)
+        if state is None:
+            # Forget shows nobody has asked for in a while
+            idle_after = config.get('ADMISSION_STATE_IDLE_SECONDS', 600)
+            for idle_id in [key for key, other in self._shows.items() if now - other.active_at > idle_after]:
+                del self._shows[idle_id]
+
+            state = self._shows[show_id] = ShowAdmission(
+                config.get('ADMISSION_RATE', 20.0), config.get('ADMISSION_BURST', 40)
+            )
+        state.active_at = now
+        return state
+
+    def _adjust(self, state, config, now):
+        """AIMD step on the show's rate once per ADMISSION_ADJUST_SECONDS"""
+        if now - state.adjusted_at < config.get('ADMISSION_ADJUST_SECONDS', 5):
+            return
+        state.adjusted_at = now
+
+        self._measure_retry_ratio(now, config)
+        latency = sum(state.latencies) / len(state.latencies) if state.latencies else 0.0
+        state.latencies = []
+
+        bucket = state.bucket
+        if (latency > config.get('ADMISSION_TARGET_LATENCY_SECONDS', 0.5)
+                or self._retry_ratio > config.get('ADMISSION_MAX_RETRY_RATIO', 0.2)):
+            bucket.rate = max(
+                config.get('ADMISSION_MIN_RATE', 1.0),
+                bucket.rate * config.get('ADMISSION_DECREASE_FACTOR', 0.7)
+            )
+        elif state.waiting:
+            bucket.rate = min(
+                config.get('ADMISSION_MAX_RATE', 200.0),
+                bucket.rate + config.get('ADMISSION_INCREASE_STEP', 2.0)
+            )
+
+    def _measure_retry_ratio(self, now, config):
+        """Retries per transaction attempt since the last measurement (process-wide)"""
+        if self._measured_at is not None and now - self._measured_at < config.get('ADMISSION_ADJUST_SECONDS', 5):
+            return
+
+        counts = transaction_stats.snapshot()
+        previous, self._transactions, self._measured_at = self._transactions, counts, now
+        if previous is None:
+            return
+
+        retries = counts['retries'] - previous['retries']
+        attempts = retries + sum(counts[name] - previous[name] for name in ('commits', 'aborts'))
+        self._retry_ratio = retries / attempts if attempts > 0 else 0.0
+
+    def _position(self, state, ticket, now, idle_seconds):
+        """1-based position of a ticket, dropping tickets whose holders stopped polling"""
+        position = 0
+        for other, polled_at in list(state.waiting.items()):
+            if other == ticket:
+                return position + 1
+            if now - polled_at > idle_seconds:
+                del state.waiting[other]
+            else:
+                position += 1
+        return position + 1
+
+    def _retry_after(self, state, position, config):
+        """Seconds until the waiting page should poll again"""
+        expected = position / max(state.bucket.rate, 0.001)
+        return max(1, min(config.get('ADMISSION_POLL_SECONDS', 5), math.ceil(expected)))
+
+
+admission_controller = AdmissionController()
+
+
+def admission_required(view):
+    """
+    Route decorator: let the request through only with an admission pass for its show
+
+    The show comes from the show_id query or form field. Visitors without a
+    pass are admitted by the show's token bucket or shown the waiting page.
+    POSTs are never queued (the waiting page would lose the form): without a
+    pass they need a token now or get a 503 with Retry-After. POST requests
+    (bookings) feed their commit latency into the show's rate.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        config = current_app.config
+        show_id = request.values.get('show_id')
+        if not config.get('ADMISSION_CONTROL_ENABLED', False) or not show_id or _has_pass(show_id):
+            return _run_view(view, show_id, args, kwargs)
+
+        if request.method == 'POST':
+            if admission_controller.admit_now(show_id):
+                _grant_pass(show_id, config)
+                return _run_view(view, show_id, args, kwargs)
+            retry_after = admission_controller.retry_after(show_id)
+            return (
+                f"This show is in high demand. Please resubmit in {retry_after} seconds.",
+                503, {'Retry-After': str(retry_after), 'Cache-Control': 'no-store'}
+            )
+
+        tickets = session.get('admission_tickets', {})
+        admission = admission_controller.admit(show_id, tickets.get(show_id))
+
+        if admission.admitted:
+            tickets.pop(show_id, None)
+            session['admission_tickets'] = tickets
+            _grant_pass(show_id, config)
+            return _run_view(view, show_id, args, kwargs)
+
+        if admission.ticket is not None:
+            tickets[show_id] = admission.ticket
+            session['admission_tickets'] = tickets
+
+        refresh_url = url_for(
+            'bookings.select_seats', show_id=show_id, event_id=request.values.get('event_id')
+        )
+        body = render_template(
+            'bookings/waiting.html',
+            position=admission.position,
+            retry_after=admission.retry_after,
+            refresh_url=refresh_url
+        )
+        status = 200 if admission.ticket is not None else 503
+        return body, status, {'Retry-After': str(admission.retry_after), 'Cache-Control': 'no-store'}
+
+    return wrapper
+
+
+def _grant_pass(show_id, config):
+    passes = {
+        key: expires_at for key, expires_at in session.get('admission_passes', {}).items()
+        if expires_at > time.time()
+    }
+    passes[show_id] = time.time() + config.get('ADMISSION_PASS_SECONDS', 900)
+    session['admission_passes'] = passes
+
+
+def _has_pass(show_id):
+    expires_at = session.get('admission_passes', {}).get(show_id)
+    return expires_at is not None and expires_at > time.time()
+
+
+def _run_view(view, show_id, args, kwargs):
+    if request.method != 'POST' or not show_id:
+        return view(*args, **kwargs)
+
+    with commit_timer() as timer:
+        response = view(*args, **kwargs)
+    if timer.commits:
+        admission_controller.record_latency(show_id, timer.seconds / timer.commits)
+    return response
@@ -0,0 +1,67 @@
+"""
+Background rebuild - keeps a periodically rebuilt in-memory index off the request path
+
+The first build runs in the caller, since there is nothing to serve yet,
+and concurrent first callers wait for it instead of building too. Later
+rebuilds run on a background thread while the current index keeps
+answering; a try-lock lets only one rebuild run at a time, so an expired
+index never makes every request rebuild it at once.
+"""
+from app.extensions import db
+from flask import current_app
+import threading
+import time
+
+
+class BackgroundRebuild:
+    """
+    Rebuild scheduler for an index object
+
+    The index provides build() and a built_at attribute: the time.monotonic()
+    of its last build, None before the first one.
+    """
+
+    def __init__(self, index, name):
+        self.index = index
+        self.name = name
+        self._lock = threading.Lock()
+
+    def ensure(self, max_age, wait=True):
+        """
+        Build the index now if it was never built, or in the background once older than max_age seconds
+        With wait=False the first build runs in the background too (for callers with a fallback)
+        """
+        built_at = self.index.built_at
+        if built_at is None and wait:
+            with self._lock:
+                # Another caller may have built it while we waited
+                if self.index.built_at is None:
+                    self.index.build()
+            return
+
+        if built_at is not None and time.monotonic() - built_at <= max_age:
+            return
+        if not self._lock.acquire(blocking=False):
+            # Already rebuilding; keep serving the current index
+            return
+
+        try:
+            threading.Thread(
+                target=self._run, args=(current_app._get_current_object(),),
+                name=f'{self.name}-rebuild', daemon=True
+            ).start()
+        except Exception:
+            self._lock.release()
+            raise
+
+    def _run(self, app):
+        try:
+            with app.app_context():
+                try:
+                    self.index.build()
+                except Exception:
+                    app.logger.exception("Rebuilding %s failed", self.name)
+                finally:
+                    db.session.remove()
+        finally:
+            self._lock.release()
@@ -0,0 +1,273 @@
+"""
+Booking dispatcher - per-show single-writer queues for seat bookings
+
+During a flash sale every booking request for a show competes for the same
+show_seats rows, and concurrent serializable transactions mostly abort and
+retry. The dispatcher routes each request to its show's queue instead; one
+worker thread per show takes up to BOOKING_BATCH_SIZE queued requests and
+books them in a single transaction:
+
+  1. one SELECT ... FOR UPDATE of the batch's requested seats
+  2. requests whose seats are taken (in the database or by an earlier
+     request in the same batch) are rejected in memory
+  3. the rest are booked with the set-based statements
+
+Callers wait on a Future, after handing their session's connection back to
+the pool. A worker exits after BOOKING_WORKER_IDLE_SECONDS without requests,
+so idle shows cost nothing. At most BOOKING_MAX_WORKERS shows have a worker
+at a time; bookings for other shows meanwhile run directly in the caller.
+
+Hold confirmations (ConcurrentBookingService.confirm_hold) bypass the
+dispatcher: they only update seats their own hold already owns.
+"""
+from app.models.booking import Booking
+from app.models.show_seat import ShowSeat
+from app.extensions import db
+from app.services.concurrent_booking_service import ConcurrentBookingService
+from app.services.contention_stats import contention_stats, lock_wait
+from app.services.schedule_import_service import ScheduleImportService
+from app.services.transaction_runner import (
+    AmbiguousCommitError, TransactionRetryError, commit_timer, current_commit_timer, end_read_transaction,
+    run_in_transaction
+)
+from app.tracing import tracer
+from flask import current_app
+from sqlalchemy import and_, select
+from collections import namedtuple
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import queue
+import threading
+
+
+BookingRequest = namedtuple(
+    'BookingRequest',
+    ['customer_id', 'show_id', 'seat_ids', 'locked_by', 'event_id', 'future', 'span', 'commit_timer']
+)
+
+
+class BookingQueueError(ValueError):
+    """Raised when a booking cannot be queued or waits too long in its show's queue"""
+
+
+class BookingDispatcher:
+    """Routes bookings to per-show queues, each drained by one worker thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queues = {}
+
+    def book(self, customer_id, show_id, seat_ids, session_id=None, event_id=None):
+        """
+        Book seats through the show's queue and wait for the result
+
+        A request still queued after BOOKING_QUEUE_WAIT_SECONDS is withdrawn;
+        one the worker already started is waited for, since it may commit.
+        The caller's session must not hold uncommitted changes: its read
+        transaction is ended so no connection is held while waiting.
+
+        Returns:
+            Booking object if successful
+
+        Raises:
+            ValueError: If seats are unavailable or show not found
+            BookingQueueError: If the queue is full or the request waited too long
+            TransactionRetryError: If serialization failures exhaust the retry budget
+            TransactionStateError: If the session has uncommitted changes
+        """
+        end_read_transaction(db.session())
+        future = self.submit(customer_id, show_id, seat_ids, session_id, event_id)
+        if future is None:
+            # Every worker slot is taken by other shows
+            return ConcurrentBookingService.create_booking_set_based(
+                customer_id, show_id, seat_ids, session_id=session_id, event_id=event_id
+            )
+
+        # submit() may have read; do not hold that transaction's connection while waiting
+        end_read_transaction(db.session())
+        try:
+            booking_id = future.result(timeout=current_app.config.get('BOOKING_QUEUE_WAIT_SECONDS', 10))
+        except FutureTimeoutError:
+            if future.cancel():
+                raise BookingQueueError(
+                    "Request failed due to high concurrent traffic. Please try again."
+                )
+            booking_id = future.result()
+        return db.session.get(Booking, booking_id)
+
+    def submit(self, customer_id, show_id, seat_ids, session_id=None, event_id=None):
+        """
+        Queue a booking for its show's worker
+
+        Returns:
+            Future resolving to the new booking's ID, or raising its error;
+            None if the show has no worker and BOOKING_MAX_WORKERS shows do
+
+        Raises:
+            ValueError: If no seats are given
+            BookingQueueError: If BOOKING_QUEUE_MAX_DEPTH requests are already queued
+        """
+        seat_ids = list(dict.fromkeys(seat_ids))
+        if not seat_ids:
+            raise ValueError("Please select at least one seat")
+
+        ScheduleImportService.ensure_show_seats(show_id)
+        request = BookingRequest(
+            customer_id, show_id, seat_ids, session_id or customer_id, event_id, Future(),
+            tracer.current_span(), current_commit_timer()
+        )
+        max_depth = current_app.config.get('BOOKING_QUEUE_MAX_DEPTH', 500)
+        max_workers = current_app.config.get('BOOKING_MAX_WORKERS', 32)
+
+        with self._lock:
+            requests = self._queues.get(show_id)
+            if requests is None:
+                if len(self._queues) >= max_workers:
+                    return None
+                requests = self._queues[show_id] = queue.Queue()
+                threading.Thread(
+                    target=self._run,
+                    args=(current_app._get_current_object(), show_id, requests),
+                    name=f'booking-{show_id}', daemon=True
+                ).start()
+
+            if requests.qsize() >= max_depth:
+                raise BookingQueueError(
+                    "Request failed due to high concurrent traffic. Please try again."
+                )
+            requests.put(request)
+
+        return request.future
+
+    def queue_depths(self):
+        """Get {show_id: queued requests} for shows with a worker"""
+        with self._lock:
+            return {show_id: requests.qsize() for show_id, requests in self._queues.items()}
+
+    def _run(self, app, show_id, requests):
+        """Worker loop: drain the show's queue in batches until it stays idle"""
+        idle_seconds = app.config.get('BOOKING_WORKER_IDLE_SECONDS', 30)
+        batch_size = app.config.get('BOOKING_BATCH_SIZE', 16)
+
+        while True:
+            try:
+                batch = [requests.get(timeout=idle_seconds)]
+            except queue.Empty:
+                # submit() queues under the same lock, so nothing can slip in after this check
+                with self._lock:
+                    if requests.empty():
+                        del self._queues[show_id]
+                        return
+                continue
+
+            while len(batch) < batch_size:
+                try:
+                    batch.append(requests.get_nowait())
+                except queue.Empty:
+                    break
+
+            # Skip requests their callers withdrew while they were queued
+            batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            # The batch joins the trace of its first sampled request
+            parent = next((request.span for request in batch if request.span is not None), None)
+            with app.app_context(), tracer.span(
+                'BookingDispatcher.batch', parent=parent, show_id=str(show_id), batch_size=len(batch),
+                seat_count=sum(len(request.seat_ids) for request in batch)
+            ):
+                try:
+                    outcomes = self._apply(show_id, batch)
+                except Exception as e:
+                    app.logger.exception("Booking worker for show %s failed", show_id)
+                    outcomes = [(request, e) for request in batch]
+                finally:
+                    db.session.remove()
+
+            # Wake the callers only once the batch span has ended, so it is
+            # in their trace before their request finishes and exports it
+            for request, outcome in outcomes:
+                if isinstance(outcome, Exception):
+                    request.future.set_exception(outcome)
+                else:
+                    request.future.set_result(outcome)
+
+    def _apply(self, show_id, batch):
+        """
+        Book a batch in one transaction
+        Returns (request, booking ID or exception) pairs; the caller resolves the futures
+        """
+        try:
+            with commit_timer() as timer, contention_stats.track(
+                show_id, requests=[request.seat_ids for request in batch]
+            ) as observation:
+                results = run_in_transaction(observation.counted(lambda: self._book_batch(show_id, batch)))
+                for request, result in zip(batch, results):
+                    if isinstance(result, Exception):
+                        observation.reject(request.seat_ids)
+        except AmbiguousCommitError as e:
+            # The commit may have gone through: keep the bookings that exist
+            results = [
+                result if isinstance(result, Exception) or db.session.get(Booking, result) is not None else e
+                for result in e.result
+            ]
+        except TransactionRetryError as e:
+            return [(request, e) for request in batch]
+        except Exception as e:
+            if len(batch) == 1:
+                return [(batch[0], e)]
+            # One bad request must not fail the rest: book them one by one
+            db.session.rollback()
+            return [outcome for request in batch for outcome in self._apply(show_id, [request])]
+
+        booked = [
+            seat_id
+            for request, result in zip(batch, results)
+            if not isinstance(result, Exception)
+            for seat_id in request.seat_ids
+        ]
+        if booked:
+            ConcurrentBookingService.record_seat_change(show_id, booked, booked=True)
+
+        # Report the batch's commit to the callers measuring theirs (admission control)
+        for request in batch:
+            if request.commit_timer is not None:
+                request.commit_timer.add(timer.seconds, timer.commits)
+
+        return list(zip(batch, results))
+
+    def _book_batch(self, show_id, batch):
+        """
+        Run the batch's bookings in the current transaction
+        Returns one booking ID or ValueError per request; does not commit
+        """
+        requested = {seat_id for request in batch for seat_id in request.seat_ids}
+        with lock_wait():
+            available = set(db.session.execute(
+                select(ShowSeat.seat_id)
+                .where(
+                    and_(
+                        ShowSeat.show_id == show_id,
+                        ShowSeat.seat_id.in_(requested),
+                        ShowSeat.is_available == True
+                    )
+                )
+                .with_for_update()
+            ).scalars())
+
+        results = []
+        for request in batch:
+            taken = [seat_id for seat_id in request.seat_ids if seat_id not in available]
+            if taken:
+                results.append(ValueError(f"Seats not available: {', '.join(taken)}"))
+                continue
+
+            results.append(ConcurrentBookingService._book_seats(
+                request.customer_id, show_id, request.seat_ids, request.locked_by, request.event_id
+            ))
+            available.difference_update(request.seat_ids)
+
+        return results
+
+
+booking_dispatcher = BookingDispatcher()
@@ -4,12 +4,18 @@ Booking service - business logic for bookings
 from app.models.booking import Booking
 from app.models.booking_seat import BookingSeat
 from app.models.show import Show
+from app.models.seat import Seat
+from app.models.auditorium import Auditorium
 from app.extensions import db
-from app.services.seat_service import SeatService
-import uuid
-from datetime import datetime
+from app.services.pagination import paginate
+from app.services.concurrent_booking_service import ConcurrentBookingService
+from app.services.booking_dispatcher import booking_dispatcher
+from app.tracing import traced
+from flask import current_app
+from sqlalchemy.orm import contains_eager
 
 
+@traced
 class BookingService:
     """Service for booking operations"""
 
@@ -17,53 +23,20 @@ class BookingService:
     def create_booking(customer_id, show_id, event_id, seat_ids):
         """
         Create a new booking with seats
-        Uses transaction to ensure atomicity
-        """
-        try:
-            # Get show to calculate price
-            show = Show.query.filter(
-                db.and_(Show.show_id == show_id, Show.event_id == event_id)
-            ).first()
-
-            if not show:
-                raise ValueError("Show not found")
-
-            # Verify seats are available
-            if not SeatService.are_seats_available(seat_ids, show_id):
-                raise ValueError("One or more seats are not available")
-
-            # Calculate total amount
-            num_seats = len(seat_ids)
-            total_amount = show.price * num_seats
-
-            # Create booking
-            booking_id = f"BKG-{uuid.uuid4().hex[:8].upper()}"
-            booking = Booking(
-                booking_id=booking_id,
-                customer_id=customer_id,
-                show_id=show_id,
-                total_amount=total_amount,
-                booked_at=datetime.now()
-            )
-
-            db.session.add(booking)
-
-            # Create booking_seats entries
-            for seat_id in seat_ids:
-                booking_seat = BookingSeat(
-                    id=f"BS-{uuid.uuid4().hex[:8].upper()}",
-                    booking_id=booking_id,
-                    seat_id=seat_id
-                )
-                db.session.add(booking_seat)
+        Claims the seats with the same set-based, conditional UPDATE path as
+        ConcurrentBookingService, so the cost is constant in the number of seats.
+        With BOOKING_DISPATCHER_ENABLED the booking goes through the show's
+        single-writer queue, batched with other bookings for the same show.
 
-            db.session.commit()
-
-            return booking
+        Raises:
+            ValueError: If the show is not found for the event or seats are unavailable
+        """
+        if current_app.config.get('BOOKING_DISPATCHER_ENABLED', False):
+            return booking_dispatcher.book(customer_id, show_id, seat_ids, event_id=event_id)
 
-        except Exception as e:
-            db.session.rollback()
-            raise e
+        return ConcurrentBookingService.create_booking_set_based(
+            customer_id, show_id, seat_ids, event_id=event_id
+        )
 
     @staticmethod
     def get_booking_by_id(booking_id):
@@ -100,46 +73,93 @@ class BookingService:
     @staticmethod
     def cancel_booking(booking_id):
         """
-        Cancel a booking (delete booking and booking_seats)
+        Cancel a booking (delete booking and booking_seats, release its show_seats)
         Note: This is a simple implementation. In production, you might want soft deletes
         """
-        try:
-            # Delete booking_seats first (foreign key constraint)
-            BookingSeat.query.filter(
-                BookingSeat.booking_id == booking_id
-            ).delete()
-
-            # Delete booking
-            Booking.query.filter(Booking.booking_id == booking_id).delete()
-
-            db.session.commit()
-            return True
-
-        except Exception as e:
-            db.session.rollback()
-            raise e
+        return ConcurrentBookingService.cancel_booking(booking_id)
 
     @staticmethod
     def get_booking_with_show_details(booking_id):
         """Get booking with show and event details"""
-        booking = Booking.query.get(booking_id)
-        if not booking:
-            return None
+        bookings = BookingService._query_with_show_details().filter(
+            Booking.booking_id == booking_id
+        ).all()
 
-        # Get show details
-        show = Show.query.filter(Show.show_id == booking.show_id).first()
+        history = BookingService._with_seats(bookings)
+        return history[0] if history else None
 
-        # Get seats
-        booking_seats = BookingSeat.query.filter(
-            BookingSeat.booking_id == booking_id
-        ).all()
-        seats = [bs.seat for bs in booking_seats]
+    @staticmethod
+    def get_booking_history(customer_id, cursor=None, limit=None):
+        """
+        Get one page of a customer's bookings, newest first, with show details
+
+        Runs two queries regardless of page size: bookings joined to their
+        show, event, auditorium and theater, then the seats of every booking
+        on the page. Pages follow a keyset cursor over (booked_at, booking_id),
+        served by the ix_bookings_customer_booked_at index.
+
+        Args:
+            customer_id: Customer whose bookings to load
+            cursor: Cursor from the previous page, None for the first page
+            limit: Bookings per page, defaults to DEFAULT_PAGE_SIZE
+
+        Returns:
+            Dict with 'bookings' (same shape as get_booking_with_show_details)
+            and 'next_cursor' (None on the last page)
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        page = paginate(
+            BookingService._query_with_show_details().filter(Booking.customer_id == customer_id),
+            (Booking.booked_at, Booking.booking_id), cursor, limit, descending=True
+        )
 
         return {
-            'booking': booking,
-            'show': show,
-            'event': show.event if show else None,
-            'auditorium': show.auditorium if show else None,
-            'theater': show.auditorium.theater if show and show.auditorium else None,
-            'seats': seats
+            'bookings': BookingService._with_seats(page.items),
+            'next_cursor': page.next_cursor
         }
+
+    @staticmethod
+    def _query_with_show_details():
+        """Bookings query that loads show, event, auditorium and theater in the same statement"""
+        return (
+            Booking.query
+            .outerjoin(Booking.show)
+            .outerjoin(Show.event)
+            .outerjoin(Show.auditorium)
+            .outerjoin(Auditorium.theater)
+            .options(
+                contains_eager(Booking.show).contains_eager(Show.event),
+                contains_eager(Booking.show).contains_eager(Show.auditorium).contains_eager(Auditorium.theater)
+            )
+        )
+
+    @staticmethod
+    def _with_seats(bookings):
+        """Attach seats to loaded bookings with one query for all of them"""
+        seats_by_booking = {booking.booking_id: [] for booking in bookings}
+
+        if seats_by_booking:
+            rows = db.session.query(BookingSeat.booking_id, Seat).join(
+                Seat, Seat.seat_id == BookingSeat.seat_id
+            ).filter(
+                BookingSeat.booking_id.in_(list(seats_by_booking))
+            ).order_by(BookingSeat.id).all()
+
+            for booking_id, seat in rows:
+                seats_by_booking[booking_id].append(seat)
+
+        history = []
+        for booking in bookings:
+            show = booking.show
+            history.append({
+                'booking': booking,
+                'show': show,
+                'event': show.event if show else None,
+                'auditorium': show.auditorium if show else None,
+                'theater': show.auditorium.theater if show and show.auditorium else None,
+                'seats': seats_by_booking[booking.booking_id]
+            })
+
+        return history
@@ -8,136 +8,457 @@ from app.models.show import Show
 from app.models.show_seat import ShowSeat
 from app.models.seat import Seat
 from app.extensions import db
-from sqlalchemy import and_
+from app.ids import new_id, new_ids
+from app.services.seat_state_store import seat_state_store
+from app.services.lock_sweeper import lock_sweeper
+from app.services.contention_stats import contention_stats, lock_wait
+from app.services.schedule_import_service import ScheduleImportService
+from app.services.transaction_runner import AmbiguousCommitError, run_in_transaction
+from app.tracing import traced
+from flask import current_app
+from sqlalchemy import and_, or_, insert, literal, select, update
 from sqlalchemy.exc import IntegrityError
-import uuid
 import os
 from datetime import datetime, timedelta
 
 
+# Booking engine modes (see BOOKING_ENGINE_MODE in config)
+MODE_ROW_LOCKING = 'row_locking'
+MODE_SET_BASED = 'set_based'
+
+
+@traced
 class ConcurrentBookingService:
     """Service for concurrent-safe booking operations"""
 
     @staticmethod
-    def create_booking_with_concurrency_control(customer_id, show_id, seat_ids, session_id=None):
+    def create_booking_with_concurrency_control(customer_id, show_id, seat_ids, session_id=None, mode=None):
         """
-        Create a booking with full concurrency control using SELECT FOR UPDATE
+        Create a booking with full concurrency control
 
-        This prevents race conditions where two users try to book the same seat simultaneously
+        This prevents race conditions where two users try to book the same seat simultaneously.
+        In 'set_based' mode the seats are claimed with one conditional UPDATE,
+        in 'row_locking' mode they are locked with SELECT FOR UPDATE and updated row by row.
 
         Args:
             customer_id: ID of the customer making the booking
             show_id: ID of the show
             seat_ids: List of seat IDs to book
             session_id: Optional session ID for tracking
+            mode: Booking engine mode, defaults to BOOKING_ENGINE_MODE
 
         Returns:
             Booking object if successful
 
         Raises:
             ValueError: If seats are unavailable or show not found
-            IntegrityError: If concurrent booking conflict occurs
+            TransactionRetryError: If concurrent booking conflicts exhaust the retry budget
         """
+        mode = mode or current_app.config.get('BOOKING_ENGINE_MODE', MODE_SET_BASED)
+        if mode == MODE_SET_BASED:
+            return ConcurrentBookingService.create_booking_set_based(
+                customer_id, show_id, seat_ids, session_id=session_id
+            )
+
+        ScheduleImportService.ensure_show_seats(show_id)
 
         # Use CockroachDB serializable transaction for strongest consistency
         # This ensures no two transactions can book the same seat
 
-        max_retries = 3
-        retry_count = 0
-
-        while retry_count < max_retries:
-            try:
-                # Start a new transaction
-                with db.session.begin_nested():
-
-                    # Step 1: Verify show exists and get price
-                    show = Show.query.filter(Show.show_id == show_id).first()
-                    if not show:
-                        raise ValueError(f"Show {show_id} not found")
-
-                    # Step 2: Lock and check seat availability using SELECT FOR UPDATE
-                    # This is the critical section that prevents double-booking
-                    show_seats = (
-                        ShowSeat.query
-                        .filter(
-                            and_(
-                                ShowSeat.show_id == show_id,
-                                ShowSeat.seat_id.in_(seat_ids)
-                            )
+        def lock_and_book():
+            # Step 1: Verify show exists and get price
+            show = Show.query.filter(Show.show_id == show_id).first()
+            if not show:
+                raise ValueError(f"Show {show_id} not found")
+
+            # Step 2: Lock and check seat availability using SELECT FOR UPDATE
+            # This is the critical section that prevents double-booking
+            with lock_wait():
+                show_seats = (
+                    ShowSeat.query
+                    .filter(
+                        and_(
+                            ShowSeat.show_id == show_id,
+                            ShowSeat.seat_id.in_(seat_ids)
                         )
-                        .with_for_update()  # Row-level lock in CockroachDB
-                        .all()
                     )
+                    .with_for_update()  # Row-level lock in CockroachDB
+                    .all()
+                )
 
-                    # Verify we got all requested seats
-                    if len(show_seats) != len(seat_ids):
-                        found_seat_ids = {ss.seat_id for ss in show_seats}
-                        missing = set(seat_ids) - found_seat_ids
-                        raise ValueError(f"Seats not found for this show: {missing}")
-
-                    # Check if any seat is already booked
-                    unavailable_seats = [
-                        ss.seat_id for ss in show_seats if not ss.is_available
-                    ]
-                    if unavailable_seats:
-                        raise ValueError(
-                            f"Seats already booked: {', '.join(unavailable_seats)}"
-                        )
+            # Verify we got all requested seats
+            if len(show_seats) != len(seat_ids):
+                found_seat_ids = {ss.seat_id for ss in show_seats}
+                missing = set(seat_ids) - found_seat_ids
+                raise ValueError(f"Seats not found for this show: {missing}")
+
+            # Check if any seat is already booked
+            unavailable_seats = [
+                ss.seat_id for ss in show_seats if not ss.is_available
+            ]
+            if unavailable_seats:
+                raise ValueError(
+                    f"Seats already booked: {', '.join(unavailable_seats)}"
+                )
+
+            # Step 3: Create the booking
+            booking_id = new_id('BKG')
+            total_amount = show.price * len(seat_ids)
+
+            booking = Booking(
+                booking_id=booking_id,
+                customer_id=customer_id,
+                show_id=show_id,
+                total_amount=total_amount,
+                booked_at=datetime.now()
+            )
+            db.session.add(booking)
+
+            # Step 4: Mark seats as unavailable and increment version (optimistic lock)
+            for show_seat in show_seats:
+                show_seat.is_available = False
+                show_seat.booking_id = booking_id
+                show_seat.locked_at = datetime.now()
+                show_seat.locked_by = session_id or customer_id
+                show_seat.version += 1
+
+            # Step 5: Create booking_seat junction records
+            for booking_seat_id, seat_id in zip(new_ids('BS', len(seat_ids)), seat_ids):
+                booking_seat = BookingSeat(
+                    id=booking_seat_id,
+                    booking_id=booking_id,
+                    seat_id=seat_id
+                )
+                db.session.add(booking_seat)
+
+            return booking
+
+        # Serialization failures and concurrent modifications are retried with backoff
+        try:
+            with contention_stats.track(show_id, seat_ids) as observation:
+                booking = run_in_transaction(observation.counted(lock_and_book), retry_on=(IntegrityError,))
+        except AmbiguousCommitError as e:
+            booking = ConcurrentBookingService._committed_booking(e)
+        ConcurrentBookingService.record_seat_change(show_id, seat_ids, booked=True)
+        return booking
 
-                    # Step 3: Create the booking
-                    booking_id = f"BKG-{uuid.uuid4().hex[:8].upper()}"
-                    total_amount = show.price * len(seat_ids)
+    @staticmethod
+    def create_booking_set_based(customer_id, show_id, seat_ids, session_id=None, event_id=None):
+        """
+        Create a booking using set-based statements in a single transaction
+
+        Instead of loading and locking ShowSeat objects, the transaction issues:
+          1. INSERT INTO bookings ... SELECT price * n FROM shows (also verifies the show)
+          2. UPDATE show_seats ... WHERE is_available AND seat_id IN (...) RETURNING seat_id
+          3. one multi-row INSERT INTO booking_seats
+
+        The booking is rejected when the UPDATE claims fewer rows than requested,
+        so seats are only ever locked for the duration of three statements.
+
+        Args:
+            customer_id: ID of the customer making the booking
+            show_id: ID of the show
+            seat_ids: List of seat IDs to book
+            session_id: Optional session ID for tracking
+            event_id: Optional event ID the show must belong to
 
-                    booking = Booking(
-                        booking_id=booking_id,
-                        customer_id=customer_id,
-                        show_id=show_id,
-                        total_amount=total_amount,
-                        booked_at=datetime.now()
+        Returns:
+            Booking object if successful
+
+        Raises:
+            ValueError: If seats are unavailable or show not found
+            TransactionRetryError: If serialization failures exhaust the retry budget
+        """
+        seat_ids = list(dict.fromkeys(seat_ids))
+        if not seat_ids:
+            raise ValueError("Please select at least one seat")
+
+        ScheduleImportService.ensure_show_seats(show_id)
+        try:
+            with contention_stats.track(show_id, seat_ids) as observation:
+                booking_id = run_in_transaction(observation.counted(
+                    lambda: ConcurrentBookingService._book_seats(
+                        customer_id, show_id, seat_ids, session_id or customer_id, event_id
                     )
-                    db.session.add(booking)
-
-                    # Step 4: Mark seats as unavailable and increment version (optimistic lock)
-                    for show_seat in show_seats:
-                        show_seat.is_available = False
-                        show_seat.booking_id = booking_id
-                        show_seat.locked_at = datetime.now()
-                        show_seat.locked_by = session_id or customer_id
-                        show_seat.version += 1
-
-                    # Step 5: Create booking_seat junction records
-                    for seat_id in seat_ids:
-                        booking_seat = BookingSeat(
-                            id=f"BS-{uuid.uuid4().hex[:8].upper()}",
-                            booking_id=booking_id,
-                            seat_id=seat_id
-                        )
-                        db.session.add(booking_seat)
+                ))
+        except AmbiguousCommitError as e:
+            booking_id = ConcurrentBookingService._committed_booking(e).booking_id
+        ConcurrentBookingService.record_seat_change(show_id, seat_ids, booked=True)
+        return db.session.get(Booking, booking_id)
+
+    @staticmethod
+    def _committed_booking(error):
+        """
+        Look up the booking of a transaction whose commit outcome was unknown
+        Returns the Booking if it did commit; re-raises the AmbiguousCommitError otherwise
+        """
+        booking_id = getattr(error.result, 'booking_id', error.result)
+        booking = db.session.get(Booking, booking_id) if booking_id else None
+        if booking is None:
+            raise error
+        return booking
+
+    @staticmethod
+    def _book_seats(customer_id, show_id, seat_ids, locked_by, event_id=None):
+        """
+        Run the set-based booking statements in the current transaction
+        Does not commit; the caller owns the transaction. Returns the new booking's ID
+        """
+        booking_id = new_id('BKG')
+        booked_at = datetime.now()
 
-                # Commit the transaction
-                db.session.commit()
+        ConcurrentBookingService._insert_booking(
+            booking_id, customer_id, show_id, len(seat_ids), booked_at, event_id
+        )
+
+        # Claim every requested seat in one conditional UPDATE
+        claimed = ConcurrentBookingService._update_seats(
+            show_id, seat_ids,
+            [ShowSeat.is_available == True],
+            is_available=False,
+            booking_id=booking_id,
+            locked_at=booked_at,
+            locked_by=locked_by
+        )
+        ConcurrentBookingService._require_all(seat_ids, claimed, "Seats not available")
 
-                return booking
+        ConcurrentBookingService._insert_booking_seats(booking_id, seat_ids)
 
-            except IntegrityError as e:
-                # Concurrent modification detected, retry
-                db.session.rollback()
-                retry_count += 1
+        return booking_id
+
+    @staticmethod
+    def place_hold(show_id, seat_ids, ttl_seconds=None):
+        """
+        Hold seats for checkout in one short transaction
+
+        Available seats (or seats whose previous hold expired) are marked
+        unavailable and tagged with a new hold token in locked_by.
+        The hold is later turned into a booking by confirm_hold().
+
+        Args:
+            show_id: ID of the show
+            seat_ids: List of seat IDs to hold
+            ttl_seconds: Hold lifetime, defaults to SEAT_HOLD_TTL_SECONDS
 
-                if retry_count >= max_retries:
-                    raise ValueError(
-                        "Booking failed due to high concurrent traffic. Please try again."
-                    ) from e
+        Returns:
+            (hold_token, expires_at) tuple
 
-                # Small backoff before retry
-                import time
-                time.sleep(0.1 * retry_count)
+        Raises:
+            ValueError: If any seat is unavailable
+        """
+        seat_ids = list(dict.fromkeys(seat_ids))
+        if not seat_ids:
+            raise ValueError("Please select at least one seat")
+
+        ScheduleImportService.ensure_show_seats(show_id)
+        ttl = timedelta(seconds=ttl_seconds or current_app.config.get('SEAT_HOLD_TTL_SECONDS', 600))
+        hold_token = new_id('HOLD')
+        held_at = datetime.now()
+
+        def hold():
+            held = ConcurrentBookingService._update_seats(
+                show_id, seat_ids,
+                [or_(
+                    ShowSeat.is_available == True,
+                    and_(ShowSeat.booking_id == None, ShowSeat.locked_at < held_at - ttl)
+                )],
+                is_available=False,
+                locked_at=held_at,
+                locked_by=hold_token
+            )
+            ConcurrentBookingService._require_all(seat_ids, held, "Seats not available")
 
-            except Exception as e:
-                db.session.rollback()
-                raise e
+        run_in_transaction(hold)
+        ConcurrentBookingService.record_seat_change(show_id, seat_ids, booked=True)
 
-        raise ValueError("Booking failed after maximum retries")
+        return hold_token, held_at + ttl
+
+    @staticmethod
+    def confirm_hold(customer_id, show_id, seat_ids, hold_token, ttl_seconds=None):
+        """
+        Turn a seat hold into a booking
+
+        The held seats are confirmed with a single UPDATE that checks the hold
+        token and expiry, so no availability checks or row locks are needed.
+        Confirmations do not go through the booking dispatcher even when it is
+        enabled: they only touch rows their own hold owns, so they do not
+        compete with other bookings for the show.
+
+        Args:
+            customer_id: ID of the customer making the booking
+            show_id: ID of the show
+            seat_ids: List of held seat IDs
+            hold_token: Token returned by place_hold()
+            ttl_seconds: Hold lifetime, defaults to SEAT_HOLD_TTL_SECONDS
+
+        Returns:
+            Booking object if successful
+
+        Raises:
+            ValueError: If the hold expired or does not cover the seats
+        """
+        seat_ids = list(dict.fromkeys(seat_ids))
+        if not seat_ids:
+            raise ValueError("Please select at least one seat")
+
+        ttl = timedelta(seconds=ttl_seconds or current_app.config.get('SEAT_HOLD_TTL_SECONDS', 600))
+
+        try:
+            with contention_stats.track(show_id, seat_ids) as observation:
+                booking_id = run_in_transaction(observation.counted(
+                    lambda: ConcurrentBookingService._book_held_seats(
+                        customer_id, show_id, seat_ids, hold_token, ttl
+                    )
+                ))
+        except AmbiguousCommitError as e:
+            booking_id = ConcurrentBookingService._committed_booking(e).booking_id
+        ConcurrentBookingService.record_seat_change(show_id, seat_ids, booked=True)
+        return db.session.get(Booking, booking_id)
+
+    @staticmethod
+    def _book_held_seats(customer_id, show_id, seat_ids, hold_token, ttl):
+        """
+        Run the hold confirmation statements in the current transaction
+        Does not commit; the caller owns the transaction. Returns the new booking's ID
+        """
+        booking_id = new_id('BKG')
+        booked_at = datetime.now()
+
+        ConcurrentBookingService._insert_booking(
+            booking_id, customer_id, show_id, len(seat_ids), booked_at
+        )
+
+        confirmed = ConcurrentBookingService._update_seats(
+            show_id, seat_ids,
+            [
+                ShowSeat.locked_by == hold_token,
+                ShowSeat.booking_id == None,
+                ShowSeat.locked_at >= booked_at - ttl
+            ],
+            booking_id=booking_id
+        )
+        ConcurrentBookingService._require_all(
+            seat_ids, confirmed, "Your seat hold has expired. Please select your seats again"
+        )
+
+        ConcurrentBookingService._insert_booking_seats(booking_id, seat_ids)
+
+        return booking_id
+
+    @staticmethod
+    def release_hold(show_id, hold_token):
+        """
+        Release seats still held under a hold token (e.g. when the user changes seats)
+
+        Returns:
+            Number of seats released
+        """
+        def release():
+            return db.session.execute(
+                update(ShowSeat)
+                .where(
+                    and_(
+                        ShowSeat.show_id == show_id,
+                        ShowSeat.locked_by == hold_token,
+                        ShowSeat.booking_id == None
+                    )
+                )
+                .values(
+                    is_available=True,
+                    locked_at=None,
+                    locked_by=None,
+                    version=ShowSeat.version + 1
+                )
+                .returning(ShowSeat.seat_id)
+                .execution_options(synchronize_session=False)
+            ).scalars().all()
+
+        released = run_in_transaction(release)
+        ConcurrentBookingService.record_seat_change(show_id, released, booked=False)
+        return len(released)
+
+    @staticmethod
+    def _update_seats(show_id, seat_ids, conditions, **values):
+        """
+        Apply one conditional UPDATE to a show's seats, bumping their version
+        Returns the IDs of the seats it matched
+        """
+        with lock_wait():
+            return db.session.execute(
+                update(ShowSeat)
+                .where(
+                    and_(
+                        ShowSeat.show_id == show_id,
+                        ShowSeat.seat_id.in_(seat_ids),
+                        *conditions
+                    )
+                )
+                .values(version=ShowSeat.version + 1, **values)
+                .returning(ShowSeat.seat_id)
+                .execution_options(synchronize_session=False)
+            ).scalars().all()
+
+    @staticmethod
+    def _require_all(seat_ids, matched, message):
+        """Raise ValueError naming the seats an UPDATE did not match"""
+        if len(matched) != len(seat_ids):
+            matched = set(matched)
+            missing = [seat_id for seat_id in seat_ids if seat_id not in matched]
+            raise ValueError(f"{message}: {', '.join(missing)}")
+
+    @staticmethod
+    def record_seat_change(show_id, seat_ids, booked):
+        """
+        Reflect a committed seat change in the shared seat state store
+        Failures are only logged; the store heals itself from show_seats versions
+        """
+        try:
+            seat_state_store.apply_change(show_id, seat_ids, booked)
+        except Exception:
+            current_app.logger.exception("Failed to update seat state for show %s", show_id)
+
+    @staticmethod
+    def _insert_booking(booking_id, customer_id, show_id, num_seats, booked_at, event_id=None):
+        """
+        Insert a booking priced from the show in one INSERT ... SELECT
+        Raises ValueError if the show does not exist (or is not for event_id)
+        """
+        conditions = [Show.show_id == show_id]
+        if event_id is not None:
+            conditions.append(Show.event_id == event_id)
+
+        total_amount = db.session.execute(
+            insert(Booking)
+            .from_select(
+                ['booking_id', 'customer_id', 'show_id', 'total_amount', 'booked_at'],
+                select(
+                    literal(booking_id),
+                    literal(customer_id),
+                    Show.show_id,
+                    Show.price * num_seats,
+                    literal(booked_at)
+                ).where(*conditions)
+            )
+            .returning(Booking.total_amount)
+        ).scalar()
+
+        if total_amount is None:
+            raise ValueError(f"Show {show_id} not found")
+
+    @staticmethod
+    def _insert_booking_seats(booking_id, seat_ids):
+        """Insert all booking_seats rows for a booking with one multi-row INSERT"""
+        db.session.execute(
+            insert(BookingSeat),
+            [
+                {
+                    'id': booking_seat_id,
+                    'booking_id': booking_id,
+                    'seat_id': seat_id
+                }
+                for booking_seat_id, seat_id in zip(new_ids('BS', len(seat_ids)), seat_ids)
+            ]
+        )
 
     @staticmethod
     def get_available_seats_for_show(show_id):
@@ -191,7 +512,7 @@ class ConcurrentBookingService:
         Returns:
             True if successful
         """
-        try:
+        def release_and_delete():
             booking = Booking.query.get(booking_id)
             if not booking:
                 raise ValueError(f"Booking {booking_id} not found")
@@ -216,78 +537,42 @@ class ConcurrentBookingService:
             # Delete booking
             db.session.delete(booking)
 
-            db.session.commit()
-            return True
+            return booking.show_id, [ss.seat_id for ss in show_seats]
 
-        except Exception as e:
-            db.session.rollback()
-            raise e
+        show_id, released = run_in_transaction(release_and_delete)
+        ConcurrentBookingService.record_seat_change(show_id, released, booked=False)
+        return True
 
     @staticmethod
     def initialize_show_seats(show_id, auditorium_id):
         """
         Initialize show_seats for a new show
-        Creates a ShowSeat entry for each seat in the auditorium
+        Creates a ShowSeat entry for each seat in the auditorium with one INSERT ... SELECT
+        Safe to re-run: seats that already have a ShowSeat are skipped
 
         Args:
             show_id: ID of the show
             auditorium_id: ID of the auditorium
         """
-        try:
-            # Get all seats for the auditorium
-            seats = Seat.query.filter(Seat.auditorium_id == auditorium_id).all()
-
-            # Create ShowSeat for each seat
-            for seat in seats:
-                show_seat = ShowSeat(
-                    id=f"SS-{uuid.uuid4().hex[:8].upper()}",
-                    show_id=show_id,
-                    seat_id=seat.seat_id,
-                    is_available=True,
-                    version=0
-                )
-                db.session.add(show_seat)
-
-            db.session.commit()
-
-            return len(seats)
-
-        except Exception as e:
-            db.session.rollback()
-            raise e
+        result = ScheduleImportService.import_show_seats([(show_id, auditorium_id)], workers=1)
+        return result['inserted']
 
     @staticmethod
-    def cleanup_expired_locks(lock_timeout_minutes=15):
+    def cleanup_expired_locks(lock_timeout_minutes=15, show_id=None):
         """
         Clean up any stale locks (seats locked but booking not completed)
-        This is a safety mechanism for abandoned bookings
+        This is a safety mechanism for abandoned bookings; the background
+        lock sweeper does the same on a schedule
 
         Args:
             lock_timeout_minutes: Number of minutes after which a lock is considered stale
-        """
-        try:
-            timeout = datetime.now() - timedelta(minutes=lock_timeout_minutes)
+            show_id: Only clean up this show's seats
 
-            # Find show_seats that are locked but have no booking
-            # and were locked more than timeout_minutes ago
-            stale_locks = ShowSeat.query.filter(
-                and_(
-                    ShowSeat.is_available == False,
-                    ShowSeat.booking_id == None,
-                    ShowSeat.locked_at < timeout
-                )
-            ).all()
-
-            for show_seat in stale_locks:
-                show_seat.is_available = True
-                show_seat.locked_at = None
-                show_seat.locked_by = None
-                show_seat.version += 1
-
-            db.session.commit()
-
-            return len(stale_locks)
-
-        except Exception as e:
-            db.session.rollback()
-            raise e
+        Returns:
+            Number of seats released
+        """
+        report = lock_sweeper.sweep(
+            show_id=show_id,
+            lock_timeout_seconds=lock_timeout_minutes * 60
+        )
+        return report['released']
@@ -0,0 +1,290 @@
+"""
+Contention stats - per-show and per-seat-block booking conflict telemetry
+
+Every booking transaction is observed while it runs, and the result is
+added to its show's totals and to the totals of each seat block it touched:
+  - attempts and serialization retries (attempts beyond the first)
+  - rejections (seats already taken) and failures (retry budget exhausted
+    or an unexpected error)
+  - lock wait: time spent in the statements that lock or claim seat rows
+  - commit latency of successful bookings: the RELEASE SAVEPOINT and
+    COMMIT of the transaction that booked them (a batch's commit counts
+    for each of its bookings)
+
+A seat block is CONTENTION_BLOCK_SIZE consecutive seats of the show's seat
+map, by ordinal (the same ordinals the seat map JSON uses).
+
+Cardinality is bounded: at most CONTENTION_MAX_SHOWS shows are tracked,
+and a new show evicts the one with the least recent contention. Each show
+keeps a heat score that decays with a half-life of
+CONTENTION_HALF_LIFE_SECONDS, so a show that was hot last week does not
+outrank one heating up now, while a long tail of quiet ones comes and
+goes. report() ranks the shows and their blocks by total contention
+(retries + rejections + failures). State is per process.
+"""
+from app.services.seat_state_store import seat_state_store
+from app.services.transaction_runner import TransactionRetryError, commit_timer
+from flask import current_app
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+import threading
+import time
+
+
+class Observation:
+    """One booking transaction in progress (a dispatcher batch counts as one)"""
+
+    def __init__(self, show_id, requests):
+        self.show_id = show_id
+        self.requests = [list(seat_ids) for seat_ids in requests]
+        self.attempts = 0
+        self.lock_wait = 0.0
+        self.commit_seconds = 0.0
+        self.rejected = []
+
+    @property
+    def seat_ids(self):
+        return list(dict.fromkeys(seat_id for seat_ids in self.requests for seat_id in seat_ids))
+
+    def counted(self, work):
+        """Wrap a transaction's work function to count its attempts"""
+        @functools.wraps(work)
+        def wrapper(*args, **kwargs):
+            self.attempts += 1
+            return work(*args, **kwargs)
+        return wrapper
+
+    def reject(self, seat_ids):
+        """Record one request of a batch that was refused because its seats were taken"""
+        self.rejected.append(list(seat_ids))
+
+
+class Counters:
+    __slots__ = (
+        'attempts', 'retries', 'bookings', 'rejections', 'failures',
+        'lock_wait_seconds', 'lock_wait_max', 'commit_seconds', 'commit_max'
+    )
+
+    def __init__(self):
+        self.attempts = 0
+        self.retries = 0
+        self.bookings = 0
+        self.rejections = 0
+        self.failures = 0
+        self.lock_wait_seconds = 0.0
+        self.lock_wait_max = 0.0
+        self.commit_seconds = 0.0
+        self.commit_max = 0.0
+
+    def score(self):
+        """How contended: conflicts first, then load"""
+        return (self.retries + self.rejections + self.failures, self.attempts)
+
+    def to_dict(self):
+        return {
+            'attempts': self.attempts,
+            'retries': self.retries,
+            'retry_ratio': round(self.retries / self.attempts, 4) if self.attempts else 0.0,
+            'bookings': self.bookings,
+            'rejections': self.rejections,
+            'failures': self.failures,
+            'lock_wait_seconds_total': round(self.lock_wait_seconds, 6),
+            'lock_wait_seconds_max': round(self.lock_wait_max, 6),
+            'commit_latency_seconds_mean': (
+                round(self.commit_seconds / self.bookings, 6) if self.bookings else 0.0
+            ),
+            'commit_latency_seconds_max': round(self.commit_max, 6)
+        }
+
+
+class ShowContention:
+    """One show's totals and its per-block totals"""
+
+    def __init__(self):
+        self.totals = Counters()
+        self.blocks = {}
+        # Exponentially decayed (conflicts, attempts), as of heated_at
+        self.heat = (0.0, 0.0)
+        self.heated_at = time.monotonic()
+
+    def current_heat(self, now, half_life):
+        """The decayed heat at time.monotonic() now"""
+        decay = 0.5 ** (max(0.0, now - self.heated_at) / half_life)
+        return (self.heat[0] * decay, self.heat[1] * decay)
+
+    def heat_up(self, conflicts, attempts, now, half_life):
+        heat = self.current_heat(now, half_life)
+        self.heat = (heat[0] + conflicts, heat[1] + attempts)
+        self.heated_at = now
+
+
+_current_observation = ContextVar('current_contention_observation', default=None)
+
+
+class ContentionStats:
+    """Bounded in-memory aggregation of booking contention per show and seat block"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._shows = {}
+
+    @contextmanager
+    def track(self, show_id, seat_ids=None, requests=None):
+        """
+        Observe one booking transaction for show_id
+
+        Pass the seat_ids of a single booking, or the seat ID lists of each
+        request in a batch. Run the transaction's work through
+        observation.counted(). The outcome follows from how the block exits:
+        normally (booked, except requests marked with reject()), with a
+        ValueError (rejected), or with TransactionRetryError or any other
+        error (failed).
+        """
+        observation = Observation(show_id, requests if requests is not None else [seat_ids])
+        token = _current_observation.set(observation)
+        outcome = 'failed'
+        try:
+            with commit_timer() as timer:
+                try:
+                    yield observation
+                finally:
+                    observation.commit_seconds = timer.seconds
+            outcome = 'booked'
+        except TransactionRetryError:
+            raise
+        except ValueError:
+            outcome = 'rejected'
+            raise
+        finally:
+            _current_observation.reset(token)
+            try:
+                self._record(observation, outcome)
+            except Exception:
+                current_app.logger.exception("Failed to record booking contention for show %s", show_id)
+
+    def report(self, limit=None):
+        """
+        Get the most contended shows, most contended first
+
+        Returns:
+            {'tracked_shows', 'block_size', 'shows': [...]}; each show has its
+            totals and its most contended blocks (up to limit of each)
+        """
+        config = current_app.config
+        limit = limit or config.get('CONTENTION_TOP_K', 10)
+        block_size = config.get('CONTENTION_BLOCK_SIZE', 16)
+
+        with self._lock:
+            ranked = sorted(self._shows.items(), key=lambda item: item[1].totals.score(), reverse=True)
+            shows = []
+            for show_id, show in ranked[:limit]:
+                blocks = sorted(show.blocks.items(), key=lambda item: item[1].score(), reverse=True)
+                shows.append(dict(
+                    show_id=show_id,
+                    **show.totals.to_dict(),
+                    blocks=[
+                        dict(
+                            block=block,
+                            ordinals=[block * block_size, (block + 1) * block_size - 1],
+                            **counters.to_dict()
+                        )
+                        for block, counters in blocks[:limit]
+                    ]
+                ))
+            tracked = len(self._shows)
+
+        return {'tracked_shows': tracked, 'block_size': block_size, 'shows': shows}
+
+    def reset(self):
+        with self._lock:
+            self._shows = {}
+
+    def _record(self, observation, outcome):
+        config = current_app.config
+        commit_seconds = observation.commit_seconds
+        blocks = self._blocks(observation.show_id, config.get('CONTENTION_BLOCK_SIZE', 16))
+
+        if outcome == 'booked':
+            rejected = observation.rejected
+            booked = list(observation.requests)
+            for seat_ids in rejected:
+                booked.remove(seat_ids)
+        else:
+            rejected = observation.requests if outcome == 'rejected' else []
+            booked = []
+
+        now = time.monotonic()
+        half_life = config.get('CONTENTION_HALF_LIFE_SECONDS', 3600)
+
+        with self._lock:
+            show = self._show(observation.show_id, config.get('CONTENTION_MAX_SHOWS', 256), now, half_life)
+            show.heat_up(
+                max(0, observation.attempts - 1) + len(rejected) + (outcome == 'failed'),
+                observation.attempts, now, half_life
+            )
+            touched = [show.totals] + [self._block(show, block) for block in blocks(observation.seat_ids)]
+            for counters in touched:
+                counters.attempts += observation.attempts
+                counters.retries += max(0, observation.attempts - 1)
+                counters.lock_wait_seconds += observation.lock_wait
+                counters.lock_wait_max = max(counters.lock_wait_max, observation.lock_wait)
+                if outcome == 'failed':
+                    counters.failures += 1
+
+            for seat_ids in rejected:
+                for counters in [show.totals] + [self._block(show, block) for block in blocks(seat_ids)]:
+                    counters.rejections += 1
+
+            for seat_ids in booked:
+                for counters in [show.totals] + [self._block(show, block) for block in blocks(seat_ids)]:
+                    counters.bookings += 1
+                    counters.commit_seconds += commit_seconds
+                    counters.commit_max = max(counters.commit_max, commit_seconds)
+
+    def _blocks(self, show_id, block_size):
+        """Function mapping seat IDs to the sorted seat blocks they fall in"""
+        try:
+            ordinals = seat_state_store.layout(show_id).ordinals
+        except ValueError:
+            ordinals = {}
+
+        def blocks(seat_ids):
+            return sorted({
+                ordinals[seat_id] // block_size for seat_id in seat_ids if seat_id in ordinals
+            })
+        return blocks
+
+    def _show(self, show_id, max_shows, now, half_life):
+        show = self._shows.get(show_id)
+        if show is None:
+            if len(self._shows) >= max_shows:
+                # Make room by forgetting the show with the least recent contention
+                coldest = min(self._shows, key=lambda key: self._shows[key].current_heat(now, half_life))
+                del self._shows[coldest]
+            show = self._shows[show_id] = ShowContention()
+        return show
+
+    def _block(self, show, block):
+        counters = show.blocks.get(block)
+        if counters is None:
+            counters = show.blocks[block] = Counters()
+        return counters
+
+
+contention_stats = ContentionStats()
+
+
+@contextmanager
+def lock_wait():
+    """Add the time spent in the block to the booking being observed, if any"""
+    observation = _current_observation.get()
+    if observation is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observation.lock_wait += time.perf_counter() - started
@@ -2,20 +2,25 @@
 Event service - business logic for events/movies
 """
 from app.models.event import Event
-from app.extensions import db
-from sqlalchemy import or_
+from app.extensions import after_commit, db, cache
+from app.services.search_index import search_index
+from app.services.pagination import paginate
+from app.tracing import traced
+from sqlalchemy import event, or_
+from sqlalchemy.orm import object_session
 
 
+@traced
 class EventService:
     """Service for event/movie operations"""
 
     @staticmethod
-    def get_all_events(limit=None):
-        """Get all events"""
-        query = Event.query
-        if limit:
-            query = query.limit(limit)
-        return query.all()
+    def get_all_events(cursor=None, limit=None):
+        """
+        Get one page of events ordered by name
+        Returns Page(items, next_cursor)
+        """
+        return paginate(Event.query, (Event.event_name, Event.event_id), cursor, limit)
 
     @staticmethod
     def get_event_by_id(event_id):
@@ -24,14 +29,18 @@ class EventService:
 
     @staticmethod
     def search_events(search_term):
-        """Search events by name"""
-        return Event.query.filter(
-            Event.event_name.ilike(f'%{search_term}%')
-        ).all()
+        """
+        Search events by name, best matches first
+        Served from the in-memory search index; returns event dicts (Event.to_dict())
+        """
+        return search_index.search(search_term, kind='event')
 
     @staticmethod
-    def filter_events(event_type=None, language=None, rating=None):
-        """Filter events by type, language, or rating"""
+    def filter_events(event_type=None, language=None, rating=None, cursor=None, limit=None):
+        """
+        Get one page of events filtered by type, language, or rating, ordered by name
+        Returns Page(items, next_cursor)
+        """
         query = Event.query
 
         if event_type:
@@ -41,33 +50,54 @@ class EventService:
         if rating:
             query = query.filter(Event.rating == rating)
 
-        return query.all()
+        return paginate(query, (Event.event_name, Event.event_id), cursor, limit)
 
     @staticmethod
     def get_featured_events(limit=6):
-        """Get featured events for homepage"""
-        return Event.query.limit(limit).all()
+        """Get featured events for homepage (cached)"""
+        def load():
+            events = Event.query.limit(limit).all()
+            # Cache detached copies so commits in this request don't expire them
+            for featured in events:
+                db.session.expunge(featured)
+            return events
+
+        events = cache.get_or_set(f'events:featured:{limit}', load)
+
+        # Attach the cached events to this request's session without a query
+        return [db.session.merge(featured, load=False) for featured in events]
 
     @staticmethod
     def get_event_types():
-        """Get unique event types"""
-        result = db.session.query(Event.event_type).distinct().filter(
-            Event.event_type.isnot(None)
-        ).all()
-        return [r[0] for r in result]
+        """Get unique event types (cached)"""
+        return cache.get_or_set('events:types', lambda: EventService._distinct(Event.event_type))
 
     @staticmethod
     def get_languages():
-        """Get unique languages"""
-        result = db.session.query(Event.language).distinct().filter(
-            Event.language.isnot(None)
-        ).all()
-        return [r[0] for r in result]
+        """Get unique languages (cached)"""
+        return cache.get_or_set('events:languages', lambda: EventService._distinct(Event.language))
 
     @staticmethod
     def get_ratings():
-        """Get unique ratings"""
-        result = db.session.query(Event.rating).distinct().filter(
-            Event.rating.isnot(None)
+        """Get unique ratings (cached)"""
+        return cache.get_or_set('events:ratings', lambda: EventService._distinct(Event.rating))
+
+    @staticmethod
+    def invalidate_cache():
+        """Drop cached event facets and featured lists"""
+        cache.invalidate('events:')
+
+    @staticmethod
+    def _distinct(column):
+        result = db.session.query(column).distinct().filter(
+            column.isnot(None)
         ).all()
         return [r[0] for r in result]
+
+
+@event.listens_for(Event, 'after_insert')
+@event.listens_for(Event, 'after_update')
+@event.listens_for(Event, 'after_delete')
+def _invalidate_event_cache(mapper, connection, target):
+    """Invalidate cached event data once an ORM change to an event commits"""
+    after_commit(object_session(target), EventService.invalidate_cache)
@@ -0,0 +1,267 @@
+"""
+Geo index - in-memory spatial index over theater coordinates
+
+Theaters are bucketed into a fixed lat/lon grid (geohash-style cells of
+GEO_CELL_DEGREES). Radius queries scan only the cells overlapping the
+query's bounding box; k-nearest queries scan rings of cells outward until
+the k-th result is provably closer than anything in unscanned cells.
+Longitude columns wrap around at the antimeridian. Distances are exact
+haversine great-circle distances.
+"""
+from app.models.theater import Theater
+from app.extensions import after_commit, db
+from app.services.background_rebuild import BackgroundRebuild
+from flask import current_app
+from sqlalchemy import event, select
+from sqlalchemy.orm import object_session
+import heapq
+import math
+import threading
+import time
+
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in kilometres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    Get the (min_lat, max_lat, min_lon, max_lon) box containing every point within radius_km
+    Near the poles or across the antimeridian the longitude range widens to the full circle
+    """
+    d_lat = radius_km / KM_PER_DEGREE
+    min_lat = max(-90.0, latitude - d_lat)
+    max_lat = min(90.0, latitude + d_lat)
+
+    widest = max(abs(min_lat), abs(max_lat))
+    if widest >= 90.0:
+        return min_lat, max_lat, -180.0, 180.0
+
+    d_lon = d_lat / math.cos(math.radians(widest))
+    if longitude - d_lon < -180.0 or longitude + d_lon > 180.0:
+        return min_lat, max_lat, -180.0, 180.0
+
+    return min_lat, max_lat, longitude - d_lon, longitude + d_lon
+
+
+class GeoGridIndex:
+    """
+    Grid index of theater_id -> (latitude, longitude)
+
+    Built from the database (a single id/lat/lon query) and rebuilt in the
+    background every GEO_INDEX_REBUILD_SECONDS, serving the previous index
+    meanwhile; ORM changes in this process are applied when they commit.
+    Theaters without coordinates are not indexed.
+    """
+
+    def __init__(self, cell_degrees=0.25):
+        self.cell_degrees = cell_degrees
+        self._lock = threading.Lock()
+        self._cells = {}
+        self._points = {}
+        self._changes = None
+        self.built_at = None
+        self._rebuild = BackgroundRebuild(self, 'geo-index')
+
+    def warm_up(self, wait=False):
+        """
+        Build the index if needed: in the caller with wait=True, otherwise in
+        the background (also how an expired index is rebuilt)
+        """
+        self._rebuild.ensure(current_app.config.get('GEO_INDEX_REBUILD_SECONDS', 600), wait=wait)
+
+    def is_warm(self):
+        """Whether the index has been built and can answer queries"""
+        return self.built_at is not None
+
+    def build(self):
+        """
+        Rebuild the index from the database
+        The new grid is built aside and swapped in; changes applied while it
+        was loading are replayed onto it, so none are lost
+        """
+        with self._lock:
+            self._changes = []
+
+        fresh = GeoGridIndex(current_app.config.get('GEO_CELL_DEGREES', self.cell_degrees))
+        try:
+            rows = db.session.execute(
+                select(Theater.theater_id, Theater.latitude, Theater.longitude)
+            ).all()
+        except Exception:
+            with self._lock:
+                self._changes = None
+            raise
+
+        for theater_id, latitude, longitude in rows:
+            fresh._add(theater_id, latitude, longitude)
+
+        with self._lock:
+            for theater_id, point in self._changes:
+                fresh._remove(theater_id)
+                if point is not None:
+                    fresh._add(theater_id, *point)
+            self.cell_degrees = fresh.cell_degrees
+            self._cells = fresh._cells
+            self._points = fresh._points
+            self._changes = None
+            self.built_at = time.monotonic()
+
+    def within(self, latitude, longitude, radius_km):
+        """Get [(distance_km, theater_id)] within radius_km, nearest first"""
+        min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+        min_row, max_row = math.floor(min_lat / self.cell_degrees), math.floor(max_lat / self.cell_degrees)
+        min_col, max_col = math.floor(min_lon / self.cell_degrees), math.floor(max_lon / self.cell_degrees)
+
+        results = []
+        with self._lock:
+            if (max_row - min_row + 1) * (max_col - min_col + 1) > len(self._cells):
+                # Huge radius: walking every occupied cell is cheaper
+                cells = list(self._cells.values())
+            else:
+                keys = {
+                    (row, self._wrap(col))
+                    for row in range(min_row, max_row + 1)
+                    for col in range(min_col, max_col + 1)
+                }
+                cells = [self._cells[key] for key in keys if key in self._cells]
+
+            for cell in cells:
+                for theater_id, (point_lat, point_lon) in cell.items():
+                    distance = haversine_km(latitude, longitude, point_lat, point_lon)
+                    if distance <= radius_km:
+                        results.append((distance, theater_id))
+
+        results.sort()
+        return results
+
+    def nearest(self, latitude, longitude, k, max_radius_km=None):
+        """Get the k nearest [(distance_km, theater_id)], nearest first"""
+        if k <= 0:
+            return []
+
+        center_row, center_col = self._cell(latitude, longitude)
+        cell_km = self.cell_degrees * KM_PER_DEGREE
+
+        heap = []
+        seen = set()
+        with self._lock:
+            if not self._points:
+                return []
+
+            columns = self._columns()
+            max_ring = max(
+                max(abs(row - center_row), min(abs(col - center_col), columns - abs(col - center_col)))
+                for row, col in self._cells
+            )
+
+            for ring in range(max_ring + 1):
+                for row, col in self._ring(center_row, center_col, ring):
+                    if (row, col) in seen:
+                        # Rings wider than half the globe meet across the antimeridian
+                        continue
+                    seen.add((row, col))
+                    for theater_id, (point_lat, point_lon) in self._cells.get((row, col), {}).items():
+                        distance = haversine_km(latitude, longitude, point_lat, point_lon)
+                        if max_radius_km is not None and distance > max_radius_km:
+                            continue
+                        if len(heap) < k:
+                            heapq.heappush(heap, (-distance, theater_id))
+                        elif -heap[0][0] > distance:
+                            heapq.heapreplace(heap, (-distance, theater_id))
+
+                # Everything in rings beyond this one is at least this far away
+                # (bounded by the narrowest east-west cell width in the scanned band)
+                band_lat = min(89.9, abs(latitude) + (ring + 1) * self.cell_degrees)
+                covered_km = ring * cell_km * math.cos(math.radians(band_lat))
+                if len(heap) == k and -heap[0][0] <= covered_km:
+                    break
+                if max_radius_km is not None and covered_km > max_radius_km:
+                    break
+
+        return sorted((-negative, theater_id) for negative, theater_id in heap)
+
+    def add(self, theater_id, latitude, longitude):
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append((theater_id, (latitude, longitude)))
+            if self.built_at is None:
+                return
+            self._remove(theater_id)
+            self._add(theater_id, latitude, longitude)
+
+    def remove(self, theater_id):
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append((theater_id, None))
+            self._remove(theater_id)
+
+    def _columns(self):
+        """Number of grid columns around the globe"""
+        return math.ceil(360.0 / self.cell_degrees)
+
+    def _wrap(self, col):
+        """Map a column index onto the grid, wrapping around at the antimeridian"""
+        first = math.floor(-180.0 / self.cell_degrees)
+        return (col - first) % self._columns() + first
+
+    def _cell(self, latitude, longitude):
+        return (
+            math.floor(latitude / self.cell_degrees),
+            self._wrap(math.floor(longitude / self.cell_degrees))
+        )
+
+    def _ring(self, center_row, center_col, ring):
+        """Cells at Chebyshev distance ring from the center cell, columns wrapped"""
+        if ring == 0:
+            yield center_row, center_col
+            return
+        for col in range(center_col - ring, center_col + ring + 1):
+            yield center_row - ring, self._wrap(col)
+            yield center_row + ring, self._wrap(col)
+        for row in range(center_row - ring + 1, center_row + ring):
+            yield row, self._wrap(center_col - ring)
+            yield row, self._wrap(center_col + ring)
+
+    def _add(self, theater_id, latitude, longitude):
+        if latitude is None or longitude is None:
+            return
+        self._points[theater_id] = (latitude, longitude)
+        self._cells.setdefault(self._cell(latitude, longitude), {})[theater_id] = (latitude, longitude)
+
+    def _remove(self, theater_id):
+        point = self._points.pop(theater_id, None)
+        if point is None:
+            return
+        key = self._cell(*point)
+        cell = self._cells.get(key)
+        if cell is not None:
+            cell.pop(theater_id, None)
+            if not cell:
+                del self._cells[key]
+
+
+geo_index = GeoGridIndex()
+
+
+@event.listens_for(Theater, 'after_insert')
+@event.listens_for(Theater, 'after_update')
+def _index_theater_location(mapper, connection, target):
+    """Keep the geo index current when an ORM change to a theater commits"""
+    after_commit(
+        object_session(target), geo_index.add, target.theater_id, target.latitude, target.longitude
+    )
+
+
+@event.listens_for(Theater, 'after_delete')
+def _unindex_theater_location(mapper, connection, target):
+    after_commit(object_session(target), geo_index.remove, target.theater_id)
@@ -0,0 +1,152 @@
+"""
+Auditorium layout cache - immutable seat layouts with parsed row/column geometry
+Seats of an auditorium almost never change, so layouts are cached per process.
+Seat changes made through the ORM invalidate this process's copy right away;
+other processes reload theirs once it is LAYOUT_CACHE_TTL_SECONDS old.
+"""
+from app.models.seat import Seat
+from app.extensions import db
+from flask import current_app
+from sqlalchemy import event, inspect, select
+from collections import OrderedDict, namedtuple
+import re
+import threading
+import time
+import zlib
+
+
+# Seat numbers look like "A1", "B12" or "AA-3"
+SEAT_NO_PATTERN = re.compile(r'^\s*([A-Za-z]+)\s*-?\s*(\d+)\s*$')
+
+SeatCell = namedtuple('SeatCell', ['seat_id', 'seat_no', 'auditorium_id', 'row', 'column', 'ordinal'])
+
+
+def parse_seat_no(seat_no):
+    """
+    Split a seat number into its row letters and column number
+    Returns (row, column); unparseable seat numbers get row '' and column 0
+    """
+    match = SEAT_NO_PATTERN.match(seat_no or '')
+    if not match:
+        return '', 0
+    return match.group(1).upper(), int(match.group(2))
+
+
+def _row_sort_key(row):
+    # Rows sort A..Z, then AA..ZZ; unparseable seats go last
+    return (row == '', len(row), row)
+
+
+class AuditoriumLayout:
+    """
+    Immutable seat layout of an auditorium
+
+    Seats are ordered by row and then numerically by column (A2 before A10),
+    and each seat gets a stable ordinal in that order.
+    """
+
+    def __init__(self, auditorium_id, seats):
+        parsed = []
+        for seat_id, seat_no in seats:
+            row, column = parse_seat_no(seat_no)
+            parsed.append((_row_sort_key(row), column, seat_no, seat_id, row))
+        parsed.sort()
+
+        self.auditorium_id = auditorium_id
+        self.seats = tuple(
+            SeatCell(seat_id, seat_no, auditorium_id, row, column, ordinal)
+            for ordinal, (_, column, seat_no, seat_id, row) in enumerate(parsed)
+        )
+        self.seat_ids = tuple(cell.seat_id for cell in self.seats)
+        self.ordinals = {cell.seat_id: cell.ordinal for cell in self.seats}
+        self.checksum = zlib.crc32('\n'.join(self.seat_ids).encode())
+        self.max_column = max((cell.column for cell in self.seats), default=0)
+        self.rows = self._build_grid()
+
+    def _build_grid(self):
+        """
+        Group seats into rows, padding missing columns with None so columns line up
+        Returns a tuple of (row_label, cells) pairs
+        """
+        grid = OrderedDict()
+        for cell in self.seats:
+            grid.setdefault(cell.row, []).append(cell)
+
+        rows = []
+        for row, cells in grid.items():
+            columns = [cell.column for cell in cells]
+            if row and min(columns) >= 1 and len(set(columns)) == len(columns):
+                padded = [None] * self.max_column
+                for cell in cells:
+                    padded[cell.column - 1] = cell
+                rows.append((row, tuple(padded)))
+            else:
+                rows.append((row, tuple(cells)))
+
+        return tuple(rows)
+
+    def seat(self, seat_id):
+        """Get a seat's cell by ID, or None if it is not in this auditorium"""
+        ordinal = self.ordinals.get(seat_id)
+        return None if ordinal is None else self.seats[ordinal]
+
+    def __len__(self):
+        return len(self.seats)
+
+
+class LayoutCache:
+    """Process-level LRU cache of auditorium layouts keyed by auditorium_id"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._layouts = OrderedDict()
+
+    def get(self, auditorium_id):
+        """Get the layout of an auditorium, loading it on a miss or once it has expired"""
+        ttl = current_app.config.get('LAYOUT_CACHE_TTL_SECONDS', 300)
+        with self._lock:
+            entry = self._layouts.get(auditorium_id)
+            if entry is not None:
+                layout, loaded_at = entry
+                if time.monotonic() - loaded_at < ttl:
+                    self._layouts.move_to_end(auditorium_id)
+                    return layout
+
+        seats = db.session.execute(
+            select(Seat.seat_id, Seat.seat_no).where(Seat.auditorium_id == auditorium_id)
+        ).all()
+        layout = AuditoriumLayout(auditorium_id, seats)
+
+        with self._lock:
+            self._layouts[auditorium_id] = (layout, time.monotonic())
+            self._layouts.move_to_end(auditorium_id)
+            while len(self._layouts) > current_app.config.get('LAYOUT_CACHE_SIZE', 512):
+                self._layouts.popitem(last=False)
+
+        return layout
+
+    def invalidate(self, auditorium_id):
+        """Drop a cached layout (call after changing an auditorium's seats)"""
+        with self._lock:
+            self._layouts.pop(auditorium_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._layouts.clear()
+
+
+layout_cache = LayoutCache()
+
+
+@event.listens_for(Seat, 'after_insert')
+@event.listens_for(Seat, 'after_update')
+@event.listens_for(Seat, 'after_delete')
+def _invalidate_seat_layout(mapper, connection, seat):
+    """
+    Invalidate the layout of an auditorium whose seats changed through the ORM
+    A seat moved to another auditorium invalidates both the old and the new one
+    """
+    history = inspect(seat).attrs.auditorium_id.history
+    for auditorium_id in {seat.auditorium_id, *history.deleted}:
+        if auditorium_id is not None:
+            layout_cache.invalidate(auditorium_id)
@@ -0,0 +1,144 @@
+"""
+Lock sweeper - releases expired seat holds in bounded batches
+Runs in its own process (sweep_locks.py) so lock cleanup never stalls seat
+booking; one sweeper per deployment is enough
+"""
+from app.extensions import db
+from app.services.seat_state_store import seat_state_store
+from app.services.transaction_runner import run_on_connection
+from flask import current_app
+from sqlalchemy import text
+from datetime import datetime, timedelta
+import threading
+import time
+
+
+# Expired holds: unavailable, not booked, locked before the cutoff.
+# ORDER BY locked_at walks the ix_show_seats_held_locked_at partial index.
+SWEEP_SQL = """
+    UPDATE show_seats
+    SET is_available = true, locked_at = NULL, locked_by = NULL, version = version + 1
+    WHERE is_available = false
+      AND booking_id IS NULL
+      AND locked_at < :cutoff
+      {show_filter}
+    ORDER BY locked_at
+    LIMIT :batch_size
+    RETURNING show_id, seat_id
+"""
+
+SWEEP_ALL = text(SWEEP_SQL.format(show_filter=''))
+SWEEP_SHOW = text(SWEEP_SQL.format(show_filter='AND show_id = :show_id'))
+
+
+class LockSweeper:
+    """Releases expired seat holds with UPDATE ... LIMIT n RETURNING loops, one commit per batch"""
+
+    def __init__(self):
+        self._thread = None
+        self._stop = threading.Event()
+        self.last_report = None
+
+    def init_app(self, app):
+        """
+        Start a background sweeper thread if LOCK_SWEEPER_ENABLED
+        Off by default: every web worker would otherwise run its own sweeper
+        """
+        if not app.config.get('LOCK_SWEEPER_ENABLED') or self._thread is not None:
+            return
+
+        self._thread = threading.Thread(
+            target=self.run, args=(app,), name='lock-sweeper', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def sweep(self, show_id=None, lock_timeout_seconds=None, batch_size=None, max_batches=None):
+        """
+        Release expired holds in batches
+
+        Args:
+            show_id: Only sweep this show's seats
+            lock_timeout_seconds: Age after which a hold is expired, defaults to SEAT_HOLD_TTL_SECONDS
+            batch_size: Rows per batch, defaults to LOCK_SWEEP_BATCH_SIZE
+            max_batches: Stop after this many batches, defaults to LOCK_SWEEP_MAX_BATCHES
+
+        Returns:
+            Dict with total rows released, total seconds and per-batch
+            {'released', 'seconds'} entries
+        """
+        config = current_app.config
+        if lock_timeout_seconds is None:
+            lock_timeout_seconds = config.get('SEAT_HOLD_TTL_SECONDS', 600)
+        batch_size = batch_size or config.get('LOCK_SWEEP_BATCH_SIZE', 500)
+        max_batches = max_batches or config.get('LOCK_SWEEP_MAX_BATCHES', 100)
+
+        params = {
+            'cutoff': datetime.now() - timedelta(seconds=lock_timeout_seconds),
+            'batch_size': batch_size
+        }
+        statement = SWEEP_ALL
+        if show_id is not None:
+            params['show_id'] = show_id
+            statement = SWEEP_SHOW
+
+        batches = []
+        started = time.perf_counter()
+
+        for _ in range(max_batches):
+            batch_started = time.perf_counter()
+            released = run_on_connection(
+                lambda connection: connection.execute(statement, params).all()
+            )
+            batches.append({
+                'released': len(released),
+                'seconds': time.perf_counter() - batch_started
+            })
+
+            self._record_released(released)
+
+            if len(released) < batch_size:
+                break
+
+        report = {
+            'released': sum(batch['released'] for batch in batches),
+            'seconds': time.perf_counter() - started,
+            'batches': batches
+        }
+        self.last_report = report
+        return report
+
+    def _record_released(self, released):
+        """Reflect released seats in the shared seat state store"""
+        by_show = {}
+        for show_id, seat_id in released:
+            by_show.setdefault(show_id, []).append(seat_id)
+
+        for show_id, seat_ids in by_show.items():
+            try:
+                seat_state_store.apply_change(show_id, seat_ids, booked=False)
+            except Exception:
+                current_app.logger.exception("Failed to update seat state for show %s", show_id)
+
+    def run(self, app):
+        """Sweep every LOCK_SWEEP_INTERVAL_SECONDS until stopped (blocks)"""
+        interval = app.config.get('LOCK_SWEEP_INTERVAL_SECONDS', 30)
+
+        while not self._stop.wait(interval):
+            with app.app_context():
+                try:
+                    report = self.sweep()
+                    if report['released']:
+                        app.logger.info(
+                            "Lock sweep released %d seats in %d batches (%.3fs)",
+                            report['released'], len(report['batches']), report['seconds']
+                        )
+                except Exception:
+                    app.logger.exception("Lock sweep failed")
+                finally:
+                    db.session.remove()
+
+
+lock_sweeper = LockSweeper()
@@ -0,0 +1,133 @@
+"""
+Keyset pagination helpers
+
+A cursor is the sort key of the last row on a page, encoded as an opaque
+URL-safe token. The next page is the rows strictly after that key in sort
+order, so page N costs the same as page 1, unlike OFFSET.
+"""
+from flask import current_app, request
+from sqlalchemy import tuple_
+from collections import namedtuple
+from datetime import datetime
+import base64
+import json
+import uuid
+
+
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+
+def page_size(endpoint=None):
+    """Page size for a route, from PAGE_SIZES (keyed by endpoint) or DEFAULT_PAGE_SIZE"""
+    config = current_app.config
+    endpoint = endpoint or request.endpoint
+    return config.get('PAGE_SIZES', {}).get(endpoint, config.get('DEFAULT_PAGE_SIZE', 24))
+
+
+def paginate(query, sort_keys, cursor=None, limit=None, key=None, descending=False):
+    """
+    Fetch one page of a query with keyset pagination
+
+    Args:
+        query: Unordered query
+        sort_keys: Columns forming a unique sort key, e.g. (Event.event_name, Event.event_id)
+        cursor: Cursor from the previous page, None for the first page
+        limit: Page size, defaults to DEFAULT_PAGE_SIZE
+        key: Function returning a row's sort key values, defaults to
+            reading the sort key attributes off the row
+        descending: Sort newest/largest first
+
+    Returns:
+        Page(items, next_cursor); next_cursor is None on the last page
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    limit = limit or current_app.config.get('DEFAULT_PAGE_SIZE', 24)
+    after = decode_cursor(cursor, len(sort_keys), [_python_type(column) for column in sort_keys])
+
+    if after:
+        row_key = tuple_(*sort_keys)
+        query = query.filter(row_key < tuple(after) if descending else row_key > tuple(after))
+
+    ordering = [column.desc() if descending else column.asc() for column in sort_keys]
+    rows = query.order_by(*ordering).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        if key is None:
+            values = [getattr(rows[-1], column.key) for column in sort_keys]
+        else:
+            values = key(rows[-1])
+        next_cursor = encode_cursor(*values)
+
+    return Page(rows, next_cursor)
+
+
+def encode_cursor(*values):
+    """Encode the sort key of the last row on a page"""
+    payload = json.dumps([_encode_value(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size, types=None):
+    """
+    Decode a cursor into its sort key values
+
+    Args:
+        cursor: Cursor from encode_cursor()
+        size: Number of sort key values
+        types: Expected Python type of each value (None skips the check)
+
+    Returns:
+        List of size values, or None for an empty cursor
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    if not cursor:
+        return None
+
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list):
+            raise ValueError("Invalid page cursor")
+        values = [_decode_value(value) for value in values]
+    except (TypeError, ValueError, KeyError):
+        raise ValueError("Invalid page cursor")
+
+    if len(values) != size:
+        raise ValueError("Invalid page cursor")
+
+    # A mistyped value would only fail in the database, as a server error
+    for value, expected in zip(values, types or ()):
+        if value is not None and expected is not None and not isinstance(value, expected):
+            raise ValueError("Invalid page cursor")
+
+    return values
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, uuid.UUID):
+        return {'uuid': str(value)}
+    return value
+
+
+def _python_type(column):
+    """The Python type of a sort key column's values, None if unknown"""
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return None
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'uuid' in value:
+            return uuid.UUID(value['uuid'])
+        return datetime.fromisoformat(value['dt'])
+    return value
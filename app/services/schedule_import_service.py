@@ -0,0 +1,264 @@
+"""
+Schedule import service - bulk show_seats materialization for published schedules
+
+show_seats is the source of seat availability for booking and seat maps.
+Rows are materialized when schedules are imported, when a show is
+committed through the ORM, and (for shows that predate show_seats) the
+first time a process reads or books the show. Seats already sold in
+bookings/booking_seats are materialized as booked.
+"""
+from app.models.booking import Booking
+from app.models.booking_seat import BookingSeat
+from app.models.seat import Seat
+from app.models.show import Show
+from app.models.show_seat import ShowSeat
+from app.extensions import db
+from app.ids import new_ids
+from app.services.transaction_runner import run_on_connection
+from flask import current_app
+from sqlalchemy import (
+    String, and_, case, cast, column, event, exists, func, literal, select, update, values
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import object_session
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+
+# Shows this process has seen with complete show_seats (bounded)
+_materialized = OrderedDict()
+_materialized_lock = threading.Lock()
+MAX_MATERIALIZED_SHOWS = 4096
+
+
+class ScheduleImportService:
+    """Service for bulk schedule imports"""
+
+    @staticmethod
+    def import_show_seats(schedule, chunk_size=None, workers=None):
+        """
+        Create show_seats for many shows at once
+
+        Each chunk of (show, auditorium) pairs becomes one
+        INSERT INTO show_seats ... SELECT ... FROM seats statement in its own
+        transaction, and chunks run in parallel on a worker pool. Rows that
+        already exist are skipped through the unique_show_seat constraint,
+        so an interrupted import can simply be run again.
+
+        Args:
+            schedule: Iterable of (show_id, auditorium_id) pairs
+            chunk_size: Shows per statement, defaults to SCHEDULE_IMPORT_CHUNK_SHOWS
+            workers: Parallel chunks, defaults to SCHEDULE_IMPORT_WORKERS
+
+        Returns:
+            Dict with the number of shows, chunks and show_seats rows inserted
+        """
+        config = current_app.config
+        chunk_size = chunk_size or config.get('SCHEDULE_IMPORT_CHUNK_SHOWS', 25)
+        workers = workers or config.get('SCHEDULE_IMPORT_WORKERS', 4)
+
+        pairs = list(dict.fromkeys((show_id, auditorium_id) for show_id, auditorium_id in schedule))
+        chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+
+        if len(chunks) <= 1 or workers <= 1:
+            inserted = sum(ScheduleImportService._import_chunk(chunk) for chunk in chunks)
+        else:
+            app = current_app._get_current_object()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                inserted = sum(executor.map(
+                    lambda chunk: ScheduleImportService._import_chunk_in_app(app, chunk),
+                    chunks
+                ))
+
+        return {
+            'shows': len(pairs),
+            'chunks': len(chunks),
+            'inserted': inserted
+        }
+
+    @staticmethod
+    def ensure_show_seats(show_id):
+        """
+        Materialize a show's missing show_seats rows (checked once per process)
+
+        Called before a show's seats are read or booked, so shows created
+        before show_seats existed, or outside the ORM, still work.
+
+        Returns:
+            Number of rows inserted
+        """
+        with _materialized_lock:
+            if show_id in _materialized:
+                _materialized.move_to_end(show_id)
+                return 0
+
+        def materialize(connection):
+            auditorium_id = connection.execute(
+                select(Show.auditorium_id).where(Show.show_id == show_id)
+            ).scalar()
+            if auditorium_id is None:
+                return None
+
+            seats = connection.execute(
+                select(func.count()).select_from(Seat).where(Seat.auditorium_id == auditorium_id)
+            ).scalar()
+            rows = connection.execute(
+                select(func.count()).select_from(ShowSeat).where(ShowSeat.show_id == show_id)
+            ).scalar()
+            if rows >= seats:
+                return 0
+            return connection.execute(ScheduleImportService._build_insert([(show_id, auditorium_id)])).rowcount
+
+        inserted = run_on_connection(materialize)
+        if inserted is None:
+            # Unknown show: let the caller report it
+            return 0
+
+        with _materialized_lock:
+            _materialized[show_id] = True
+            if len(_materialized) > MAX_MATERIALIZED_SHOWS:
+                _materialized.popitem(last=False)
+        return inserted
+
+    @staticmethod
+    def reconcile_booked_seats(show_ids=None):
+        """
+        Mark show_seats rows booked where booking_seats already sells the seat
+
+        Repairs rows written as available while bookings were still created
+        without touching show_seats. Each repaired row's version is bumped so
+        seat state bitmaps rebuild.
+
+        Args:
+            show_ids: Only these shows; all shows if None
+
+        Returns:
+            Number of rows repaired
+        """
+        sold_by = (
+            select(func.min(Booking.booking_id))
+            .join(BookingSeat, BookingSeat.booking_id == Booking.booking_id)
+            .where(
+                and_(
+                    Booking.show_id == ShowSeat.show_id,
+                    BookingSeat.seat_id == ShowSeat.seat_id
+                )
+            )
+            .scalar_subquery()
+        )
+
+        conditions = [
+            ShowSeat.is_available == True,
+            exists().where(
+                and_(
+                    Booking.booking_id == BookingSeat.booking_id,
+                    Booking.show_id == ShowSeat.show_id,
+                    BookingSeat.seat_id == ShowSeat.seat_id
+                )
+            )
+        ]
+        if show_ids is not None:
+            conditions.append(ShowSeat.show_id.in_(list(show_ids)))
+
+        statement = (
+            update(ShowSeat)
+            .where(and_(*conditions))
+            .values(is_available=False, booking_id=sold_by, version=ShowSeat.version + 1)
+        )
+        return run_on_connection(lambda connection: connection.execute(statement).rowcount)
+
+    @staticmethod
+    def _import_chunk_in_app(app, chunk):
+        """Import a chunk from a worker thread"""
+        with app.app_context():
+            return ScheduleImportService._import_chunk(chunk)
+
+    @staticmethod
+    def _import_chunk(chunk):
+        """Insert the show_seats of one chunk of shows, returning the number of new rows"""
+        statement = ScheduleImportService._build_insert(chunk)
+        return run_on_connection(lambda connection: connection.execute(statement).rowcount)
+
+    @staticmethod
+    def _build_insert(chunk):
+        """
+        Build INSERT INTO show_seats ... SELECT ... FROM (VALUES ...) JOIN seats
+
+        Row IDs are '<per-show SS ID>-<seat number within the show>', so they
+        are unique and time-ordered without minting one ID per seat in Python.
+        Seats already sold in booking_seats start out booked, with version 1
+        so seat state bitmaps that counted the show as empty rebuild.
+        """
+        schedule = values(
+            column('show_id', String),
+            column('auditorium_id', String),
+            column('id_prefix', String),
+            name='schedule'
+        ).data([
+            (show_id, auditorium_id, id_prefix)
+            for (show_id, auditorium_id), id_prefix in zip(chunk, new_ids('SS', len(chunk)))
+        ])
+
+        seat_number = func.row_number().over(
+            partition_by=schedule.c.show_id,
+            order_by=Seat.seat_id
+        )
+
+        sold = (
+            select(
+                Booking.show_id,
+                BookingSeat.seat_id,
+                func.min(Booking.booking_id).label('booking_id')
+            )
+            .join(BookingSeat, BookingSeat.booking_id == Booking.booking_id)
+            .where(Booking.show_id.in_([show_id for show_id, _ in chunk]))
+            .group_by(Booking.show_id, BookingSeat.seat_id)
+            .subquery('sold')
+        )
+
+        rows = (
+            select(
+                schedule.c.id_prefix + literal('-') + cast(seat_number, String),
+                schedule.c.show_id,
+                Seat.seat_id,
+                sold.c.booking_id.is_(None),
+                sold.c.booking_id,
+                case((sold.c.booking_id.is_(None), 0), else_=1)
+            )
+            .select_from(schedule)
+            .join(Seat, Seat.auditorium_id == schedule.c.auditorium_id)
+            .outerjoin(
+                sold,
+                and_(sold.c.show_id == schedule.c.show_id, sold.c.seat_id == Seat.seat_id)
+            )
+        )
+
+        return (
+            insert(ShowSeat.__table__)
+            .from_select(['id', 'show_id', 'seat_id', 'is_available', 'booking_id', 'version'], rows)
+            .on_conflict_do_nothing(index_elements=['show_id', 'seat_id'])
+        )
+
+
+@event.listens_for(Show, 'after_insert')
+def _note_new_show(mapper, connection, show):
+    object_session(show).info.setdefault('new_shows', []).append((show.show_id, show.auditorium_id))
+
+
+@event.listens_for(db.session, 'after_commit')
+def _materialize_new_shows(session):
+    """Create show_seats for shows committed through the ORM"""
+    schedule = session.info.pop('new_shows', None)
+    if not schedule:
+        return
+    try:
+        ScheduleImportService.import_show_seats(schedule, workers=1)
+    except Exception:
+        # The first read or booking of the show materializes them instead
+        current_app.logger.exception("Failed to create show_seats for new shows")
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_new_shows(session):
+    session.info.pop('new_shows', None)
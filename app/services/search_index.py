@@ -0,0 +1,292 @@
+"""
+Search index - in-memory trigram/prefix index over events and theaters
+Answers /search and type-ahead suggestions without a database query
+
+Documents are indexed by field (event name; theater name and city) with a
+weight per field. Queries match by trigram overlap, so small typos still
+match, and short or partial words match by token prefix.
+"""
+from app.models.event import Event
+from app.models.theater import Theater
+from app.extensions import after_commit, db
+from app.services.background_rebuild import BackgroundRebuild
+from flask import current_app
+from sqlalchemy import event, select
+from sqlalchemy.orm import object_session
+from collections import namedtuple
+import math
+import re
+import threading
+import time
+import unicodedata
+
+
+# Prefixes longer than this are checked against the document tokens directly
+MAX_PREFIX = 12
+
+# Share of a query word's trigrams a document must contain to match it
+MIN_TRIGRAM_MATCH = 0.5
+
+SearchDocument = namedtuple('SearchDocument', ['key', 'kind', 'title', 'tokens', 'payload'])
+
+
+def normalize(text):
+    """Casefold, strip accents and turn punctuation into spaces (letters of any script are kept)"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return re.sub(r'[\W_]+', ' ', text.casefold()).strip()
+
+
+def tokenize(text):
+    return normalize(text).split()
+
+
+def trigrams(token):
+    """Trigrams of a token padded like pg_trgm ('  ab' + ' '), so word starts weigh more"""
+    padded = f'  {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """
+    Incrementally updatable trigram/prefix index
+
+    Built from the database on first use and rebuilt in the background
+    every SEARCH_INDEX_REBUILD_SECONDS (to pick up changes made by other
+    processes), serving the previous index meanwhile; ORM changes in this
+    process are applied when they commit.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._docs = {}
+        self._trigrams = {}
+        self._prefixes = {}
+        self._changes = None
+        self.built_at = None
+        self._rebuild = BackgroundRebuild(self, 'search-index')
+
+    def search(self, query, kind=None, limit=50):
+        """
+        Ranked search
+
+        Every query word must match a document by prefix (words shorter than
+        three characters) or trigram overlap. Documents score by matched
+        field weight, with a bonus when the title contains or starts with
+        the whole query.
+
+        Returns:
+            List of document payloads (model to_dict() plus 'kind'), best first
+        """
+        self._ensure_built()
+        words = tokenize(query)
+        if not words:
+            return []
+
+        phrase = ' '.join(words)
+
+        with self._lock:
+            scores = None
+            for word in words:
+                word_scores = self._score_word(word)
+                if scores is None:
+                    scores = word_scores
+                else:
+                    scores = {key: scores[key] + score for key, score in word_scores.items() if key in scores}
+                if not scores:
+                    return []
+
+            docs = [self._docs[key] for key in scores if kind is None or key[0] == kind]
+
+        ranked = []
+        for doc in docs:
+            score = scores[doc.key]
+            title = normalize(doc.title)
+            if title.startswith(phrase):
+                score += 1.5
+            elif phrase in title:
+                score += 1.0
+            ranked.append((-score, len(doc.title), doc.title, doc))
+
+        ranked.sort(key=lambda item: item[:3])
+        return [doc.payload for *_, doc in ranked[:limit]]
+
+    def suggest(self, prefix, limit=8):
+        """
+        Type-ahead completions: documents whose words start with every word of prefix
+        Titles starting with the whole prefix come first, then shorter titles
+        """
+        self._ensure_built()
+        words = tokenize(prefix)
+        if not words:
+            return []
+
+        phrase = ' '.join(words)
+
+        with self._lock:
+            keys = None
+            for word in words:
+                matches = self._prefix_matches(word)
+                keys = matches if keys is None else keys & matches
+                if not keys:
+                    return []
+            docs = [self._docs[key] for key in keys]
+
+        docs.sort(key=lambda doc: (not normalize(doc.title).startswith(phrase), len(doc.title), doc.title))
+        return [doc.payload for doc in docs[:limit]]
+
+    def add(self, kind, doc_id, title, fields, payload):
+        """
+        Add or replace a document
+
+        Args:
+            kind: 'event' or 'theater'
+            doc_id: Primary key
+            title: Display title, used for ranking
+            fields: List of (text, weight) pairs to index
+            payload: Dict returned in results
+        """
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append(('add', (kind, doc_id, title, fields, payload)))
+            if self.built_at is not None:
+                self._add(kind, doc_id, title, fields, payload)
+
+    def remove(self, kind, doc_id):
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append(('remove', ((kind, str(doc_id)),)))
+            self._remove((kind, str(doc_id)))
+
+    def invalidate(self):
+        """Rebuild in the background on next use"""
+        with self._lock:
+            if self.built_at is not None:
+                self.built_at = -math.inf
+
+    def build(self):
+        """
+        Rebuild the whole index from the database (two queries)
+        The new index is built aside and swapped in; changes applied while
+        it was loading are replayed onto it, so none are lost
+        """
+        with self._lock:
+            self._changes = []
+
+        fresh = SearchIndex()
+        try:
+            for item in db.session.execute(select(Event)).scalars():
+                fresh._add('event', *_event_document(item))
+            for item in db.session.execute(select(Theater)).scalars():
+                fresh._add('theater', *_theater_document(item))
+        except Exception:
+            with self._lock:
+                self._changes = None
+            raise
+
+        with self._lock:
+            for operation, args in self._changes:
+                getattr(fresh, '_' + operation)(*args)
+            self._docs = fresh._docs
+            self._trigrams = fresh._trigrams
+            self._prefixes = fresh._prefixes
+            self._changes = None
+            self.built_at = time.monotonic()
+
+    def _ensure_built(self):
+        self._rebuild.ensure(current_app.config.get('SEARCH_INDEX_REBUILD_SECONDS', 300))
+
+    def _score_word(self, word):
+        """Map document key -> weighted match score for one query word"""
+        if len(word) < 3:
+            return {key: 1.0 for key in self._prefix_matches(word)}
+
+        grams = trigrams(word)
+        hits = {}
+        for gram in grams:
+            for key, weight in self._trigrams.get(gram, {}).items():
+                count, total = hits.get(key, (0, 0.0))
+                hits[key] = (count + 1, total + weight)
+
+        needed = len(grams) * MIN_TRIGRAM_MATCH
+        return {key: total / len(grams) for key, (count, total) in hits.items() if count >= needed}
+
+    def _prefix_matches(self, word):
+        keys = self._prefixes.get(word[:MAX_PREFIX], set())
+        if len(word) <= MAX_PREFIX:
+            return set(keys)
+        return {key for key in keys if any(token.startswith(word) for token in self._docs[key].tokens)}
+
+    def _add(self, kind, doc_id, title, fields, payload):
+        key = (kind, str(doc_id))
+        self._remove(key)
+
+        tokens = set()
+        gram_weights = {}
+        for text, weight in fields:
+            for token in tokenize(text):
+                tokens.add(token)
+                for gram in trigrams(token):
+                    gram_weights[gram] = max(gram_weights.get(gram, 0.0), weight)
+
+        self._docs[key] = SearchDocument(key, kind, title, frozenset(tokens), dict(payload, kind=kind))
+
+        for gram, weight in gram_weights.items():
+            self._trigrams.setdefault(gram, {})[key] = weight
+        for token in tokens:
+            for length in range(1, min(len(token), MAX_PREFIX) + 1):
+                self._prefixes.setdefault(token[:length], set()).add(key)
+
+    def _remove(self, key):
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return
+
+        for token in doc.tokens:
+            for gram in trigrams(token):
+                postings = self._trigrams.get(gram)
+                if postings is not None:
+                    postings.pop(key, None)
+                    if not postings:
+                        del self._trigrams[gram]
+            for length in range(1, min(len(token), MAX_PREFIX) + 1):
+                postings = self._prefixes.get(token[:length])
+                if postings is not None:
+                    postings.discard(key)
+                    if not postings:
+                        del self._prefixes[token[:length]]
+
+
+def _event_document(item):
+    return item.event_id, item.event_name, [(item.event_name, 1.0)], item.to_dict()
+
+
+def _theater_document(item):
+    fields = [(item.name, 1.0), (item.city, 0.6)]
+    return item.theater_id, item.name, fields, item.to_dict()
+
+
+search_index = SearchIndex()
+
+
+@event.listens_for(Event, 'after_insert')
+@event.listens_for(Event, 'after_update')
+def _index_event(mapper, connection, target):
+    """Keep the search index current when an ORM change to an event commits"""
+    after_commit(object_session(target), search_index.add, 'event', *_event_document(target))
+
+
+@event.listens_for(Theater, 'after_insert')
+@event.listens_for(Theater, 'after_update')
+def _index_theater(mapper, connection, target):
+    """Keep the search index current when an ORM change to a theater commits"""
+    after_commit(object_session(target), search_index.add, 'theater', *_theater_document(target))
+
+
+@event.listens_for(Event, 'after_delete')
+@event.listens_for(Theater, 'after_delete')
+def _unindex(mapper, connection, target):
+    if isinstance(target, Event):
+        after_commit(object_session(target), search_index.remove, 'event', target.event_id)
+    else:
+        after_commit(object_session(target), search_index.remove, 'theater', target.theater_id)
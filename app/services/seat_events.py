@@ -0,0 +1,99 @@
+"""
+Seat events - in-process pub/sub of seat state deltas per show
+
+Every committed seat change recorded in the seat state store is published
+here as one event per seat: {'version', 'ordinal', 'seat_id', 'state'}.
+Versions are the store's per-show change counter, so they are contiguous
+and shared by all processes on a host. Each show keeps its last
+SEAT_EVENTS_BUFFER_SIZE events, which lets a reconnecting client resume
+from the last version it saw; a client further behind (or missing changes
+made by another process) gets a full snapshot instead.
+"""
+from flask import current_app
+from collections import OrderedDict, deque
+import threading
+
+
+class _ShowChannel:
+    """One show's recent events and the condition its subscribers wait on"""
+
+    def __init__(self, lock, buffer_size):
+        self.events = deque(maxlen=buffer_size)
+        self.changed = threading.Condition(lock)
+
+
+class SeatEventBus:
+    """Per-show ring buffers of seat events with blocking waits for new ones"""
+
+    MAX_SHOWS = 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = OrderedDict()
+        self._subscribers = 0
+
+    def publish(self, show_id, events):
+        """Append a show's new events (in version order) and wake its subscribers"""
+        if not events:
+            return
+        buffer_size = current_app.config.get('SEAT_EVENTS_BUFFER_SIZE', 1024)
+        with self._lock:
+            channel = self._channel(show_id, buffer_size)
+            channel.events.extend(events)
+            channel.changed.notify_all()
+
+    def since(self, show_id, version, current_version):
+        """
+        Get a show's events after version, up to current_version
+
+        Returns:
+            List of events, or None if the buffer cannot account for every
+            version in between (the caller needs a snapshot)
+        """
+        if version >= current_version:
+            return []
+
+        with self._lock:
+            channel = self._channels.get(show_id)
+            events = [event for event in channel.events if event['version'] > version] if channel else []
+
+        expected = version
+        for event in events:
+            if event['version'] != expected + 1:
+                return None
+            expected = event['version']
+        return events if expected >= current_version else None
+
+    def wait(self, show_id, version, timeout):
+        """Block until the show has an event newer than version, or timeout"""
+        with self._lock:
+            channel = self._channel(show_id, current_app.config.get('SEAT_EVENTS_BUFFER_SIZE', 1024))
+            channel.changed.wait_for(
+                lambda: bool(channel.events) and channel.events[-1]['version'] > version,
+                timeout
+            )
+
+    def subscribe(self, max_subscribers):
+        """Count a new stream; False if max_subscribers are already connected"""
+        with self._lock:
+            if self._subscribers >= max_subscribers:
+                return False
+            self._subscribers += 1
+            return True
+
+    def unsubscribe(self):
+        with self._lock:
+            self._subscribers -= 1
+
+    def _channel(self, show_id, buffer_size):
+        channel = self._channels.get(show_id)
+        if channel is None:
+            channel = self._channels[show_id] = _ShowChannel(self._lock, buffer_size)
+            if len(self._channels) > self.MAX_SHOWS:
+                self._channels.popitem(last=False)
+        else:
+            self._channels.move_to_end(show_id)
+        return channel
+
+
+seat_events = SeatEventBus()
@@ -4,19 +4,31 @@ Seat service - business logic for seat management
 from app.models.seat import Seat
 from app.models.booking_seat import BookingSeat
 from app.models.booking import Booking
+from app.models.show_seat import ShowSeat
 from app.extensions import db
-from sqlalchemy import and_
-
-
+from app.services.layout_cache import layout_cache
+from app.services.schedule_import_service import ScheduleImportService
+from app.services.seat_state_store import seat_state_store
+from app.services.seat_events import seat_events
+from app.tracing import traced
+from flask import current_app
+from sqlalchemy import and_, func
+import json
+import time
+
+
+@traced
 class SeatService:
     """Service for seat operations"""
 
     @staticmethod
     def get_seats_for_auditorium(auditorium_id):
-        """Get all seats in an auditorium"""
-        return Seat.query.filter(
-            Seat.auditorium_id == auditorium_id
-        ).order_by(Seat.seat_no).all()
+        """
+        Get all seats in an auditorium in row/column order (from the layout cache)
+        Returns SeatCell tuples (seat_id, seat_no, auditorium_id, row, column,
+        ordinal) rather than Seat models; they are shared and read-only
+        """
+        return list(layout_cache.get(auditorium_id).seats)
 
     @staticmethod
     def get_available_seats_for_show(show_id, auditorium_id):
@@ -69,51 +81,171 @@ class SeatService:
     @staticmethod
     def is_seat_available(seat_id, show_id):
         """Check if a specific seat is available for a show"""
-        booked = db.session.query(BookingSeat).join(
-            Booking, BookingSeat.booking_id == Booking.booking_id
-        ).filter(
-            and_(
-                BookingSeat.seat_id == seat_id,
-                Booking.show_id == show_id
-            )
-        ).first()
-
-        return booked is None
+        return SeatService.are_seats_available([seat_id], show_id)
 
     @staticmethod
     def are_seats_available(seat_ids, show_id):
-        """Check if multiple seats are available for a show"""
-        for seat_id in seat_ids:
-            if not SeatService.is_seat_available(seat_id, show_id):
-                return False
-        return True
+        """Check if multiple seats are available for a show with a single query on show_seats"""
+        seat_ids = set(seat_ids)
+        if not seat_ids:
+            return True
+
+        # A show without show_seats rows yet would report every seat as taken
+        ScheduleImportService.ensure_show_seats(show_id)
+
+        available = db.session.query(func.count(ShowSeat.id)).filter(
+            and_(
+                ShowSeat.show_id == show_id,
+                ShowSeat.seat_id.in_(seat_ids),
+                ShowSeat.is_available == True
+            )
+        ).scalar()
+
+        return available == len(seat_ids)
 
     @staticmethod
     def get_all_seats_with_status(show_id, auditorium_id):
         """
         Get all seats for an auditorium with their booking status
-        Returns a list of dicts with seat info and is_booked status
+        Returns a list of dicts with seat info and is_booked status, in row/column order
         """
-        # Get all seats in the auditorium
-        all_seats = Seat.query.filter(
-            Seat.auditorium_id == auditorium_id
-        ).order_by(Seat.seat_no).all()
-
-        # Get booked seat IDs for this show
-        booked_seat_ids = db.session.query(BookingSeat.seat_id).join(
-            Booking, BookingSeat.booking_id == Booking.booking_id
-        ).filter(
-            Booking.show_id == show_id
-        ).all()
+        layout = layout_cache.get(auditorium_id)
 
-        booked_ids = {seat_id[0] for seat_id in booked_seat_ids}
+        # Seat availability comes from the shared seat state bitmap
+        seat_state = seat_state_store.snapshot(show_id)
 
         # Create seat list with status
         seats_with_status = []
-        for seat in all_seats:
+        for seat in layout.seats:
             seats_with_status.append({
                 'seat': seat,
-                'is_booked': seat.seat_id in booked_ids
+                'is_booked': seat_state.is_booked(seat.seat_id)
             })
 
         return seats_with_status
+
+    @staticmethod
+    def get_seat_map(show_id, auditorium_id, seat_state=None):
+        """
+        Get an auditorium's seat grid with booking status for a show
+        Returns a list of rows: {'label': row letters, 'seats': [{'seat', 'is_booked'} or None]}
+        None marks a gap in the row so columns line up
+
+        seat_state is a seat_state_store snapshot already taken by the caller, if any
+        """
+        layout = layout_cache.get(auditorium_id)
+        seat_state = seat_state or seat_state_store.snapshot(show_id)
+
+        return [
+            {
+                'label': label,
+                'seats': [
+                    {'seat': cell, 'is_booked': seat_state.is_booked(cell.seat_id)}
+                    if cell else None
+                    for cell in cells
+                ]
+            }
+            for label, cells in layout.rows
+        ]
+
+    @staticmethod
+    def get_seat_states(show_id, seat_state, since=None):
+        """
+        Get a show's seat states for the JSON seat map
+
+        Built from the cached layout and a seat_state_store snapshot, so no seat
+        query runs. With since, only seats changed after that version are listed,
+        unless the change history cannot bridge the gap.
+
+        Returns:
+            {'show_id', 'version', 'delta': False, 'seats': [{'seat_id', 'seat_no',
+            'row', 'column', 'ordinal', 'state'}]}, or with since
+            {'show_id', 'version', 'since', 'delta': True, 'changes': [{'seat_id',
+            'ordinal', 'state', 'version'}]}
+        """
+        if since is not None:
+            events = seat_events.since(show_id, since, seat_state.version) if since <= seat_state.version else None
+            if events is not None:
+                # Only each seat's latest change matters
+                latest = {}
+                for event in events:
+                    latest[event['ordinal']] = event
+                return {
+                    'show_id': show_id,
+                    'version': seat_state.version,
+                    'since': since,
+                    'delta': True,
+                    'changes': [
+                        {
+                            'seat_id': event['seat_id'],
+                            'ordinal': event['ordinal'],
+                            'state': event['state'],
+                            'version': event['version']
+                        }
+                        for event in sorted(latest.values(), key=lambda event: event['version'])
+                    ]
+                }
+
+        layout = seat_state_store.layout(show_id)
+        return {
+            'show_id': show_id,
+            'version': seat_state.version,
+            'delta': False,
+            'seats': [
+                {
+                    'seat_id': cell.seat_id,
+                    'seat_no': cell.seat_no,
+                    'row': cell.row,
+                    'column': cell.column,
+                    'ordinal': cell.ordinal,
+                    'state': 'booked' if seat_state.is_booked(cell.seat_id) else 'available'
+                }
+                for cell in layout.seats
+            ]
+        }
+
+    @staticmethod
+    def seat_event_stream(show_id, version):
+        """
+        Generate a Server-Sent Events stream of a show's seat changes after version
+
+        'seat' events carry one seat's {'version', 'ordinal', 'seat_id', 'state'};
+        a 'snapshot' event ({'version', 'booked': [ordinals]}) replaces the whole
+        map when the change history cannot bridge the gap. Event ids are versions,
+        so a reconnecting EventSource resumes through Last-Event-ID. The stream
+        ends after SEAT_STREAM_MAX_SECONDS and the client reconnects.
+        """
+        config = current_app.config
+        poll_seconds = config.get('SEAT_STREAM_POLL_SECONDS', 2)
+        keepalive_seconds = config.get('SEAT_STREAM_KEEPALIVE_SECONDS', 15)
+        deadline = time.monotonic() + config.get('SEAT_STREAM_MAX_SECONDS', 300)
+
+        yield 'retry: 3000\n\n'
+        sent_at = time.monotonic()
+
+        while time.monotonic() < deadline:
+            # Changes from other processes only show up in the shared counter
+            current = seat_state_store.current_version(show_id)
+            if current != version:
+                events = seat_events.since(show_id, version, current) if current > version else None
+                if events is None:
+                    snapshot = seat_state_store.snapshot(show_id)
+                    version = snapshot.version
+                    yield _sse('snapshot', version, {'version': version, 'booked': snapshot.booked_ordinals()})
+                else:
+                    for event in events:
+                        yield _sse('seat', event['version'], event)
+                    version = events[-1]['version']
+                sent_at = time.monotonic()
+            elif time.monotonic() - sent_at >= keepalive_seconds:
+                yield ': keepalive\n\n'
+                sent_at = time.monotonic()
+
+            # Do not hold a connection for the life of the stream
+            db.session.close()
+            seat_events.wait(show_id, version, poll_seconds)
+
+
+def _sse(event, event_id, data):
+    """Format one Server-Sent Event"""
+    return f'event: {event}\nid: {event_id}\ndata: {json.dumps(data)}\n\n'
@@ -0,0 +1,295 @@
+"""
+Seat state store - shared-memory seat availability bitmaps per show
+Each show's bitmap lives in an mmap-backed file so all worker processes on a host share it
+"""
+from app.models.show import Show
+from app.models.show_seat import ShowSeat
+from app.extensions import db
+from app.services.layout_cache import layout_cache
+from app.services.seat_events import seat_events
+from flask import current_app
+from sqlalchemy import func, select
+from collections import OrderedDict
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+
+# magic, layout checksum, seat count, change counter, last verified (epoch seconds)
+HEADER = struct.Struct('<4sIIQd')
+MAGIC = b'CSS1'
+
+
+class SeatStateView:
+    """Read-only copy of a show's seat bitmap (bit set = seat unavailable)"""
+
+    def __init__(self, ordinals, bits, version):
+        self._ordinals = ordinals
+        self._bits = bits
+        self.version = version
+
+    def ordinal(self, seat_id):
+        """Get the bitmap ordinal of a seat, or None if it is not in the show's auditorium"""
+        return self._ordinals.get(seat_id)
+
+    def is_booked(self, seat_id):
+        """Check whether a seat is booked or held"""
+        ordinal = self._ordinals.get(seat_id)
+        if ordinal is None:
+            return False
+        return bool(self._bits[ordinal >> 3] & (1 << (ordinal & 7)))
+
+    def booked_seat_ids(self):
+        """Get the IDs of all booked or held seats"""
+        return {seat_id for seat_id in self._ordinals if self.is_booked(seat_id)}
+
+    def booked_ordinals(self):
+        """Get the bitmap ordinals of all booked or held seats, in order"""
+        return sorted(ordinal for seat_id, ordinal in self._ordinals.items() if self.is_booked(seat_id))
+
+
+class SeatStateStore:
+    """
+    Per-show seat availability bitmaps shared across processes through mmap files
+
+    The header carries a change counter equal to SUM(show_seats.version) for the show.
+    Every seat state change increments one row's version, so comparing the counter
+    against the database detects any missed update and triggers a rebuild.
+    """
+
+    MAX_OPEN_MAPS = 256
+    MAX_SHOWS = 4096
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._maps = OrderedDict()
+        self._show_auditoriums = OrderedDict()
+
+    def snapshot(self, show_id):
+        """
+        Get the seat states of a show
+
+        Served from shared memory; the database is only consulted when the
+        bitmap has not been verified within SEAT_STATE_VERIFY_SECONDS.
+        """
+        layout = self._layout_for_show(show_id)
+        with self._lock:
+            verified_at = HEADER.unpack_from(self._open(show_id, layout).mm, 0)[4]
+
+        if time.time() - verified_at > current_app.config.get('SEAT_STATE_VERIFY_SECONDS', 5.0):
+            self._verify(show_id, layout)
+
+        with self._lock:
+            mm = self._open(show_id, layout).mm
+            version = HEADER.unpack_from(mm, 0)[3]
+            bits = mm[HEADER.size:]
+
+        return SeatStateView(layout.ordinals, bits, version)
+
+    def apply_change(self, show_id, seat_ids, booked):
+        """
+        Record a committed seat state change
+
+        Args:
+            show_id: ID of the show
+            seat_ids: Seats whose show_seats row was updated (one version bump each)
+            booked: True if the seats became unavailable, False if released
+
+        Each seat's change is published to seat_events with its own version.
+        """
+        layout = self._layout_for_show(show_id)
+        state = 'booked' if booked else 'available'
+        with self._lock:
+            mapped = self._open(show_id, layout)
+            mm = mapped.mm
+            with mapped.lock():
+                magic, checksum, count, version, verified_at = HEADER.unpack_from(mm, 0)
+
+                events = []
+                for position, seat_id in enumerate(seat_ids, start=1):
+                    ordinal = layout.ordinals.get(seat_id)
+                    if ordinal is None:
+                        continue
+                    offset = HEADER.size + (ordinal >> 3)
+                    if booked:
+                        mm[offset] |= 1 << (ordinal & 7)
+                    else:
+                        mm[offset] &= ~(1 << (ordinal & 7)) & 0xFF
+                    events.append({
+                        'version': version + position,
+                        'ordinal': ordinal,
+                        'seat_id': seat_id,
+                        'state': state
+                    })
+
+                HEADER.pack_into(mm, 0, magic, checksum, count, version + len(seat_ids), verified_at)
+
+            # Published under the store lock so events reach the bus in version order
+            seat_events.publish(show_id, events)
+
+    def layout(self, show_id):
+        """Get the seat layout of a show's auditorium (cached, no seat query)"""
+        return self._layout_for_show(show_id)
+
+    def current_version(self, show_id):
+        """Get a show's change counter from shared memory, without verifying it"""
+        layout = self._layout_for_show(show_id)
+        with self._lock:
+            return HEADER.unpack_from(self._open(show_id, layout).mm, 0)[3]
+
+    def invalidate(self, show_id):
+        """Force the next read of a show to verify against the database"""
+        layout = self._layout_for_show(show_id)
+        with self._lock:
+            mm = self._open(show_id, layout).mm
+            magic, checksum, count, version, _ = HEADER.unpack_from(mm, 0)
+            HEADER.pack_into(mm, 0, magic, checksum, count, version, 0.0)
+
+    def _verify(self, show_id, layout):
+        """Compare the change counter with the database and rebuild on mismatch"""
+        db_version = db.session.execute(
+            select(func.coalesce(func.sum(ShowSeat.version), 0))
+            .where(ShowSeat.show_id == show_id)
+        ).scalar()
+
+        with self._lock:
+            mapped = self._open(show_id, layout)
+            with mapped.lock():
+                magic, checksum, count, version, _ = HEADER.unpack_from(mapped.mm, 0)
+                if int(db_version) == version:
+                    HEADER.pack_into(mapped.mm, 0, magic, checksum, count, version, time.time())
+                    return
+
+        self._rebuild(show_id, layout)
+
+    def _rebuild(self, show_id, layout):
+        """Reload a show's bitmap from show_seats"""
+        rows = db.session.execute(
+            select(ShowSeat.seat_id, ShowSeat.is_available, ShowSeat.version)
+            .where(ShowSeat.show_id == show_id)
+        ).all()
+
+        bits = bytearray((len(layout.seat_ids) + 7) // 8)
+        version = 0
+        for seat_id, is_available, seat_version in rows:
+            version += seat_version
+            ordinal = layout.ordinals.get(seat_id)
+            if ordinal is not None and not is_available:
+                bits[ordinal >> 3] |= 1 << (ordinal & 7)
+
+        with self._lock:
+            mapped = self._open(show_id, layout)
+            with mapped.lock():
+                mapped.mm[HEADER.size:] = bytes(bits)
+                HEADER.pack_into(
+                    mapped.mm, 0, MAGIC, layout.checksum, len(layout.seat_ids), version, time.time()
+                )
+
+    def _open(self, show_id, layout):
+        """Get the mapped file for a show, creating or resetting it when its layout differs"""
+        mapped = self._maps.get(show_id)
+        if mapped is not None:
+            if mapped.checksum == layout.checksum:
+                self._maps.move_to_end(show_id)
+                return mapped
+            # The auditorium's seats changed; reopen with the new layout
+            del self._maps[show_id]
+            mapped.close()
+
+        directory = current_app.config['SEAT_STATE_DIR']
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, _file_name(show_id))
+        size = HEADER.size + (len(layout.seat_ids) + 7) // 8
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        mapped = _MappedFile(fd, None, layout.checksum)
+        with mapped.lock():
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+            mm = mapped.mm = mmap.mmap(fd, size)
+
+            magic, checksum, count, _, _ = HEADER.unpack_from(mm, 0)
+            if magic != MAGIC or checksum != layout.checksum or count != len(layout.seat_ids):
+                # Zeroed counter and timestamp force a rebuild on first read
+                mm[HEADER.size:] = bytes(size - HEADER.size)
+                HEADER.pack_into(mm, 0, MAGIC, layout.checksum, len(layout.seat_ids), 0, 0.0)
+
+        self._maps[show_id] = mapped
+        if len(self._maps) > self.MAX_OPEN_MAPS:
+            _, evicted = self._maps.popitem(last=False)
+            evicted.close()
+
+        return mapped
+
+    def _layout_for_show(self, show_id):
+        """
+        Get the seat layout (and so the seat ordinals) of a show's auditorium
+        Never writes: a show without show_seats rows yet reads as all seats free
+        until the import, backfill or booking path creates them
+        """
+        with self._lock:
+            auditorium_id = self._show_auditoriums.get(show_id)
+
+        if auditorium_id is None:
+            # Shows never move between auditoriums, so the mapping is cached per process
+            auditorium_id = db.session.execute(
+                select(Show.auditorium_id).where(Show.show_id == show_id)
+            ).scalar()
+            if auditorium_id is None:
+                raise ValueError(f"Show {show_id} not found")
+            with self._lock:
+                self._show_auditoriums[show_id] = auditorium_id
+                if len(self._show_auditoriums) > self.MAX_SHOWS:
+                    self._show_auditoriums.popitem(last=False)
+
+        return layout_cache.get(auditorium_id)
+
+
+class _MappedFile:
+    """An open bitmap file and its memory map"""
+
+    def __init__(self, fd, mm, checksum):
+        self.fd = fd
+        self.mm = mm
+        self.checksum = checksum
+
+    def lock(self):
+        """Exclusive cross-process lock on the file (no-op without fcntl)"""
+        return _FileLock(self.fd)
+
+    def close(self):
+        self.mm.close()
+        os.close(self.fd)
+
+
+class _FileLock:
+    def __init__(self, fd):
+        self._fd = fd
+
+    def __enter__(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return False
+
+
+def _file_name(show_id):
+    """Build a filesystem-safe file name for a show's bitmap"""
+    safe = re.sub(r'[^A-Za-z0-9_.-]', '_', str(show_id))[:64]
+    return f"{safe}-{zlib.crc32(str(show_id).encode()):08x}.seatmap"
+
+
+seat_state_store = SeatStateStore()
@@ -0,0 +1,151 @@
+"""
+Show calendar - per-event date -> (show count, min price) histograms
+
+Each event's calendar covers the next CALENDAR_MAX_DAYS days and is
+computed with one date-truncating GROUP BY, then kept in the shared cache.
+ORM changes to shows are applied once they commit. With the per-process
+memory cache, added shows are counted in cached calendars in place; with a
+shared cache (or for removals and edits that may change a day's minimum
+price) the event's calendar is dropped so the next read recomputes it.
+"""
+from app.models.show import Show
+from app.extensions import after_commit, db, cache
+from flask import current_app
+from sqlalchemy import Date, and_, cast, event, func, inspect
+from sqlalchemy.orm import object_session
+from datetime import date, datetime, timedelta
+import threading
+
+
+CALENDAR_WINDOWS = (7, 30, 90)
+
+
+class ShowCalendar:
+    """Cached per-event show calendars"""
+
+    def __init__(self):
+        # Serializes read-modify-write of cached calendars within this process
+        self._lock = threading.Lock()
+
+    def get(self, event_id, days=7):
+        """
+        Get the days with shows in the next days days (today included)
+
+        Returns:
+            List of {'date', 'show_count', 'min_price'} dicts in date order
+
+        Raises:
+            ValueError: If days exceeds CALENDAR_MAX_DAYS
+        """
+        max_days = current_app.config.get('CALENDAR_MAX_DAYS', max(CALENDAR_WINDOWS))
+        if days > max_days:
+            raise ValueError(f"Calendar window cannot exceed {max_days} days")
+
+        calendar = cache.get_or_set(
+            self._key(event_id), lambda: self._compute(event_id, max_days),
+            current_app.config.get('CALENDAR_TTL_SECONDS', 3600)
+        )
+
+        today = date.today()
+        if calendar['computed_on'] != today:
+            # The window moved on since this calendar was computed
+            self.invalidate(event_id)
+            return self.get(event_id, days)
+
+        last_day = today + timedelta(days=days)
+        return [
+            {'date': day, 'show_count': show_count, 'min_price': min_price}
+            for day, (show_count, min_price) in sorted(calendar['days'].items())
+            if today <= day <= last_day
+        ]
+
+    def add_show(self, event_id, show_datetime, price):
+        """Count a new committed show in the event's cached calendar (if cached)"""
+        if not cache.enabled:
+            return
+        if cache.shared:
+            # Other processes write the same entry; the lock below only covers this one
+            self.invalidate(event_id)
+            return
+
+        with self._lock:
+            calendar = cache.backend.get(self._key(event_id))
+            if not isinstance(calendar, dict):
+                # Nothing cached; still drop a calendar recomputed from a stale follower read
+                self.invalidate(event_id)
+                return
+
+            day = show_datetime.date()
+            if not calendar['computed_on'] <= day <= calendar['last_day']:
+                return
+
+            # Readers may be iterating the cached calendar: replace it, never mutate it
+            days = dict(calendar['days'])
+            show_count, min_price = days.get(day, (0, price))
+            days[day] = (show_count + 1, min(min_price, price))
+            cache.backend.set(
+                self._key(event_id), dict(calendar, days=days),
+                current_app.config.get('CALENDAR_TTL_SECONDS', 3600)
+            )
+
+    def invalidate(self, event_id):
+        cache.invalidate(self._key(event_id))
+
+    def _key(self, event_id):
+        return f'calendar:{event_id}'
+
+    def _compute(self, event_id, max_days):
+        """Build an event's calendar with one GROUP BY show date"""
+        today = date.today()
+        last_day = today + timedelta(days=max_days)
+
+        show_date = cast(Show.show_datetime, Date)
+        rows = db.session.query(
+            show_date, func.count(Show.show_id), func.min(Show.price)
+        ).filter(
+            and_(
+                Show.event_id == event_id,
+                Show.show_datetime >= datetime.combine(today, datetime.min.time()),
+                Show.show_datetime < datetime.combine(last_day + timedelta(days=1), datetime.min.time())
+            )
+        ).group_by(show_date).all()
+
+        return {
+            'computed_on': today,
+            'last_day': last_day,
+            'days': {day: (show_count, min_price) for day, show_count, min_price in rows}
+        }
+
+
+show_calendar = ShowCalendar()
+
+
+@event.listens_for(Show, 'after_insert')
+def _add_to_calendar(mapper, connection, show):
+    """Count a new show in its event's cached calendar once it commits"""
+    after_commit(object_session(show), show_calendar.add_show, show.event_id, show.show_datetime, show.price)
+
+
+@event.listens_for(Show, 'after_update')
+def _update_calendar(mapper, connection, show):
+    """Drop the calendars a changed show was or is now part of, once the change commits"""
+    state = inspect(show)
+    changed = {
+        attr.key: attr.history
+        for attr in state.attrs
+        if attr.key in ('event_id', 'show_datetime', 'price') and attr.history.has_changes()
+    }
+    if not changed:
+        return
+
+    session = object_session(show)
+    after_commit(session, show_calendar.invalidate, show.event_id)
+    if 'event_id' in changed:
+        for old_event_id in changed['event_id'].deleted:
+            after_commit(session, show_calendar.invalidate, old_event_id)
+
+
+@event.listens_for(Show, 'after_delete')
+def _remove_from_calendar(mapper, connection, show):
+    # A removed show may have been its day's cheapest, so recompute
+    after_commit(object_session(show), show_calendar.invalidate, show.event_id)
@@ -6,10 +6,14 @@ from app.models.event import Event
 from app.models.auditorium import Auditorium
 from app.models.theater import Theater
 from app.extensions import db
+from app.services.pagination import paginate
+from app.services.show_calendar import show_calendar
+from app.tracing import traced
 from datetime import datetime, timedelta
-from sqlalchemy import and_
+from sqlalchemy import and_, func
 
 
+@traced
 class ShowService:
     """Service for show/showtime operations"""
 
@@ -71,8 +75,13 @@ class ShowService:
         return query.order_by(Show.show_datetime).all()
 
     @staticmethod
-    def get_shows_with_details(event_id=None, theater_id=None, date=None):
-        """Get shows with event, theater, and auditorium details"""
+    def get_shows_with_details(event_id=None, theater_id=None, date=None, cursor=None, limit=None,
+                               theater_ids=None):
+        """
+        Get one page of shows with event, theater, and auditorium details, in time order
+        theater_ids limits the shows to those theaters (an empty list matches none)
+        Returns Page(items, next_cursor) with (show, event, theater, auditorium) items
+        """
         query = db.session.query(Show, Event, Theater, Auditorium).join(
             Event, Show.event_id == Event.event_id
         ).join(
@@ -85,6 +94,8 @@ class ShowService:
             query = query.filter(Show.event_id == event_id)
         if theater_id:
             query = query.filter(Theater.theater_id == theater_id)
+        if theater_ids is not None:
+            query = query.filter(Theater.theater_id.in_(theater_ids))
         if date:
             start = datetime.combine(date, datetime.min.time())
             end = datetime.combine(date, datetime.max.time())
@@ -92,24 +103,67 @@ class ShowService:
                 and_(Show.show_datetime >= start, Show.show_datetime <= end)
             )
 
-        return query.order_by(Show.show_datetime).all()
+        return paginate(
+            query, (Show.show_datetime, Show.show_id), cursor, limit,
+            key=lambda row: (row[0].show_datetime, row[0].show_id)
+        )
 
     @staticmethod
-    def get_available_dates_for_event(event_id, days_ahead=7):
-        """Get dates that have shows for an event"""
-        today = datetime.now().date()
-        end_date = today + timedelta(days=days_ahead)
+    def get_theaters_for_event(event_id, start=None, end=None, days_ahead=7):
+        """
+        Get the theaters showing an event, with showtime counts and next showtime
+
+        One joined aggregate query grouped by theater over the event's
+        upcoming shows. Dates with shows come from the calendar index
+        (get_show_calendar), not from this query.
+
+        Args:
+            event_id: ID of the event
+            start: Window start, defaults to now
+            end: Window end (exclusive), defaults to the end of the day days_ahead from today
+            days_ahead: Window length when end is not given
+
+        Returns:
+            List of {'theater', 'show_count', 'next_show'} dicts by next showtime
+        """
+        start = start or datetime.now()
+        end = end or datetime.combine(
+            datetime.now().date() + timedelta(days=days_ahead + 1), datetime.min.time()
+        )
 
-        shows = Show.query.filter(
+        rows = db.session.query(
+            Theater,
+            func.count(Show.show_id),
+            func.min(Show.show_datetime)
+        ).join(
+            Auditorium, Auditorium.theater_id == Theater.theater_id
+        ).join(
+            Show, Show.auditorium_id == Auditorium.auditorium_id
+        ).filter(
             and_(
                 Show.event_id == event_id,
-                Show.show_datetime >= today,
-                Show.show_datetime <= end_date
+                Show.show_datetime >= start,
+                Show.show_datetime < end
             )
+        ).group_by(
+            *Theater.__table__.columns
         ).all()
 
-        dates = set()
-        for show in shows:
-            dates.add(show.show_datetime.date())
+        theaters = [
+            {'theater': theater, 'show_count': show_count, 'next_show': next_show}
+            for theater, show_count, next_show in rows
+        ]
+        return sorted(theaters, key=lambda summary: (summary['next_show'], summary['theater'].name))
+
+    @staticmethod
+    def get_show_calendar(event_id, days=7):
+        """
+        Get an event's show calendar for the next days days (7, 30 or 90)
+        Returns a list of {'date', 'show_count', 'min_price'} from the cached calendar index
+        """
+        return show_calendar.get(event_id, days)
 
-        return sorted(list(dates))
+    @staticmethod
+    def get_available_dates_for_event(event_id, days_ahead=7):
+        """Get dates that have shows for an event (from the calendar index)"""
+        return [day['date'] for day in show_calendar.get(event_id, days_ahead)]
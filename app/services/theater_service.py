@@ -3,16 +3,26 @@ Theater service - business logic for theaters
 """
 from app.models.theater import Theater
 from app.models.auditorium import Auditorium
-from app.extensions import db
+from app.extensions import after_commit, db, cache
+from app.services.search_index import search_index
+from app.services.geo_index import bounding_box, geo_index, haversine_km
+from app.services.pagination import paginate
+from app.tracing import traced
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
 
 
+@traced
 class TheaterService:
     """Service for theater operations"""
 
     @staticmethod
-    def get_all_theaters():
-        """Get all theaters"""
-        return Theater.query.order_by(Theater.name).all()
+    def get_all_theaters(cursor=None, limit=None):
+        """
+        Get one page of theaters ordered by name
+        Returns Page(items, next_cursor)
+        """
+        return paginate(Theater.query, (Theater.name, Theater.theater_id), cursor, limit)
 
     @staticmethod
     def get_theater_by_id(theater_id):
@@ -20,17 +30,31 @@ class TheaterService:
         return Theater.query.get(theater_id)
 
     @staticmethod
-    def get_theaters_by_city(city):
-        """Get theaters in a specific city"""
-        return Theater.query.filter(Theater.city == city).order_by(Theater.name).all()
+    def get_theaters_by_city(city, cursor=None, limit=None):
+        """
+        Get one page of theaters in a specific city ordered by name
+        Returns Page(items, next_cursor)
+        """
+        return paginate(
+            Theater.query.filter(Theater.city == city),
+            (Theater.name, Theater.theater_id), cursor, limit
+        )
 
     @staticmethod
     def get_cities():
-        """Get unique cities"""
-        result = db.session.query(Theater.city).distinct().filter(
-            Theater.city.isnot(None)
-        ).order_by(Theater.city).all()
-        return [r[0] for r in result]
+        """Get unique cities (cached)"""
+        def load():
+            result = db.session.query(Theater.city).distinct().filter(
+                Theater.city.isnot(None)
+            ).order_by(Theater.city).all()
+            return [r[0] for r in result]
+
+        return cache.get_or_set('theaters:cities', load)
+
+    @staticmethod
+    def invalidate_cache():
+        """Drop cached theater data"""
+        cache.invalidate('theaters:')
 
     @staticmethod
     def get_theater_auditoriums(theater_id):
@@ -41,21 +65,105 @@ class TheaterService:
 
     @staticmethod
     def search_theaters(search_term):
-        """Search theaters by name or city"""
-        return Theater.query.filter(
-            db.or_(
-                Theater.name.ilike(f'%{search_term}%'),
-                Theater.city.ilike(f'%{search_term}%')
+        """
+        Search theaters by name or city, best matches first
+        Served from the in-memory search index; returns theater dicts (Theater.to_dict())
+        """
+        return search_index.search(search_term, kind='theater')
+
+    @staticmethod
+    def get_nearby_theaters(latitude, longitude, radius_km=10, limit=None):
+        """
+        Get theaters within radius_km of a location, nearest first
+
+        Served from the in-memory geo index; while the index is cold the
+        candidates come from a SQL bounding-box prefilter instead, and the
+        index is built in the background for later calls.
+
+        Returns:
+            List of (theater, distance_km) tuples
+        """
+        geo_index.warm_up()
+        if geo_index.is_warm():
+            matches = geo_index.within(latitude, longitude, radius_km)
+            if limit:
+                matches = matches[:limit]
+            return TheaterService._with_theaters(matches)
+
+        min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+        candidates = Theater.query.filter(
+            db.and_(
+                Theater.latitude.between(min_lat, max_lat),
+                Theater.longitude.between(min_lon, max_lon)
             )
-        ).order_by(Theater.name).all()
+        ).all()
+
+        nearby = []
+        for theater in candidates:
+            distance = haversine_km(latitude, longitude, theater.latitude, theater.longitude)
+            if distance <= radius_km:
+                nearby.append((theater, distance))
+        nearby.sort(key=lambda item: item[1])
+
+        return nearby[:limit] if limit else nearby
+
+    @staticmethod
+    def get_nearest_theaters(latitude, longitude, k=5, max_radius_km=None):
+        """
+        Get the k theaters nearest to a location
+
+        Returns:
+            List of (theater, distance_km) tuples, nearest first
+        """
+        geo_index.warm_up(wait=True)
+        return TheaterService._with_theaters(
+            geo_index.nearest(latitude, longitude, k, max_radius_km)
+        )
 
     @staticmethod
-    def get_nearby_theaters(latitude, longitude, radius_km=10):
+    def sort_by_distance(theaters, latitude, longitude):
         """
-        Get theaters near a location
-        Note: This requires PostGIS functions for proper implementation
-        For now, returns all theaters
+        Sort already-loaded theaters by distance from a location
+
+        Returns:
+            List of (theater, distance_km) tuples; theaters without
+            coordinates come last with distance None
         """
-        # TODO: Implement proper geography-based search
-        # Example SQL: ST_DWithin(geog, ST_MakePoint(lng, lat)::geography, radius_meters)
-        return Theater.query.all()
+        located = []
+        unlocated = []
+        for theater in theaters:
+            if theater.latitude is None or theater.longitude is None:
+                unlocated.append((theater, None))
+            else:
+                distance = haversine_km(latitude, longitude, theater.latitude, theater.longitude)
+                located.append((theater, distance))
+
+        located.sort(key=lambda item: item[1])
+        return located + unlocated
+
+    @staticmethod
+    def _with_theaters(matches):
+        """Load the theaters for [(distance_km, theater_id)] in one query, keeping the order"""
+        if not matches:
+            return []
+
+        theaters = {
+            theater.theater_id: theater
+            for theater in Theater.query.filter(
+                Theater.theater_id.in_([theater_id for _, theater_id in matches])
+            ).all()
+        }
+
+        return [
+            (theaters[theater_id], distance)
+            for distance, theater_id in matches
+            if theater_id in theaters
+        ]
+
+
+@event.listens_for(Theater, 'after_insert')
+@event.listens_for(Theater, 'after_update')
+@event.listens_for(Theater, 'after_delete')
+def _invalidate_theater_cache(mapper, connection, target):
+    """Invalidate cached theater data once an ORM change to a theater commits"""
+    after_commit(object_session(target), TheaterService.invalidate_cache)
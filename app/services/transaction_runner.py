@@ -0,0 +1,388 @@
+"""
+Transaction runner - retries CockroachDB transactions that hit serialization failures
+Implements the cockroach_restart savepoint protocol with exponential backoff and jitter
+"""
+from app.extensions import db
+from app.db_routing import is_disconnect_error, node_router
+from app.tracing import tracer
+from flask import current_app
+from sqlalchemy import event, text
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+from contextlib import contextmanager
+from contextvars import ContextVar
+import random
+import threading
+import time
+
+
+# SQLSTATE raised by CockroachDB for retryable transaction errors (RETRY_SERIALIZABLE etc.)
+RETRY_SQLSTATE = '40001'
+# SQLSTATE for a statement whose outcome is unknown (result is ambiguous)
+AMBIGUOUS_SQLSTATE = '40003'
+RESTART_SAVEPOINT = 'cockroach_restart'
+
+
+class TransactionRetryError(ValueError):
+    """Raised when a transaction exhausts its retry budget"""
+
+
+class TransactionStateError(RuntimeError):
+    """Raised when run_in_transaction() finds uncommitted changes on the session"""
+
+
+class AmbiguousCommitError(TransactionRetryError):
+    """
+    Raised when the connection failed after the commit was sent
+
+    The transaction may or may not have committed, so it is not retried.
+    result holds what work() returned in that attempt (e.g. the new booking's
+    ID), so the caller can check whether it committed.
+    """
+
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        self.result = result
+
+
+class TransactionStats:
+    """Thread-safe counters for transaction commits, retries and aborts"""
+
+    FIELDS = ('commits', 'retries', 'aborts', 'exhausted', 'ambiguous')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(self.FIELDS, 0)
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counts[name] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            self._counts = dict.fromkeys(self.FIELDS, 0)
+
+
+stats = TransactionStats()
+
+
+class CommitTimer:
+    """Time spent committing (RELEASE SAVEPOINT and COMMIT) by the transactions of a block"""
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.seconds = 0.0
+        self.commits = 0
+
+    def add(self, seconds, commits=1):
+        self.seconds += seconds
+        self.commits += commits
+        if self.parent is not None:
+            self.parent.add(seconds, commits)
+
+
+_commit_timer = ContextVar('commit_timer', default=None)
+
+
+@contextmanager
+def commit_timer():
+    """Measure the commits of the transactions run inside the block (nested blocks count in both)"""
+    timer = CommitTimer(_commit_timer.get())
+    token = _commit_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _commit_timer.reset(token)
+
+
+def current_commit_timer():
+    """The innermost commit_timer() of the current context, or None"""
+    return _commit_timer.get()
+
+
+def _record_commit(started):
+    timer = _commit_timer.get()
+    if timer is not None:
+        timer.add(time.perf_counter() - started)
+
+
+def is_retryable_error(exc):
+    """Check whether a database error asks the client to retry the transaction"""
+    if not isinstance(exc, DBAPIError):
+        return False
+
+    # A connection dropped before the commit was sent fails the transaction; the retry
+    # picks a healthy node (the runners treat a drop during the commit as ambiguous)
+    if is_disconnect_error(exc):
+        return True
+
+    orig = exc.orig
+    code = getattr(orig, 'pgcode', None) or getattr(orig, 'sqlstate', None)
+    if code == RETRY_SQLSTATE:
+        return True
+
+    # Some drivers surface the retry error without a SQLSTATE
+    return 'restart transaction' in str(orig).lower()
+
+
+def is_ambiguous_result(exc):
+    """Check whether an error raised while committing leaves the outcome unknown"""
+    if not isinstance(exc, DBAPIError):
+        return False
+    if is_disconnect_error(exc):
+        return True
+    orig = exc.orig
+    return (getattr(orig, 'pgcode', None) or getattr(orig, 'sqlstate', None)) == AMBIGUOUS_SQLSTATE
+
+
+def _ambiguous(exc, result):
+    """Count an ambiguous commit and build the error reporting it"""
+    stats.incr('ambiguous')
+    tracer.add_event('transaction.ambiguous', error=type(exc).__name__)
+    return AmbiguousCommitError(
+        "We could not confirm whether your request went through. "
+        "Please check your bookings before trying again.",
+        result
+    )
+
+
+def backoff_delay(attempt, base, cap):
+    """Exponential backoff with full jitter for the given retry attempt (1-based)"""
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+
+
+class RetryPolicy:
+    """Retry bookkeeping for one transaction: attempt count, time budget and backoff"""
+
+    def __init__(self, max_retries=None, budget_seconds=None, retry_on=()):
+        config = current_app.config
+        self.max_retries = config.get('TXN_MAX_RETRIES', 5) if max_retries is None else max_retries
+        if budget_seconds is None:
+            budget_seconds = config.get('TXN_RETRY_BUDGET_SECONDS', 2.0)
+        self.backoff_base = config.get('TXN_RETRY_BACKOFF_BASE', 0.02)
+        self.backoff_max = config.get('TXN_RETRY_BACKOFF_MAX', 0.5)
+        self.retry_on = retry_on
+        self.deadline = time.monotonic() + budget_seconds
+        self.attempt = 0
+
+    def should_retry(self, exc):
+        return is_retryable_error(exc) or isinstance(exc, self.retry_on)
+
+    def next_delay(self, exc):
+        """
+        Get the backoff before the next attempt
+
+        Raises:
+            TransactionRetryError: If the retry budget is exhausted
+        """
+        self.attempt += 1
+        delay = backoff_delay(self.attempt, self.backoff_base, self.backoff_max)
+
+        if self.attempt > self.max_retries or time.monotonic() + delay > self.deadline:
+            stats.incr('exhausted')
+            tracer.add_event('transaction.exhausted', attempt=self.attempt, error=type(exc).__name__)
+            raise TransactionRetryError(
+                "Request failed due to high concurrent traffic. Please try again."
+            ) from exc
+
+        stats.incr('retries')
+        tracer.add_event('transaction.retry', attempt=self.attempt, delay_seconds=delay, error=type(exc).__name__)
+        return delay
+
+
+@tracer.wrap('db.transaction')
+def run_in_transaction(work, max_retries=None, budget_seconds=None, retry_on=()):
+    """
+    Run work() inside a transaction on db.session and commit it
+
+    The transaction opens with SAVEPOINT cockroach_restart. On a retryable error
+    it rolls back to that savepoint (keeping the transaction's priority), waits
+    with exponential backoff and jitter, and calls work() again.
+
+    work() is called once per attempt, so it must rebuild any ORM objects it adds
+    rather than reuse objects from a previous attempt.
+
+    A connection failure while RELEASE SAVEPOINT / COMMIT is in flight is not
+    retried: the transaction may have committed, so AmbiguousCommitError is
+    raised with the attempt's result for the caller to check.
+
+    The session must not hold uncommitted changes: the transaction has to start
+    with the restart savepoint, and committing the caller's pending work here
+    would take it out of the caller's hands. A transaction that only read is
+    rolled back (which expires loaded objects, as a commit would).
+
+    Args:
+        work: Callable running the transaction's statements, without committing
+        max_retries: Maximum number of retries, defaults to TXN_MAX_RETRIES
+        budget_seconds: Total time allowed for retries, defaults to TXN_RETRY_BUDGET_SECONDS
+        retry_on: Extra exception types to treat as retryable
+
+    Returns:
+        The return value of work()
+
+    Raises:
+        TransactionRetryError: If the retry budget is exhausted
+        AmbiguousCommitError: If the commit's outcome is unknown
+        TransactionStateError: If the session has uncommitted changes
+    """
+    policy = RetryPolicy(max_retries, budget_seconds, retry_on)
+    session = db.session()
+
+    # The restart savepoint has to be the first statement of the transaction
+    end_read_transaction(session)
+
+    while True:
+        committing = False
+        result = None
+        try:
+            session.execute(text(f'SAVEPOINT {RESTART_SAVEPOINT}'))
+            result = work()
+            session.flush()
+            # RELEASE commits in CockroachDB; from here a lost connection leaves the outcome unknown
+            committing = True
+            commit_started = time.perf_counter()
+            session.execute(text(f'RELEASE SAVEPOINT {RESTART_SAVEPOINT}'))
+            session.commit()
+            _record_commit(commit_started)
+            stats.incr('commits')
+            return result
+
+        except Exception as e:
+            if committing and is_ambiguous_result(e):
+                session.rollback()
+                raise _ambiguous(e, result) from e
+            if not policy.should_retry(e):
+                _abort(session)
+                raise
+
+            try:
+                delay = policy.next_delay(e)
+            except TransactionRetryError:
+                _abort(session)
+                raise
+
+            _restart(session)
+            time.sleep(delay)
+
+
+def end_read_transaction(session):
+    """
+    End the session's transaction if it only read, returning its connection to the pool
+    Loaded objects are expired and reload on next access
+
+    Raises:
+        TransactionStateError: If the session has uncommitted changes
+    """
+    if not session.in_transaction():
+        return
+    if session.new or session.dirty or session.deleted or session.info.get('has_writes'):
+        raise TransactionStateError(
+            "The session has uncommitted changes; commit or roll back first"
+        )
+    session.rollback()
+
+
+@tracer.wrap('db.transaction')
+def run_on_connection(work, engine=None, max_retries=None, budget_seconds=None):
+    """
+    Run work(connection) in its own transaction on a pooled connection and commit it
+
+    Same savepoint protocol and retry policy as run_in_transaction(), but without the
+    ORM session, so it is safe to call from worker threads (inside an app context).
+    A dropped connection restarts the transaction on a new connection, from the
+    nearest healthy node unless engine is given; a connection lost while the commit
+    was in flight raises AmbiguousCommitError instead.
+    """
+    policy = RetryPolicy(max_retries, budget_seconds)
+
+    while True:
+        try:
+            return _run_attempts(work, engine or node_router.engine(), policy)
+        except DBAPIError as e:
+            if not is_disconnect_error(e):
+                raise
+            try:
+                delay = policy.next_delay(e)
+            except TransactionRetryError:
+                stats.incr('aborts')
+                raise
+            time.sleep(delay)
+
+
+def _run_attempts(work, engine, policy):
+    """run_on_connection() attempts on one connection, retrying at the restart savepoint"""
+    with engine.connect() as connection:
+        with connection.begin() as transaction:
+            while True:
+                committing = False
+                result = None
+                try:
+                    connection.execute(text(f'SAVEPOINT {RESTART_SAVEPOINT}'))
+                    result = work(connection)
+                    committing = True
+                    commit_started = time.perf_counter()
+                    connection.execute(text(f'RELEASE SAVEPOINT {RESTART_SAVEPOINT}'))
+                    transaction.commit()
+                    _record_commit(commit_started)
+                    stats.incr('commits')
+                    return result
+
+                except Exception as e:
+                    if committing and is_ambiguous_result(e):
+                        raise _ambiguous(e, result) from e
+                    if is_disconnect_error(e):
+                        # The savepoint went with the connection; run_on_connection reconnects
+                        raise
+                    if not policy.should_retry(e):
+                        stats.incr('aborts')
+                        raise
+
+                    try:
+                        delay = policy.next_delay(e)
+                    except TransactionRetryError:
+                        stats.incr('aborts')
+                        raise
+
+                    connection.execute(text(f'ROLLBACK TO SAVEPOINT {RESTART_SAVEPOINT}'))
+                    time.sleep(delay)
+
+
+def _restart(session):
+    """Roll back to the restart savepoint, or restart the whole transaction if the session cannot"""
+    # Objects added by the failed attempt must not be flushed by the next one
+    for obj in list(session.new):
+        session.expunge(obj)
+
+    try:
+        session.execute(text(f'ROLLBACK TO SAVEPOINT {RESTART_SAVEPOINT}'))
+        session.expire_all()
+    except SQLAlchemyError:
+        # A failed flush leaves the session unusable until a full rollback
+        session.rollback()
+
+
+def _abort(session):
+    """Roll back the transaction and count the abort"""
+    session.rollback()
+    stats.incr('aborts')
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _note_statement_write(orm_execute_state):
+    """Remember that the session's transaction wrote, for run_in_transaction()'s check"""
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['has_writes'] = True
+
+
+@event.listens_for(db.session, 'after_flush')
+def _note_flush_write(session, flush_context):
+    session.info['has_writes'] = True
+
+
+@event.listens_for(db.session, 'after_transaction_end')
+def _forget_writes(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('has_writes', None)
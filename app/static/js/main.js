@@ -68,13 +68,42 @@ function debounce(func, wait) {
     };
 }
 
-// Search functionality (if needed)
-const searchInput = document.querySelector('input[name="q"]');
+// Search type-ahead suggestions
+const searchInput = document.querySelector('input[name="q"][data-suggest-url]');
 if (searchInput) {
+    const suggestionList = document.getElementById(searchInput.getAttribute('list'));
+    let suggestionUrls = {};
+
     searchInput.addEventListener('input', debounce(function(e) {
-        // You can add live search suggestions here
-        console.log('Searching for:', e.target.value);
-    }, 300));
+        const query = e.target.value.trim();
+        if (query.length < 2) {
+            suggestionList.innerHTML = '';
+            return;
+        }
+
+        fetch(searchInput.dataset.suggestUrl + '?q=' + encodeURIComponent(query))
+            .then(response => response.json())
+            .then(suggestions => {
+                suggestionList.innerHTML = '';
+                suggestionUrls = {};
+                suggestions.forEach(function(suggestion) {
+                    const option = document.createElement('option');
+                    option.value = suggestion.title;
+                    option.label = suggestion.kind === 'event' ? 'Movie' : 'Theater';
+                    suggestionList.appendChild(option);
+                    suggestionUrls[suggestion.title] = suggestion.url;
+                });
+            })
+            .catch(() => {});
+    }, 150));
+
+    // Picking a suggestion goes straight to its page
+    searchInput.addEventListener('change', function(e) {
+        const url = suggestionUrls[e.target.value];
+        if (url) {
+            window.location.href = url;
+        }
+    });
 }
 
 // Seat map helper functions
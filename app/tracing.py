@@ -0,0 +1,442 @@
+"""
+Request tracing - lightweight spans from route to service to SQL
+
+A sampled request gets a root span for the view; inside it:
+  - service calls, for classes decorated with @traced (show_id, event_id,
+    customer_id and seat counts become span attributes)
+  - database transactions, with an event per serialization retry
+  - connection pool checkouts and every SQL statement
+  - template rendering
+
+Sampling happens once per request (TRACE_SAMPLE_RATE), or follows the
+sampled flag of an incoming W3C traceparent header. Requests that are not
+sampled create no spans, so tracing can stay on in production.
+
+Finished traces go to an exporter:
+  file - one OTLP/JSON document per trace, appended to TRACE_FILE
+  otlp - OTLP/HTTP JSON POSTs to TRACE_OTLP_ENDPOINT from a background
+         thread (any OTLP collector, or a local stub that accepts the POSTs)
+
+Other exporters can be added with Tracer.register_exporter(name, factory).
+"""
+from flask import before_render_template, current_app, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+import inspect
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+
+
+# OTLP span kinds and status codes
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+STATUS_UNSET = 0
+STATUS_ERROR = 2
+
+# Call arguments recorded as span attributes; lists are recorded as counts
+TRACED_ARGUMENTS = ('show_id', 'event_id', 'theater_id', 'customer_id', 'booking_id')
+COUNTED_ARGUMENTS = {'seat_ids': 'seat_count'}
+
+TRACEPARENT_PATTERN = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+MAX_STATEMENT_LENGTH = 500
+
+
+class Trace:
+    """The finished spans of one sampled request"""
+
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.spans = []
+        # Spans can end on other threads (the booking dispatcher's workers)
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def finished_spans(self):
+        """Get a snapshot of the spans ended so far"""
+        with self._lock:
+            return list(self.spans)
+
+
+class Span:
+    """One timed operation in a trace"""
+
+    __slots__ = (
+        'trace', 'span_id', 'parent', 'parent_id', 'name', 'kind',
+        'start_ns', 'end_ns', 'attributes', 'events', 'status'
+    )
+
+    def __init__(self, trace, name, parent=None, kind=KIND_INTERNAL, attributes=None, parent_id=None):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent = parent
+        self.parent_id = parent.span_id if parent is not None else parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.events = []
+        self.status = STATUS_UNSET
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def add_event(self, name, **attributes):
+        self.events.append((time.time_ns(), name, attributes))
+
+    def record_error(self, exc):
+        self.status = STATUS_ERROR
+        self.attributes['error.type'] = type(exc).__name__
+        self.attributes['error.message'] = str(exc)[:MAX_STATEMENT_LENGTH]
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self.trace.add(self)
+
+
+_current_span = ContextVar('current_span', default=None)
+_request_span = ContextVar('request_span', default=None)
+
+
+class FileExporter:
+    """Appends one OTLP/JSON document per trace to a file"""
+
+    def __init__(self, path, service_name):
+        self.path = path
+        self.service_name = service_name
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        line = json.dumps(to_otlp(spans, self.service_name), separators=(',', ':'))
+        with self._lock:
+            with open(self.path, 'a') as trace_file:
+                trace_file.write(line + '\n')
+
+
+class OTLPExporter:
+    """Posts traces as OTLP/HTTP JSON in batches from a background thread"""
+
+    MAX_QUEUED = 2048
+    BATCH_SIZE = 256
+
+    def __init__(self, endpoint, service_name, timeout=2.0, flush_seconds=2.0):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+        self.flush_seconds = flush_seconds
+        self._queue = queue.Queue(self.MAX_QUEUED)
+        self.dropped = 0
+        threading.Thread(target=self._run, name='trace-exporter', daemon=True).start()
+
+    def export(self, spans):
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            # Never slow requests down for tracing
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = list(self._queue.get())
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.extend(self._queue.get(timeout=self.flush_seconds))
+                except queue.Empty:
+                    break
+            self._post(batch)
+
+    def _post(self, spans):
+        body = json.dumps(to_otlp(spans, self.service_name)).encode()
+        post = urllib.request.Request(
+            self.endpoint, data=body, method='POST', headers={'Content-Type': 'application/json'}
+        )
+        try:
+            with urllib.request.urlopen(post, timeout=self.timeout) as response:
+                response.read()
+        except OSError:
+            self.dropped += len(spans)
+
+
+class Tracer:
+    """
+    Tracing extension
+
+    Usage:
+        tracer.init_app(app)
+
+        @traced
+        class ShowService: ...
+
+        with tracer.span('seat_map.render', show_id=show_id):
+            ...
+    """
+
+    _exporter_factories = {
+        'file': lambda app: FileExporter(app.config['TRACE_FILE'], app.config.get('TRACE_SERVICE_NAME', 'cinesync')),
+        'otlp': lambda app: OTLPExporter(
+            app.config['TRACE_OTLP_ENDPOINT'], app.config.get('TRACE_SERVICE_NAME', 'cinesync')
+        ),
+    }
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.exporter = None
+        self._engine_hooks = False
+
+    @classmethod
+    def register_exporter(cls, name, factory):
+        """Register an exporter factory(app) usable as TRACE_EXPORTER"""
+        cls._exporter_factories[name] = factory
+
+    def init_app(self, app):
+        """Install the request, template and SQL hooks if TRACING_ENABLED"""
+        if not app.config.get('TRACING_ENABLED', False):
+            return
+
+        exporter_name = app.config.get('TRACE_EXPORTER', 'file')
+        factory = self._exporter_factories.get(exporter_name)
+        if factory is None:
+            raise ValueError(f"Unknown TRACE_EXPORTER {exporter_name!r}")
+
+        self.exporter = factory(app)
+        self.sample_rate = app.config.get('TRACE_SAMPLE_RATE', 0.05)
+        self.enabled = True
+
+        app.before_request(self._start_request)
+        app.teardown_request(self._end_request)
+        before_render_template.connect(self._start_render, app)
+        template_rendered.connect(self._end_render, app)
+        app.extensions['tracing'] = self
+
+        if not self._engine_hooks:
+            event.listen(Engine, 'before_cursor_execute', _start_statement)
+            event.listen(Engine, 'after_cursor_execute', _end_statement)
+            event.listen(Engine, 'handle_error', _fail_statement)
+            self._engine_hooks = True
+
+    def current_span(self):
+        return _current_span.get()
+
+    @contextmanager
+    def span(self, name, parent=None, kind=KIND_INTERNAL, **attributes):
+        """
+        Time a block as a child of parent (default: the current span)
+        Yields None, and records nothing, outside a sampled trace
+        """
+        parent = parent or _current_span.get()
+        if parent is None:
+            yield None
+            return
+
+        span = Span(parent.trace, name, parent, kind, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def add_event(self, name, **attributes):
+        """Add an event to the current span, if any"""
+        span = _current_span.get()
+        if span is not None:
+            span.add_event(name, **attributes)
+
+    def wrap(self, name):
+        """Function decorator: run each call in a span named name"""
+        def decorator(func):
+            return _traced_function(name, func)
+        return decorator
+
+    def _start_request(self):
+        trace_id, parent_id, sampled = None, None, None
+        match = TRACEPARENT_PATTERN.match(request.headers.get('traceparent', ''))
+        if match:
+            trace_id, parent_id = match.group(1), match.group(2)
+            sampled = bool(int(match.group(3), 16) & 1)
+
+        if sampled is None:
+            sampled = random.random() < self.sample_rate
+        if not sampled:
+            return
+
+        span = Span(
+            Trace(trace_id), f'{request.method} {request.endpoint or "unmatched"}',
+            kind=KIND_SERVER, attributes={'http.method': request.method, 'http.target': request.path},
+            parent_id=parent_id
+        )
+        for argument in TRACED_ARGUMENTS:
+            value = request.values.get(argument) or (request.view_args or {}).get(argument)
+            if value:
+                span.attributes[argument] = value
+        if 'seat_ids' in request.values:
+            span.attributes['seat_count'] = len(request.values.getlist('seat_ids'))
+
+        _request_span.set(span)
+        _current_span.set(span)
+
+    def _end_request(self, exc):
+        span = _request_span.get()
+        if span is None:
+            return
+        _request_span.set(None)
+        _current_span.set(None)
+
+        if exc is not None:
+            span.record_error(exc)
+        span.end()
+
+        try:
+            self.exporter.export(span.trace.finished_spans())
+        except Exception:
+            current_app.logger.exception("Failed to export trace %s", span.trace.trace_id)
+
+    def _start_render(self, app, template, context, **extra):
+        span = _current_span.get()
+        if span is None:
+            return
+        _current_span.set(Span(span.trace, 'render_template', span, attributes={'template': template.name}))
+
+    def _end_render(self, app, template, context, **extra):
+        span = _current_span.get()
+        if span is None or span.name != 'render_template':
+            return
+        span.end()
+        _current_span.set(span.parent)
+
+
+tracer = Tracer()
+
+
+def traced(cls):
+    """Class decorator: run every public method of a service class in a span"""
+    for name, member in list(vars(cls).items()):
+        if name.startswith('_'):
+            continue
+        span_name = f'{cls.__name__}.{name}'
+        if isinstance(member, staticmethod):
+            setattr(cls, name, staticmethod(_traced_function(span_name, member.__func__)))
+        elif isinstance(member, classmethod):
+            setattr(cls, name, classmethod(_traced_function(span_name, member.__func__)))
+        elif inspect.isfunction(member):
+            setattr(cls, name, _traced_function(span_name, member))
+    return cls
+
+
+def _traced_function(name, func):
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _current_span.get() is None:
+            return func(*args, **kwargs)
+        with tracer.span(name, **_call_attributes(signature, args, kwargs)):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _call_attributes(signature, args, kwargs):
+    try:
+        arguments = signature.bind_partial(*args, **kwargs).arguments
+    except TypeError:
+        return {}
+
+    attributes = {key: str(arguments[key]) for key in TRACED_ARGUMENTS if arguments.get(key) is not None}
+    for key, attribute in COUNTED_ARGUMENTS.items():
+        if arguments.get(key) is not None:
+            attributes[attribute] = len(arguments[key])
+    return attributes
+
+
+def _start_statement(connection, cursor, statement, parameters, context, executemany):
+    parent = _current_span.get()
+    if parent is None or context is None:
+        return
+    context._trace_span = Span(parent.trace, 'db.query', parent, KIND_CLIENT, {
+        'db.system': connection.dialect.name,
+        'db.operation': statement.lstrip().split(None, 1)[0].upper() if statement.strip() else '',
+        'db.statement': ' '.join(statement.split())[:MAX_STATEMENT_LENGTH]
+    })
+
+
+def _end_statement(connection, cursor, statement, parameters, context, executemany):
+    span = getattr(context, '_trace_span', None)
+    if span is not None:
+        if cursor.rowcount is not None and cursor.rowcount >= 0:
+            span.attributes['db.rows'] = cursor.rowcount
+        span.end()
+
+
+def _fail_statement(exception_context):
+    span = getattr(exception_context.execution_context, '_trace_span', None)
+    if span is not None:
+        span.record_error(exception_context.original_exception)
+        span.end()
+
+
+def to_otlp(spans, service_name):
+    """Encode spans as an OTLP/JSON ExportTraceServiceRequest"""
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': _otlp_attributes({'service.name': service_name})},
+            'scopeSpans': [{
+                'scope': {'name': 'app.tracing'},
+                'spans': [
+                    {
+                        'traceId': span.trace.trace_id,
+                        'spanId': span.span_id,
+                        'parentSpanId': span.parent_id or '',
+                        'name': span.name,
+                        'kind': span.kind,
+                        'startTimeUnixNano': str(span.start_ns),
+                        'endTimeUnixNano': str(span.end_ns or span.start_ns),
+                        'attributes': _otlp_attributes(span.attributes),
+                        'events': [
+                            {
+                                'timeUnixNano': str(event_ns),
+                                'name': name,
+                                'attributes': _otlp_attributes(attributes)
+                            }
+                            for event_ns, name, attributes in span.events
+                        ],
+                        'status': {'code': span.status}
+                    }
+                    for span in spans
+                ]
+            }]
+        }]
+    }
+
+
+def _otlp_attributes(attributes):
+    encoded = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            typed = {'boolValue': value}
+        elif isinstance(value, int):
+            typed = {'intValue': str(value)}
+        elif isinstance(value, float):
+            typed = {'doubleValue': value}
+        else:
+            typed = {'stringValue': str(value)}
+        encoded.append({'key': key, 'value': typed})
+    return encoded
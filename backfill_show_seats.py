@@ -0,0 +1,35 @@
+"""
+One-off backfill of show_seats for an existing database
+
+Creates the missing show_seats rows of every show (seats already sold in
+bookings/booking_seats are created as booked) and marks existing rows
+booked where booking_seats sells the seat. Safe to run again; run it
+once before deploying the show_seats-based booking and seat map paths.
+"""
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+from app import create_app
+from app.extensions import db
+from app.models import Show
+from app.services.schedule_import_service import ScheduleImportService
+
+
+def run_backfill():
+    app = create_app(os.environ.get('FLASK_CONFIG', 'production'))
+
+    with app.app_context():
+        schedule = db.session.query(Show.show_id, Show.auditorium_id).all()
+        db.session.rollback()
+
+        print(f"Materializing show_seats for {len(schedule)} shows...")
+        result = ScheduleImportService.import_show_seats(schedule)
+        print(f"  Rows inserted: {result['inserted']} ({result['chunks']} chunks)")
+
+        repaired = ScheduleImportService.reconcile_booked_seats()
+        print(f"  Rows marked booked from booking_seats: {repaired}")
+
+
+if __name__ == '__main__':
+    run_backfill()
@@ -0,0 +1,65 @@
+"""
+Create the secondary indexes the application's queries rely on
+
+The models declare these indexes, but the application does not run
+migrations, so existing databases need them created once. Every statement
+uses IF NOT EXISTS, so the script is safe to run again.
+"""
+import os
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+
+load_dotenv()
+
+INDEXES = [
+    # Held seats (locked, no booking yet) ordered by lock time, for hold expiry
+    ("ix_show_seats_held_locked_at", """
+        CREATE INDEX IF NOT EXISTS ix_show_seats_held_locked_at
+        ON show_seats (locked_at)
+        WHERE is_available = false AND booking_id IS NULL
+    """),
+    # Booking history pages: a customer's bookings newest first
+    ("ix_bookings_customer_booked_at", """
+        CREATE INDEX IF NOT EXISTS ix_bookings_customer_booked_at
+        ON bookings (customer_id, booked_at DESC, booking_id DESC)
+    """),
+    # Seats of a page of bookings, loaded in one query
+    ("ix_booking_seats_booking_id", """
+        CREATE INDEX IF NOT EXISTS ix_booking_seats_booking_id
+        ON booking_seats (booking_id)
+    """),
+    # Listing pages: events by name
+    ("ix_events_name", """
+        CREATE INDEX IF NOT EXISTS ix_events_name
+        ON events (event_name, event_id)
+    """),
+    # Showtime pages: an event's or an auditorium's shows in time order
+    ("ix_shows_event_datetime", """
+        CREATE INDEX IF NOT EXISTS ix_shows_event_datetime
+        ON shows (event_id, show_datetime, show_id)
+    """),
+    ("ix_shows_auditorium_datetime", """
+        CREATE INDEX IF NOT EXISTS ix_shows_auditorium_datetime
+        ON shows (auditorium_id, show_datetime, show_id)
+    """),
+    # Listing pages: theaters by name, overall and per city
+    ("ix_theaters_name", """
+        CREATE INDEX IF NOT EXISTS ix_theaters_name
+        ON theaters (name, theater_id)
+    """),
+    ("ix_theaters_city_name", """
+        CREATE INDEX IF NOT EXISTS ix_theaters_city_name
+        ON theaters (city, name, theater_id)
+    """),
+]
+
+database_url = os.getenv('DATABASE_URL')
+engine = create_engine(database_url, pool_pre_ping=True)
+
+# Schema changes run one per implicit transaction
+with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+    for name, ddl in INDEXES:
+        print(f"Creating {name}...")
+        conn.execute(text(ddl))
+
+print(f"Done: {len(INDEXES)} indexes")
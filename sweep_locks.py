@@ -0,0 +1,23 @@
+"""
+Lock sweeper entry point
+
+Releases expired seat holds every LOCK_SWEEP_INTERVAL_SECONDS. Run a single
+instance next to the web workers, which do not sweep by default.
+"""
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+from app import create_app
+from app.services.lock_sweeper import lock_sweeper
+
+app = create_app(os.environ.get('FLASK_CONFIG', 'production'))
+
+if __name__ == '__main__':
+    app.logger.info("Lock sweeper started")
+    try:
+        lock_sweeper.run(app)
+    except KeyboardInterrupt:
+        lock_sweeper.stop()
@@ -10,6 +10,7 @@ from app import create_app
 from app.extensions import db
 from app.models import Show, ShowSeat, Booking, Customer
 from app.services.concurrent_booking_service import ConcurrentBookingService
+from app.services.contention_stats import contention_stats
 import threading
 import time
 from datetime import datetime
@@ -228,6 +229,22 @@ def run_concurrency_test():
                 print(f"\n✗ FAILURE: Concurrency control issue detected!")
                 print(f"  - Multiple bookings may have succeeded")
 
+        # Contention recorded by the booking engine
+        print(f"\n" + "-"*80)
+        print("Booking Contention:")
+        print("-"*80)
+
+        for show_stats in contention_stats.report()['shows']:
+            if show_stats['show_id'] != show.show_id:
+                continue
+            print(f"\n  Attempts: {show_stats['attempts']} (retries: {show_stats['retries']})")
+            print(f"  Bookings: {show_stats['bookings']}, rejected: {show_stats['rejections']}, failed: {show_stats['failures']}")
+            print(f"  Lock wait: {show_stats['lock_wait_seconds_total']:.3f}s total, {show_stats['lock_wait_seconds_max']:.3f}s max")
+            print(f"  Commit latency: {show_stats['commit_latency_seconds_mean']:.3f}s mean, {show_stats['commit_latency_seconds_max']:.3f}s max")
+            for block in show_stats['blocks']:
+                print(f"  Seat block {block['block']} (ordinals {block['ordinals'][0]}-{block['ordinals'][1]}): "
+                      f"{block['attempts']} attempts, {block['retries']} retries, {block['rejections']} rejected")
+
         print("\n" + "="*80)
 
 
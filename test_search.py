@@ -0,0 +1,62 @@
+"""
+Search Test for CineSync
+Checks that event titles in any script can be found by search and type-ahead
+"""
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+from app import create_app
+from app.services.search_index import normalize, search_index
+import uuid
+
+# (title, query) pairs; each query must find its title
+TITLES = [
+    ('東京物語', '東京物語'),
+    ('東京物語', '東京'),
+    ('Пушпа 2', 'пушпа'),
+    ('Amélie', 'amelie'),
+]
+
+
+def run_search_test():
+    """
+    Run the search test
+    """
+    app = create_app()
+
+    with app.app_context():
+        print("="*80)
+        print("CINESYNC SEARCH TEST")
+        print("="*80)
+
+        # Load the index, then add the test titles the way a committed event would be
+        search_index.search('warm up')
+        doc_ids = {}
+        for title, _ in TITLES:
+            if title not in doc_ids:
+                doc_ids[title] = str(uuid.uuid4())
+                search_index.add(
+                    'event', doc_ids[title], title, [(title, 1.0)],
+                    {'event_id': doc_ids[title], 'event_name': title, 'kind': 'event'}
+                )
+
+        failures = 0
+        try:
+            for title, query in TITLES:
+                found = [item['event_name'] for item in search_index.search(query, kind='event')]
+                suggested = [item['event_name'] for item in search_index.suggest(query)]
+                ok = title in found and title in suggested
+                failures += not ok
+                print(f"  {'OK  ' if ok else 'FAIL'} {query!r} -> {title!r} (normalized {normalize(query)!r})")
+        finally:
+            for doc_id in doc_ids.values():
+                search_index.remove('event', doc_id)
+
+        print("\n" + "="*80)
+        print("All titles found" if not failures else f"{failures} searches failed")
+        return failures == 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(0 if run_search_test() else 1)